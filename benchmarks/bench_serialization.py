@@ -0,0 +1,91 @@
+"""
+Compares the two ways contact list endpoints render a page: ORM objects validated into ContactResponse models and
+encoded by jsonable_encoder, against plain rows of RESPONSE_COLUMNS dumped by orjson (settings.contacts_fast_json).
+Both paths include the query. Also prints the size and cost of compressing the page.
+
+Run from the project root with the application's environment, e.g.:
+    python -m benchmarks.bench_serialization --rows 1000 --repeat 50
+"""
+import argparse
+import json
+import statistics
+import time
+import zlib
+from datetime import date, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import RESPONSE_COLUMNS
+from src.schemas import ContactResponse
+from src.services.compression import brotli
+from src.services.contacts_io import dump_response_rows
+
+
+def seed(session: Session, rows: int) -> None:
+    user = User(username='bench', email='bench@example.com', password='x', confirmed=True)
+    session.add(user)
+    session.flush()
+    session.execute(insert(Contact), [
+        {"name": f"Name{i}", "surname": f"Surname{i}", "email": f"contact{i}@example.com",
+         "phone_number": f"555{i:07d}", "birthday": date(1970, 1, 1) + timedelta(days=i % 18000),
+         "description": "Lorem ipsum dolor sit amet", "user_id": user.id}
+        for i in range(rows)
+    ])
+    session.commit()
+
+
+def orm_path(session: Session, rows: int) -> bytes:
+    contacts = session.execute(select(Contact).order_by(Contact.id).limit(rows)).scalars().all()
+    body = JSONResponse(jsonable_encoder([ContactResponse.from_orm(contact) for contact in contacts])).body
+    session.expunge_all()
+    return body
+
+
+def fast_path(session: Session, rows: int) -> bytes:
+    return dump_response_rows(session.execute(select(*RESPONSE_COLUMNS).order_by(Contact.id).limit(rows)).all())
+
+
+def measure(fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<24} median {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000, help='contacts per page')
+    parser.add_argument('--repeat', type=int, default=50, help='measured iterations per path')
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed(session, args.rows)
+        orm_body, fast_body = orm_path(session, args.rows), fast_path(session, args.rows)
+        assert json.loads(orm_body) == json.loads(fast_body), "the fast path must produce the same document"
+
+        print(f"{args.rows} rows, {len(fast_body)} bytes of JSON")
+        report("ORM + pydantic", measure(lambda: orm_path(session, args.rows), args.repeat))
+        report("rows + orjson", measure(lambda: fast_path(session, args.rows), args.repeat))
+        report("gzip -6", measure(lambda: zlib.compress(fast_body, 6), args.repeat))
+        print(f"{'':<24} {len(zlib.compress(fast_body, 6))} bytes")
+        if brotli is not None:
+            report("brotli q4", measure(lambda: brotli.compress(fast_body, quality=4), args.repeat))
+            print(f"{'':<24} {len(brotli.compress(fast_body, quality=4))} bytes")
+
+
+if __name__ == '__main__':
+    main()
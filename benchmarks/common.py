@@ -0,0 +1,31 @@
+"""
+Environment helpers shared by the benchmark entry points.
+
+Settings are read from the environment when the first setting is used, e.g. when the application is built,
+and kept from then on, so configure() must run before anything from src or main is used.
+"""
+import os
+
+
+def configure(database_url: str | None = None, rate_limit: bool = False) -> None:
+    """
+    Overrides the application settings a benchmark depends on.
+    :param database_url: The database to run against, defaults to the application's SQLALCHEMY_DATABASE_URL
+    :param rate_limit: Keep the rate limits on; they would otherwise reject most benchmark requests
+    """
+    if database_url:
+        os.environ['SQLALCHEMY_DATABASE_URL'] = database_url
+    if not rate_limit:
+        os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+
+def use_fake_redis() -> None:
+    """
+    Points the shared Redis client at an in-process fakeredis server, so no Redis server is needed.
+    Every component holds the same client, so swapping its connection pool redirects all of them.
+    """
+    from fakeredis import aioredis
+
+    from src.services.cache import get_redis_client
+
+    get_redis_client().connection_pool = aioredis.FakeRedis().connection_pool
@@ -0,0 +1,111 @@
+"""
+Import-time report of the application, the bulk of a worker's cold start.
+
+Imports a module in a fresh interpreter with python -X importtime, parses the timings it writes to stderr and prints
+the total, the slowest modules by cumulative and by self time, and the self time summed per top-level package.
+Services imported on first use (fastapi_mail, aiosmtplib, cloudinary) should not show up here.
+
+Run from the project root with the application's environment, e.g.:
+    python -m benchmarks.importtime --budget-ms 1500
+    python -m benchmarks.importtime --module main --statement 'main.create_app()' --top 30
+"""
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+
+
+@dataclass
+class ImportTiming:
+    """
+    One line of python -X importtime output; times are in microseconds.
+    """
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.module.split('.')[0]
+
+
+def parse(output: str) -> list[ImportTiming]:
+    """
+    Parses the stderr of python -X importtime, skipping the header and any other output.
+    """
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        timings.append(ImportTiming(module, int(fields[0]), int(fields[1]), (len(name) - len(module) - 1) // 2))
+    return timings
+
+
+def measure(module: str = 'main', statement: str = '', env: dict | None = None) -> list[ImportTiming]:
+    """
+    Imports module, then runs statement, in a new interpreter and returns its import timings.
+    Modules already imported by the interpreter's own startup are not included.
+    """
+    code = f'import {module}\n{statement}'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            env=env if env is not None else os.environ.copy())
+    if result.returncode != 0:
+        raise RuntimeError(f'importing {module} failed:\n{result.stderr[-2000:]}')
+    return parse(result.stderr)
+
+
+def total_us(timings: list[ImportTiming]) -> int:
+    """
+    The time spent importing, the cumulative time of the top-level imports.
+    """
+    return sum(timing.cumulative_us for timing in timings if timing.depth == 0)
+
+
+def by_package(timings: list[ImportTiming]) -> dict[str, int]:
+    """
+    Self time summed per top-level package, slowest first.
+    """
+    packages = {}
+    for timing in timings:
+        packages[timing.package] = packages.get(timing.package, 0) + timing.self_us
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def report(timings: list[ImportTiming], top: int) -> str:
+    lines = [f'{len(timings)} modules imported in {total_us(timings) / 1000:.1f} ms', '', 'By cumulative time:']
+    for timing in sorted(timings, key=lambda timing: timing.cumulative_us, reverse=True)[:top]:
+        lines.append(f'  {timing.cumulative_us / 1000:>9.1f} ms  {timing.module}')
+    lines += ['', 'By self time:']
+    for timing in sorted(timings, key=lambda timing: timing.self_us, reverse=True)[:top]:
+        lines.append(f'  {timing.self_us / 1000:>9.1f} ms  {timing.module}')
+    lines += ['', 'By package:']
+    for package, self_us in list(by_package(timings).items())[:top]:
+        lines.append(f'  {self_us / 1000:>9.1f} ms  {package}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main', help='the module to import')
+    parser.add_argument('--statement', default='', help='python run after the import, e.g. main.create_app()')
+    parser.add_argument('--top', type=int, default=20, help='modules and packages listed per table')
+    parser.add_argument('--budget-ms', type=float, help='exit with 1 when importing takes longer')
+    args = parser.parse_args()
+
+    timings = measure(args.module, args.statement)
+    print(report(timings, args.top))
+    elapsed_ms = total_us(timings) / 1000
+    if args.budget_ms is not None and elapsed_ms > args.budget_ms:
+        print(f'\nOVER BUDGET: {elapsed_ms:.1f} ms > {args.budget_ms:.1f} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+End-to-end load benchmark of the contacts API.
+
+Runs scripted scenarios at a fixed concurrency and reports p50/p95/p99 latency and requests per second:
+    login     POST /api/auth/login, bcrypt bound
+    list      GET /api/contacts/, each user following X-Next-Cursor through their address book
+    search    GET /api/contacts/find/{info}
+    birthday  GET /api/contacts/birthday/7
+    import    POST /api/contacts/import, 100 NDJSON rows per request
+
+By default main.app is driven in-process through httpx.AsyncClient; --mode uvicorn runs the same scenarios over HTTP
+against a uvicorn process (started with benchmarks.serve unless --url is given). Redis is faked in-process unless
+--redis is passed, and rate limits are turned off unless --rate-limit is passed. Benchmark users and contacts are
+seeded with benchmarks.seed in the configured database on the first run and reused afterwards, so use a dedicated
+database.
+
+With DATABASE_ASYNC off, request handlers check connections out of the pool on the event loop thread. In-process,
+a concurrency above DB_POOL_SIZE + DB_MAX_OVERFLOW then stalls every request for DB_POOL_TIMEOUT, so raise the pool
+size with the concurrency or benchmark with DATABASE_ASYNC=true.
+
+Run from the project root with the application's environment, e.g.:
+    python -m benchmarks.load --database-url sqlite:///./bench.db --save benchmarks/baseline.json
+    python -m benchmarks.load --database-url sqlite:///./bench.db --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+from benchmarks.common import configure, use_fake_redis
+from benchmarks.seed import DISTRIBUTIONS, contact_rows, seed
+
+PASSWORD = 'benchmark-password'
+SEARCH_TERMS = ('ann', 'smith', 'example', '380', 'olek', 'kov')
+IMPORT_ROWS = 100
+IMPORT_FIELDS = ('name', 'surname', 'email', 'phone_number', 'birthday', 'description')
+
+
+@dataclass
+class Context:
+    """
+    The benchmark users and the per-user state scenarios carry between requests.
+    """
+    users: list[dict]
+    tokens: list[str]
+    run_id: str = field(default_factory=lambda: str(time.time_ns()))
+    cursors: dict[int, str | None] = field(default_factory=dict)
+
+    def user(self, i: int) -> int:
+        return i % len(self.users)
+
+    def auth(self, i: int) -> dict:
+        return {'Authorization': f'Bearer {self.tokens[self.user(i)]}'}
+
+
+async def login(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    user = ctx.users[ctx.user(i)]
+    return await client.post('/api/auth/login', data={'username': user['email'], 'password': PASSWORD})
+
+
+async def list_contacts(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    user = ctx.user(i)
+    params = {'limit': 50}
+    if ctx.cursors.get(user):
+        params['after'] = ctx.cursors[user]
+    response = await client.get('/api/contacts/', params=params, headers=ctx.auth(i))
+    ctx.cursors[user] = response.headers.get('X-Next-Cursor')
+    return response
+
+
+async def search(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    return await client.get(f'/api/contacts/find/{SEARCH_TERMS[i % len(SEARCH_TERMS)]}', headers=ctx.auth(i))
+
+
+async def birthdays(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    return await client.get('/api/contacts/birthday/7', headers=ctx.auth(i))
+
+
+async def import_contacts(client: httpx.AsyncClient, ctx: Context, i: int) -> httpx.Response:
+    rows = contact_rows(0, f'import{ctx.run_id}-{i}', IMPORT_ROWS, random.Random(i))
+    body = '\n'.join(json.dumps({field: str(row[field]) for field in IMPORT_FIELDS}) for row in rows)
+    return await client.post('/api/contacts/import', content=body.encode(),
+                             headers={**ctx.auth(i), 'Content-Type': 'application/x-ndjson'})
+
+
+SCENARIOS = {
+    'login': login,
+    'list': list_contacts,
+    'search': search,
+    'birthday': birthdays,
+    'import': import_contacts,
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, scenario, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            started = time.perf_counter()
+            try:
+                failed = (await scenario(client, ctx, i)).status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+async def prepare(users: int, contacts: int, distribution: str) -> Context:
+    """
+    Creates the schema and seeds the benchmark users with benchmarks.seed unless they exist, and signs them in.
+    """
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import Session
+
+    from src.database.db import engine
+    from src.database.models import Base, User
+    from src.services.auth import auth_service
+
+    Base.metadata.create_all(engine)
+    emails = [f'bench{n}@example.com' for n in range(users)]
+    with Session(engine) as session:
+        existing = session.scalar(select(func.count()).select_from(User).where(User.email.in_(emails)))
+        if existing == 0:
+            seed(engine, users, users * contacts, distribution, prefix='bench', password=PASSWORD)
+        elif existing != users:
+            raise SystemExit(f"{existing} of {users} benchmark users exist, use another database or --users")
+        records = session.scalars(select(User).where(User.email.in_(emails)).order_by(User.id)).all()
+        tokens = [await auth_service.create_access_token(data=await auth_service.access_token_claims(user))
+                  for user in records]
+        return Context(users=[{'id': user.id, 'email': user.email} for user in records], tokens=tokens)
+
+
+def start_server(args) -> tuple[subprocess.Popen, str]:
+    command = [sys.executable, '-m', 'benchmarks.serve', '--port', str(args.port)]
+    if args.database_url:
+        command += ['--database-url', args.database_url]
+    if args.redis:
+        command.append('--redis')
+    if args.rate_limit:
+        command.append('--rate-limit')
+    server = subprocess.Popen(command, env=os.environ.copy())
+    url = f'http://127.0.0.1:{args.port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + '/').status_code == 200:
+                return server, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('uvicorn did not start within 30 seconds')
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Lists the scenarios whose p95 latency grew, or throughput fell, by more than tolerance against the baseline.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']} -> {current['rps']} req/s")
+    return regressions
+
+
+async def run(args) -> dict:
+    ctx = await prepare(args.users, args.contacts, args.distribution)
+    server = None
+    if args.mode == 'uvicorn':
+        url = args.url
+        if url is None:
+            server, url = start_server(args)
+        client = httpx.AsyncClient(base_url=url, timeout=60, limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from main import app
+
+        # Unhandled errors become 500 responses, as they would behind uvicorn, and are counted as errors.
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=60)
+    scenarios = {}
+    try:
+        async with client:
+            for name in args.scenarios:
+                if args.warmup:
+                    await run_scenario(client, ctx, SCENARIOS[name], args.warmup, args.concurrency)
+                scenarios[name] = await run_scenario(client, ctx, SCENARIOS[name], args.requests, args.concurrency)
+                print(f"{name:<10} {scenarios[name]['rps']:>9.1f} req/s   p50 {scenarios[name]['p50_ms']:>8.2f}   "
+                      f"p95 {scenarios[name]['p95_ms']:>8.2f}   p99 {scenarios[name]['p99_ms']:>8.2f} ms   "
+                      f"{scenarios[name]['errors']} errors")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return {
+        'meta': {
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'users': args.users,
+            'contacts': args.contacts,
+            'distribution': args.distribution,
+            'python': platform.python_version(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'scenarios': scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('inprocess', 'uvicorn'), default='inprocess')
+    parser.add_argument('--url', help='benchmark a running server instead of starting one, uvicorn mode only')
+    parser.add_argument('--port', type=int, default=8001, help='port of the uvicorn server started by the benchmark')
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS),
+                        help='comma-separated, from ' + ','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests before each scenario')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--contacts', type=int, default=200, help='average contacts per benchmark user')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform',
+                        help='how contacts are spread over the benchmark users, see benchmarks.seed')
+    parser.add_argument('--database-url', help='overrides SQLALCHEMY_DATABASE_URL')
+    parser.add_argument('--redis', action='store_true', help='use the Redis server from the settings')
+    parser.add_argument('--rate-limit', action='store_true', help='keep the rate limits on')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with a JSON baseline and exit with 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    configure(args.database_url, args.rate_limit)
+    if not args.redis:
+        use_fake_redis()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        from src.services.auth import auth_service
+
+        auth_service.hasher.shutdown()
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Seeds a synthetic users/contacts dataset for benchmarking at production scale.
+
+Contacts are spread over the users with a configurable distribution, so a few tenants can hold most of the rows:
+    zipf       user k gets a share proportional to 1 / k ** skew, the first user is the largest tenant
+    lognormal  shares drawn from a lognormal distribution with sigma = skew
+    uniform    every user gets the same number of contacts
+Names, emails, phone numbers and birthdays (spread over the whole year) are drawn from a random generator seeded
+with --seed, so the same arguments always produce the same dataset. Rows are written with bulk Core inserts of
+the Base tables, --batch-size rows per transaction. On SQLite the full-text search triggers are dropped while
+loading and the index is rebuilt once at the end, which roughly doubles the insert rate.
+
+Run from the project root with the application's environment, e.g.:
+    python -m benchmarks.seed --database-url sqlite:///./bench.db --users 1000 --contacts 10000000 --drop
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from typing import Callable, Iterator
+
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Engine
+
+from benchmarks.common import configure
+
+FIRST_NAMES = (
+    'Anna', 'Oleksii', 'Maria', 'John', 'Iryna', 'Petro', 'Sofia', 'Taras', 'Olena', 'Andrii', 'Kateryna', 'Dmytro',
+    'Yulia', 'Serhii', 'Natalia', 'Mykola', 'Emma', 'James', 'Olivia', 'William', 'Ava', 'Lucas', 'Mia', 'Noah',
+    'Hanna', 'Bohdan', 'Viktoria', 'Ivan', 'Daria', 'Maksym', 'Alina', 'Roman', 'Liam', 'Grace', 'Ethan', 'Chloe',
+)
+LAST_NAMES = (
+    'Smith', 'Kovalenko', 'Shevchenko', 'Johnson', 'Bondarenko', 'Melnyk', 'Brown', 'Tkachenko', 'Kravchenko',
+    'Oliinyk', 'Williams', 'Shevchuk', 'Polishchuk', 'Jones', 'Lysenko', 'Garcia', 'Moroz', 'Miller', 'Marchenko',
+    'Davis', 'Savchenko', 'Rudenko', 'Wilson', 'Petrenko', 'Taylor', 'Klymenko', 'Anderson', 'Pavlenko', 'Thomas',
+    'Kuzmenko', 'Moore', 'Ponomarenko', 'Martin', 'Vasylenko', 'Lee', 'Boiko',
+)
+DOMAINS = ('example.com', 'example.org', 'example.net', 'mail.example.com', 'corp.example.com')
+DESCRIPTIONS = ('Friend', 'Colleague', 'Family', 'Client', 'Supplier', 'Neighbour', 'Classmate', 'Doctor')
+DISTRIBUTIONS = ('zipf', 'lognormal', 'uniform')
+
+
+def tenant_sizes(total: int, users: int, distribution: str, skew: float, rng: random.Random) -> list[int]:
+    """
+    Splits total contacts over users by the distribution, exactly, using the largest remainders.
+    """
+    if distribution == 'zipf':
+        weights = [1 / (k + 1) ** skew for k in range(users)]
+    elif distribution == 'lognormal':
+        weights = [rng.lognormvariate(0, skew) for _ in range(users)]
+    elif distribution == 'uniform':
+        weights = [1.0] * users
+    else:
+        raise ValueError(f"Unknown distribution '{distribution}'")
+    scale = total / sum(weights)
+    shares = [weight * scale for weight in weights]
+    sizes = [int(share) for share in shares]
+    by_remainder = sorted(range(users), key=lambda k: shares[k] - sizes[k], reverse=True)
+    for k in by_remainder[:total - sum(sizes)]:
+        sizes[k] += 1
+    return sizes
+
+
+def contact_rows(user_id: int, tenant: str, count: int, rng: random.Random) -> Iterator[dict]:
+    """
+    Generates the contacts of one user. Emails embed the tenant name and the row number, so they are unique.
+    """
+    epoch = date(1950, 1, 1)
+    for i in range(count):
+        name, surname = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        birthday = epoch + timedelta(days=rng.randrange(58 * 365))
+        yield {
+            'name': name,
+            'surname': surname,
+            'email': f'{name}.{surname}.{tenant}.{i}@{rng.choice(DOMAINS)}'.lower(),
+            'phone_number': f'+380{rng.randrange(10 ** 8, 10 ** 9)}',
+            'birthday': birthday,
+            'description': rng.choice(DESCRIPTIONS),
+            'user_id': user_id,
+        }
+
+
+def seed(engine: Engine, users: int, contacts: int, distribution: str = 'zipf', skew: float = 1.1, seed: int = 0,
+         prefix: str = 'seed', password: str = 'password', batch_size: int = 10_000,
+         progress: Callable[[int], None] | None = None) -> list[tuple[int, str, int]]:
+    """
+    Inserts users named {prefix}{n} with {prefix}{n}@example.com emails, all confirmed and sharing one password,
+    and their contacts. The schema must exist.
+    :return: (user id, email, number of contacts) of every user, in creation order
+    """
+    from src.database.models import CONTACTS_SEARCH_SQLITE_DDL, CONTACTS_SEARCH_SQLITE_TRIGGERS, Contact, User
+    from src.services.auth import auth_service
+
+    rng = random.Random(seed)
+    sizes = tenant_sizes(contacts, users, distribution, skew, rng)
+    emails = [f'{prefix}{n}@example.com' for n in range(users)]
+    hashed = auth_service.pwd_context.hash(password)
+    with engine.connect() as conn:
+        search_index = conn.dialect.name == 'sqlite' and conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'contacts_search'").first() is not None
+        if conn.dialect.name == 'sqlite':
+            # Only the seeding connection skips fsync; a crash mid-load just means seeding again.
+            conn.exec_driver_sql('PRAGMA synchronous=OFF')
+        try:
+            if search_index:
+                # Updating the trigram index row by row costs more than the insert itself;
+                # it is rebuilt once at the end.
+                for trigger in CONTACTS_SEARCH_SQLITE_TRIGGERS:
+                    conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger}')
+            conn.execute(insert(User), [{'username': f'{prefix}{n}', 'email': email, 'password': hashed,
+                                         'confirmed': True} for n, email in enumerate(emails)])
+            ids = dict(conn.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+            conn.commit()
+            written = 0
+            batch = []
+            for n, email in enumerate(emails):
+                for row in contact_rows(ids[email], f'{prefix}{n}', sizes[n], rng):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        conn.execute(insert(Contact), batch)
+                        conn.commit()
+                        written += len(batch)
+                        batch = []
+                        if progress is not None:
+                            progress(written)
+            if batch:
+                conn.execute(insert(Contact), batch)
+                conn.commit()
+                written += len(batch)
+                if progress is not None:
+                    progress(written)
+        finally:
+            if search_index:
+                # Batches are committed one by one, so an interrupted load must still leave a complete index.
+                conn.rollback()
+                for ddl in CONTACTS_SEARCH_SQLITE_DDL:
+                    conn.exec_driver_sql(ddl)
+                conn.exec_driver_sql("INSERT INTO contacts_search(contacts_search) VALUES ('rebuild')")
+                conn.commit()
+    return [(ids[email], email, size) for email, size in zip(emails, sizes)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--contacts', type=int, default=100_000, help='total contacts over all users')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='zipf')
+    parser.add_argument('--skew', type=float, default=1.1, help='zipf exponent or lognormal sigma')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefix', default='seed', help='usernames are {prefix}{n}, emails {prefix}{n}@example.com')
+    parser.add_argument('--password', default='password', help='the password of every seeded user')
+    parser.add_argument('--batch-size', type=int, default=10_000, help='contacts per insert and transaction')
+    parser.add_argument('--database-url', help='overrides SQLALCHEMY_DATABASE_URL')
+    parser.add_argument('--drop', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args()
+
+    configure(args.database_url)
+    from src.database.db import engine
+    from src.database.models import Base, User
+
+    if args.drop:
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        if conn.execute(select(User.id).where(User.email == f'{args.prefix}0@example.com')).first():
+            parser.error(f"users with prefix '{args.prefix}' exist, pass --drop or another --prefix")
+
+    started = time.perf_counter()
+
+    def progress(written: int) -> None:
+        elapsed = time.perf_counter() - started
+        print(f"\r{written:>12,} / {args.contacts:,} contacts  {written / elapsed:>10,.0f} rows/s", end='', flush=True)
+
+    tenants = seed(engine, args.users, args.contacts, args.distribution, args.skew, args.seed, args.prefix,
+                   args.password, args.batch_size, progress)
+    print(f"\nSeeded {args.users} users and {args.contacts:,} contacts in {time.perf_counter() - started:.1f} s")
+    for user_id, email, size in sorted(tenants, key=lambda tenant: tenant[2], reverse=True)[:5]:
+        print(f"  {email:<32} id {user_id:<8} {size:>10,} contacts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+Runs main.app under uvicorn for the load benchmark's uvicorn mode, with an in-process fake Redis unless --redis is
+given. benchmarks.load starts it itself when no --url is passed:
+    python -m benchmarks.serve --port 8001
+"""
+import argparse
+
+from benchmarks.common import configure, use_fake_redis
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--database-url', help='overrides SQLALCHEMY_DATABASE_URL')
+    parser.add_argument('--redis', action='store_true', help='use the Redis server from the settings')
+    parser.add_argument('--rate-limit', action='store_true', help='keep the rate limits on')
+    args = parser.parse_args()
+
+    configure(args.database_url, args.rate_limit)
+    if not args.redis:
+        use_fake_redis()
+
+    import uvicorn
+
+    from main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,102 @@
-import redis.asyncio as redis
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_limiter import FastAPILimiter
+from fastapi.staticfiles import StaticFiles
 
-from src.routes import contacts, auth, users
 from src.conf.config import settings
+from src.database.db import dispose_engines
+from src.database.replicas import dispose_replicas
+from src.routes import contacts, auth, metrics, users
+from src.services.auth import auth_service
+from src.services.cache import close_redis_client
+from src.services.compression import CompressionMiddleware
+from src.services.email import get_mail_dispatcher
+from src.services.metrics import MetricsMiddleware
+from src.services.profiling import ProfilingMiddleware
+from src.services.rate_limit import describe_limits
 
-app = FastAPI()
-
-origins = [ 
+origins = [
     "http://localhost:3000"
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(auth.router, prefix='/api')
-app.include_router(contacts.router, prefix='/api')
-app.include_router(users.router, prefix='/api')
-
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
-
-@app.get("/")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function releases what the services acquired on first use: the hashing processes,
+    the SMTP connections, the database pools and the Redis connections.
+    Nothing is opened at startup, so a new worker is ready as soon as the application is built.
+    :param app: FastAPI: The application
+    :return: An async context manager around the application's lifetime
+    """
+    yield
+    # Only what was created is released, so shutting down a worker creates nothing.
+    if 'hasher' in vars(auth_service):
+        auth_service.hasher.shutdown()
+    if get_mail_dispatcher.cache_info().currsize:
+        await get_mail_dispatcher().stop()
+    await dispose_engines()
+    await dispose_replicas()
+    await close_redis_client()
+
+
 def read_root():
-    return {"message": "Simple FastAPI contacts"}
\ No newline at end of file
+    return {"message": "Simple FastAPI contacts"}
+
+
+def create_app() -> FastAPI:
+    """
+    The create_app function builds the application with its middleware and routes from the settings.
+    Run it with uvicorn main:app, or uvicorn --factory main:create_app for a new application.
+    :return: The FastAPI application
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
+    )
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+    if settings.profiling_enabled:
+        app.add_middleware(ProfilingMiddleware, repeated_query_threshold=settings.profiling_repeated_query_threshold)
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
+
+    app.include_router(auth.router, prefix='/api')
+    app.include_router(contacts.router, prefix='/api')
+    app.include_router(users.router, prefix='/api')
+    if settings.metrics_enabled and settings.metrics_token:
+        # Scraped at /metrics with settings.metrics_token, outside the public API.
+        app.include_router(metrics.router)
+    if settings.avatar_storage == 'local':
+        app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+                  name='avatars')
+    app.get("/")(read_root)
+    describe_limits(app)
+    return app
+
+
+@lru_cache
+def get_app() -> FastAPI:
+    """
+    The get_app function returns the application served as main:app, built on first use.
+    :return: The FastAPI application
+    """
+    return create_app()
+
+
+def __getattr__(name: str):
+    # main:app is built when it is first looked up, so importing main reads no settings.
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,67 @@
+"""Contacts search indexes
+
+Revision ID: 22d0d46e1b79
+Revises: 5031d3a44513
+Create Date: 2026-10-16 20:35:55.363190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '22d0d46e1b79'
+down_revision = '5031d3a44513'
+branch_labels = None
+depends_on = None
+
+
+SEARCH_COLUMNS = ('name', 'surname', 'email', 'phone_number')
+
+# A frozen copy of CONTACTS_SEARCH_SQLITE_DDL in src/database/models.py as of this revision.
+# Migrations do not import the models, so later changes to the models leave this revision unchanged.
+SQLITE_UPGRADE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_search USING fts5("
+    "name, surname, email, phone_number, content='contacts', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_search_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_search(rowid, name, surname, email, phone_number) "
+    "VALUES (new.id, new.name, new.surname, new.email, new.phone_number); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_search_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_search(contacts_search, rowid, name, surname, email, phone_number) "
+    "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone_number); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_search_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_search(contacts_search, rowid, name, surname, email, phone_number) "
+    "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone_number); "
+    "INSERT INTO contacts_search(rowid, name, surname, email, phone_number) "
+    "VALUES (new.id, new.name, new.surname, new.email, new.phone_number); END",
+    "INSERT INTO contacts_search(contacts_search) VALUES ('rebuild')",
+)
+
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER IF EXISTS contacts_search_au",
+    "DROP TRIGGER IF EXISTS contacts_search_ad",
+    "DROP TRIGGER IF EXISTS contacts_search_ai",
+    "DROP TABLE IF EXISTS contacts_search",
+)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in SEARCH_COLUMNS:
+            op.create_index(f'ix_contacts_{column}_trgm', 'contacts', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for column in reversed(SEARCH_COLUMNS):
+            op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts')
+    elif dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
@@ -0,0 +1,30 @@
+"""Contacts keyset indexes
+
+Revision ID: 5031d3a44513
+Revises: 2dbe1d5ed38b
+Create Date: 2026-10-16 20:35:04.489831
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5031d3a44513'
+down_revision = '2dbe1d5ed38b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_name_id', 'contacts', ['user_id', 'name', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_surname_id', 'contacts', ['user_id', 'surname', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_birthday_id', 'contacts', ['user_id', 'birthday', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_surname_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_name_id', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,44 @@
+"""Contacts birthday ordinal
+
+Revision ID: 8225fceb2f51
+Revises: 22d0d46e1b79
+Create Date: 2026-10-16 20:36:59.944549
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8225fceb2f51'
+down_revision = '22d0d46e1b79'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL = {
+    'postgresql': "UPDATE contacts SET birthday_ordinal = "
+                  "CAST(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) AS INTEGER)",
+    'sqlite': "UPDATE contacts SET birthday_ordinal = "
+              "CAST(strftime('%m', birthday) AS INTEGER) * 100 + CAST(strftime('%d', birthday) AS INTEGER)",
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect not in BACKFILL:
+        raise NotImplementedError(f"No birthday_ordinal backfill for the {dialect} dialect")
+    op.add_column('contacts', sa.Column('birthday_ordinal', sa.Integer(), nullable=True))
+    op.execute(BACKFILL[dialect])
+    # SQLite can only add NOT NULL by rebuilding the table, which would drop the contacts_search triggers.
+    if dialect != 'sqlite':
+        op.alter_column('contacts', 'birthday_ordinal', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_contacts_user_id_birthday_ordinal', 'contacts', ['user_id', 'birthday_ordinal'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_ordinal', table_name='contacts')
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("ALTER TABLE contacts DROP COLUMN birthday_ordinal")
+    else:
+        op.drop_column('contacts', 'birthday_ordinal')
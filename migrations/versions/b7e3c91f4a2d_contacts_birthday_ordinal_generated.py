@@ -0,0 +1,53 @@
+"""Contacts birthday ordinal generated by the database
+
+Revision ID: b7e3c91f4a2d
+Revises: 8225fceb2f51
+Create Date: 2026-10-17 10:12:41.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c91f4a2d'
+down_revision = '8225fceb2f51'
+branch_labels = None
+depends_on = None
+
+
+# Frozen copies of month_day in src/database/models.py as of this revision.
+ORDINAL = "CAST(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) AS INTEGER)"
+SQLITE_ORDINAL = "CAST(strftime('%m', birthday) AS INTEGER) * 100 + CAST(strftime('%d', birthday) AS INTEGER)"
+
+
+def _drop_ordinal(dialect: str) -> None:
+    op.drop_index('ix_contacts_user_id_birthday_ordinal', table_name='contacts')
+    if dialect == 'sqlite':
+        # A batch rebuild of the table would drop the contacts_search triggers.
+        op.execute("ALTER TABLE contacts DROP COLUMN birthday_ordinal")
+    else:
+        op.drop_column('contacts', 'birthday_ordinal')
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    _drop_ordinal(dialect)
+    if dialect == 'sqlite':
+        # SQLite can only add VIRTUAL generated columns to an existing table; they can be indexed all the same.
+        op.execute("ALTER TABLE contacts ADD COLUMN birthday_ordinal INTEGER NOT NULL "
+                   f"GENERATED ALWAYS AS ({SQLITE_ORDINAL}) VIRTUAL")
+    else:
+        op.add_column('contacts', sa.Column('birthday_ordinal', sa.Integer(), sa.Computed(ORDINAL, persisted=True),
+                                            nullable=False))
+    op.create_index('ix_contacts_user_id_birthday_ordinal', 'contacts', ['user_id', 'birthday_ordinal'], unique=False)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    _drop_ordinal(dialect)
+    op.add_column('contacts', sa.Column('birthday_ordinal', sa.Integer(), nullable=True))
+    op.execute(f"UPDATE contacts SET birthday_ordinal = {SQLITE_ORDINAL if dialect == 'sqlite' else ORDINAL}")
+    if dialect != 'sqlite':
+        op.alter_column('contacts', 'birthday_ordinal', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_contacts_user_id_birthday_ordinal', 'contacts', ['user_id', 'birthday_ordinal'], unique=False)
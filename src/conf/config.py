@@ -1,24 +1,112 @@
+from functools import lru_cache
+from typing import cast
+
 from pydantic import BaseSettings
 
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
+    sqlalchemy_async_database_url: str | None = None
+    database_async: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout: int | None = None
+    sqlalchemy_replica_urls: list[str] = []
+    replica_check_interval: float = 5.0
+    replica_connect_timeout: float = 2.0
+    read_your_writes_window: float = 5.0
+    metrics_enabled: bool = True
+    metrics_token: str | None = None
+    profiling_enabled: bool = False
+    profiling_slow_query_ms: float = 100.0
+    profiling_explain: bool = True
+    profiling_repeated_query_threshold: int = 5
     secret_key: str
     algorithm: str
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 64
     mail_username: str
     mail_password: str
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_connections: int = 2
+    mail_queue_size: int = 1000
+    mail_batch_size: int = 20
+    mail_max_retries: int = 3
+    mail_retry_delay: float = 1.0
+    import_batch_size: int = 1000
+    import_max_errors: int = 1000
+    export_batch_size: int = 1000
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    jobs_stream: str = 'jobs'
+    jobs_group: str = 'workers'
+    jobs_max_attempts: int = 5
+    jobs_retry_delay: float = 2.0
+    jobs_visibility_timeout: float = 300.0
+    worker_concurrency: int = 8
+    user_cache_ttl: int = 900
+    user_cache_local_size: int = 1024
+    user_cache_local_ttl: float = 5.0
+    token_cache_size: int = 4096
+    contacts_cache_ttl: int = 300
+    contacts_fast_json: bool = False
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    auth_claims_principal: bool = False
+    refresh_token_store: str = 'db'
+    refresh_token_ttl: int = 604800
+    rate_limit_enabled: bool = True
+    rate_limit_local_size: int = 10000
+    rate_limit_trusted_proxies: list[str] = []
+    rate_limits: dict[str, dict[str, str]] = {
+        'contacts:read': {'anonymous': '10/minute', 'user': '10/minute'},
+        'contacts:create': {'anonymous': '1/minute', 'user': '1/minute'},
+        'contacts:batch': {'anonymous': '5/minute', 'user': '5/minute'},
+        'contacts:import': {'anonymous': '5/minute', 'user': '5/minute'},
+    }
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    avatar_storage: str = 'cloudinary'
+    avatar_max_size: int = 5 * 1024 * 1024
+    avatar_local_dir: str = 'avatars'
+    avatar_local_url: str = '/avatars'
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache
+def get_settings() -> Settings:
+    """
+    The get_settings function reads the settings from the environment and the .env file on first use.
+    :return: The shared Settings
+    """
+    return Settings()
+
+
+class _LazySettings:
+    """
+    Forwards attribute access to get_settings(), so importing a module that holds settings
+    does not read the environment until a setting is used.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_settings(), name, value)
+
+    def __delattr__(self, name):
+        delattr(get_settings(), name)
+
+
+settings = cast(Settings, _LazySettings())
\ No newline at end of file
@@ -1,17 +1,317 @@
+import asyncio
+import inspect
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from src.conf.config import settings
+from src.database.pool import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool
+from src.services.metrics import instrument_engine
+from src.services.profiling import get_engine_profiler
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """
+    The engine_options function returns the create_engine arguments for the pool and statement timeout settings.
+    In-memory SQLite keeps SQLAlchemy's default single-connection pool, and the statement timeout
+    is only applied on PostgreSQL.
+    :param url: str: The database url
+    :param is_async: bool: Whether the options are for create_async_engine
+    :return: A dict of keyword arguments
+    """
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    options = {
+        "poolclass": InstrumentedAsyncAdaptedQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if settings.db_statement_timeout and url.get_backend_name() == 'postgresql':
+        timeout = str(settings.db_statement_timeout)
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+def instrument(engine: Engine) -> None:
+    """
+    The instrument function attaches the metrics and, in profiling mode, the query profiler to an engine.
+    :param engine: Engine: The engine, or the sync_engine of an asyncio engine
+    :return: None
+    """
+    if settings.metrics_enabled:
+        instrument_engine(engine)
+    if settings.profiling_enabled:
+        get_engine_profiler().instrument(engine)
+
+
+def pool_stats() -> dict:
+    """
+    The pool_stats function returns the statistics of the connection pools of the engines created so far.
+    :return: A dict keyed by 'sync' and, when enabled, 'async'
+    """
+    stats = {}
+    for name, engine in _engines.items():
+        if hasattr(engine.pool, "stats"):
+            stats[name] = engine.pool.stats()
+    return stats
+
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def make_async_url(url: str) -> str:
+    """
+    The make_async_url function turns a synchronous database url into its asyncio counterpart.
+    postgresql:// and postgresql+psycopg2:// become postgresql+asyncpg://, sqlite:// becomes sqlite+aiosqlite://.
+    :param url: str: The synchronous SQLAlchemy database url
+    :return: The url with an asyncio driver
+    """
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No asyncio driver known for '{url.get_backend_name()}'")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def database_url() -> str:
+    """
+    The database_url function returns the synchronous database url from the settings.
+    :return: The SQLAlchemy database url
+    """
+    return settings.sqlalchemy_database_url
+
+
+def async_database_url() -> str:
+    """
+    The async_database_url function returns the asyncio database url, derived from the synchronous one unless
+    settings.sqlalchemy_async_database_url is set.
+    :return: The SQLAlchemy database url with an asyncio driver
+    """
+    return settings.sqlalchemy_async_database_url or make_async_url(database_url())
+
+
+# Engines are created on first use, so importing the application neither reads the database settings
+# nor loads a driver; pool_stats and dispose_engines only see the engines created so far.
+_engines: dict[str, Engine | AsyncEngine] = {}
+
+
+def get_engine() -> Engine:
+    """
+    The get_engine function returns the shared blocking engine, creating and instrumenting it on first use.
+    :return: The Engine
+    """
+    if "sync" not in _engines:
+        url = database_url()
+        engine = create_engine(url, **engine_options(url))
+        instrument(engine)
+        _engines["sync"] = engine
+    return _engines["sync"]
+
+
+def get_async_engine() -> AsyncEngine | None:
+    """
+    The get_async_engine function returns the shared asyncio engine, creating and instrumenting it on first use.
+    :return: The AsyncEngine, or None when settings.database_async is disabled
+    """
+    if not settings.database_async:
+        return None
+    if "async" not in _engines:
+        url = async_database_url()
+        engine = create_async_engine(url, **engine_options(url, is_async=True))
+        instrument(engine.sync_engine)
+        _engines["async"] = engine
+    return _engines["async"]
+
+
+async def dispose_engines() -> None:
+    """
+    The dispose_engines function closes the pooled connections of the engines created so far, on shutdown.
+    The engines stay usable and open new connections when used again.
+    :return: None
+    """
+    for engine in _engines.values():
+        await dispose(engine)
+
+
+def __getattr__(name: str):
+    # engine, async_engine and the urls used to be created at import; they are still importable by name.
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "SQLALCHEMY_DATABASE_URL":
+        return database_url()
+    if name == "SQLALCHEMY_ASYNC_DATABASE_URL":
+        return async_database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# Objects must stay readable after commit: an expired attribute would need lazy IO outside of an await.
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    """
+    The get_db function is a dependency that yields a database session for one request.
+    It yields an AsyncSession when settings.database_async is enabled and a blocking Session otherwise,
+    so the async engine can be rolled out gradually.
+    :return: A database session
+    """
+    if settings.database_async:
+        async with AsyncSessionLocal(bind=get_async_engine()) as db:
+            yield db
+    else:
+        db = SessionLocal(bind=get_engine())
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def _resolve(result):
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+def is_connection_error(err: Exception) -> bool:
+    """
+    The is_connection_error function tells whether an error means the database could not be reached,
+    rather than that the statement failed.
+    asyncpg raises connection errors unwrapped, e.g. ConnectionRefusedError.
+    :param err: Exception: The error raised by a statement
+    :return: True for a lost or refused connection, or a timeout
+    """
+    if isinstance(err, DBAPIError):
+        return err.connection_invalidated
+    return isinstance(err, (OSError, asyncio.TimeoutError))
+
+
+@dataclass
+class ReadFallback:
+    """
+    Kept in the info of a read replica's session under READ_FALLBACK: the primary session of the same request,
+    on which execute reruns a read when the replica's connection fails.
+    """
+    primary: Session | AsyncSession
+    on_failure: Callable[[Exception], None]
+    failed: bool = False
+
+
+READ_FALLBACK = "read_fallback"
+
+
+async def execute(db: Session | AsyncSession, statement, params=None):
+    """
+    The execute function runs a statement on either a Session or an AsyncSession.
+    On a read replica's session from get_read_db, a statement whose connection fails is run once more on
+    the primary session, and so are the later statements of the request.
+    :param db: Session | AsyncSession: The database session
+    :param statement: The statement to execute
+    :param params: Optional parameters (a dict, or a list of dicts for executemany)
+    :return: The Result of the statement
+    """
+    fallback = db.info.get(READ_FALLBACK)
+    if not isinstance(fallback, ReadFallback):
+        return await _resolve(db.execute(statement, params))
+    if not fallback.failed:
+        try:
+            return await _resolve(db.execute(statement, params))
+        except (DBAPIError, OSError, asyncio.TimeoutError) as err:
+            if not is_connection_error(err):
+                raise
+            fallback.failed = True
+            fallback.on_failure(err)
+    return await execute(fallback.primary, statement, params)
+
+
+async def commit(db: Session | AsyncSession) -> None:
+    """
+    The commit function commits the current transaction of either a Session or an AsyncSession.
+    :param db: Session | AsyncSession: The database session
+    :return: None
+    """
+    await _resolve(db.commit())
+
+
+async def rollback(db: Session | AsyncSession) -> None:
+    """
+    The rollback function rolls back the current transaction of either a Session or an AsyncSession.
+    :param db: Session | AsyncSession: The database session
+    :return: None
+    """
+    await _resolve(db.rollback())
+
+
+async def close(db: Session | AsyncSession) -> None:
+    """
+    The close function releases the connection of either a Session or an AsyncSession.
+    :param db: Session | AsyncSession: The database session
+    :return: None
+    """
+    await _resolve(db.close())
+
+
+async def dispose(engine: Engine | AsyncEngine) -> None:
+    """
+    The dispose function closes the pooled connections of either an Engine or an AsyncEngine.
+    :param engine: Engine | AsyncEngine: The engine
+    :return: None
+    """
+    await _resolve(engine.dispose())
+
+
+async def refresh(db: Session | AsyncSession, instance) -> None:
+    """
+    The refresh function reloads the attributes of an instance from the database.
+    :param db: Session | AsyncSession: The database session
+    :param instance: The ORM instance to refresh
+    :return: None
+    """
+    await _resolve(db.refresh(instance))
+
+
+async def delete(db: Session | AsyncSession, instance) -> None:
+    """
+    The delete function marks an instance for deletion in either a Session or an AsyncSession.
+    :param db: Session | AsyncSession: The database session
+    :param instance: The ORM instance to delete
+    :return: None
+    """
+    await _resolve(db.delete(instance))
+
+
+async def stream_partitions(db: Session | AsyncSession, statement, size: int) -> AsyncIterator[list]:
+    """
+    The stream_partitions function runs a select on a server-side cursor and yields its rows in lists of size rows,
+    so only one partition is held in memory at a time.
+    :param db: Session | AsyncSession: The database session
+    :param statement: The select to run
+    :param size: int: The number of rows fetched per round trip
+    :return: An async iterator of row lists
+    """
+    statement = statement.execution_options(yield_per=size)
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement)
+        async for partition in result.partitions():
+            yield partition
+    else:
+        for partition in db.execute(statement).partitions():
+            yield partition
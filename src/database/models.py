@@ -1,5 +1,9 @@
-from sqlalchemy import Boolean, Column, Integer, String, func
+from datetime import date
+
+from sqlalchemy import DDL, Boolean, Column, Computed, Index, Integer, String, event, func
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.functions import FunctionElement
 from sqlalchemy.types import Date
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
@@ -9,6 +13,37 @@ from sqlalchemy.sql.sqltypes import DateTime
 Base = declarative_base()
 
 
+def birthday_ordinal(birthday: date) -> int:
+    """
+    The birthday_ordinal function maps a date to its month-day ordinal (month * 100 + day), e.g. 2024-02-29 -> 229.
+    Ordinals sort like days of the year and do not depend on the year, so upcoming birthdays are a range query.
+    The database computes Contact.birthday_ordinal the same way with month_day.
+    :param birthday: date: The date of birth
+    :return: The month-day ordinal
+    """
+    return birthday.month * 100 + birthday.day
+
+
+class month_day(FunctionElement):
+    """
+    The SQL counterpart of birthday_ordinal, for the generated birthday_ordinal column.
+    """
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(month_day)
+def _month_day(element, compiler, **kw):
+    date_sql = compiler.process(element.clauses, **kw)
+    return f"CAST(EXTRACT(MONTH FROM {date_sql}) * 100 + EXTRACT(DAY FROM {date_sql}) AS INTEGER)"
+
+
+@compiles(month_day, 'sqlite')
+def _month_day_sqlite(element, compiler, **kw):
+    date_sql = compiler.process(element.clauses, **kw)
+    return f"CAST(strftime('%m', {date_sql}) AS INTEGER) * 100 + CAST(strftime('%d', {date_sql}) AS INTEGER)"
+
+
 class Contact(Base):
     __tablename__ = "contacts"
     id = Column(Integer, primary_key=True)
@@ -17,10 +52,20 @@ class Contact(Base):
     email = Column(String, unique=True, index=True)
     phone_number = Column(String(50), nullable=True)
     birthday = Column('birthday', Date, nullable=False)
+    # Generated by the database, so every write of birthday, ORM or not, keeps it current.
+    birthday_ordinal = Column(Integer, Computed(month_day(birthday), persisted=True), nullable=False)
     description = Column(String(150), nullable=False)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref='contacts')
 
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_name_id', 'user_id', 'name', 'id'),
+        Index('ix_contacts_user_id_surname_id', 'user_id', 'surname', 'id'),
+        Index('ix_contacts_user_id_birthday_id', 'user_id', 'birthday', 'id'),
+        Index('ix_contacts_user_id_birthday_ordinal', 'user_id', 'birthday_ordinal'),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -31,4 +76,36 @@ class User(Base):
     created_at = Column('created_at', DateTime, default=func.now())
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
-    confirmed = Column(Boolean, default=False)
\ No newline at end of file
+    confirmed = Column(Boolean, default=False)
+
+
+# SQLite stand-in for the PostgreSQL pg_trgm search indexes: an external-content FTS5 table
+# with the trigram tokenizer, kept in sync with contacts by triggers.
+# This is the one definition the application uses. Migration 22d0d46e1b79 keeps a frozen copy, as migrations
+# must not import the models; a change here needs a new migration with its own copy.
+CONTACTS_SEARCH_SQLITE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_search USING fts5("
+    "name, surname, email, phone_number, content='contacts', content_rowid='id', tokenize='trigram')"
+)
+CONTACTS_SEARCH_SQLITE_TRIGGERS = {
+    "contacts_search_ai":
+        "CREATE TRIGGER IF NOT EXISTS contacts_search_ai AFTER INSERT ON contacts BEGIN "
+        "INSERT INTO contacts_search(rowid, name, surname, email, phone_number) "
+        "VALUES (new.id, new.name, new.surname, new.email, new.phone_number); END",
+    "contacts_search_ad":
+        "CREATE TRIGGER IF NOT EXISTS contacts_search_ad AFTER DELETE ON contacts BEGIN "
+        "INSERT INTO contacts_search(contacts_search, rowid, name, surname, email, phone_number) "
+        "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone_number); END",
+    "contacts_search_au":
+        "CREATE TRIGGER IF NOT EXISTS contacts_search_au AFTER UPDATE ON contacts BEGIN "
+        "INSERT INTO contacts_search(contacts_search, rowid, name, surname, email, phone_number) "
+        "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone_number); "
+        "INSERT INTO contacts_search(rowid, name, surname, email, phone_number) "
+        "VALUES (new.id, new.name, new.surname, new.email, new.phone_number); END",
+}
+CONTACTS_SEARCH_SQLITE_DDL = (CONTACTS_SEARCH_SQLITE_TABLE, *CONTACTS_SEARCH_SQLITE_TRIGGERS.values())
+
+for ddl in CONTACTS_SEARCH_SQLITE_DDL:
+    event.listen(Contact.__table__, 'after_create', DDL(ddl).execute_if(dialect='sqlite'))
+event.listen(Contact.__table__, 'after_drop',
+             DDL("DROP TABLE IF EXISTS contacts_search").execute_if(dialect='sqlite'))
@@ -0,0 +1,95 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Upper bounds of the checkout wait histogram, in seconds.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class PoolStats:
+    """
+    Counters of one connection pool: checkouts, the time spent waiting for a connection,
+    timeouts and connections opened beyond pool_size.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.overflow_events = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe_checkout(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def observe_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def observe_overflow(self) -> None:
+        with self._lock:
+            self.overflow_events += 1
+
+
+class _InstrumentedPoolMixin:
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.observe_timeout()
+            raise
+        self.metrics.observe_checkout(time.perf_counter() - started)
+        return record
+
+    def _inc_overflow(self) -> bool:
+        opened = super()._inc_overflow()
+        if opened and self._overflow > 0:
+            self.metrics.observe_overflow()
+        return opened
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the pool's configuration, current usage and counters.
+        :return: A dict of gauges and counters
+        """
+        metrics = self.metrics
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": metrics.checkouts,
+            "timeouts": metrics.timeouts,
+            "overflow_events": metrics.overflow_events,
+            "wait_seconds_total": metrics.wait_seconds_total,
+            "wait_seconds_max": metrics.wait_seconds_max,
+            "wait_buckets": dict(zip([*map(str, WAIT_BUCKETS), "+Inf"], metrics.wait_buckets)),
+        }
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """
+    A QueuePool that records how long checkouts wait, timeouts and overflow connections.
+    """
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """
+    The asyncio variant of InstrumentedQueuePool.
+    """
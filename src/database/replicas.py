@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from functools import lru_cache
+
+from fastapi import Depends
+from redis.exceptions import RedisError
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.conf.config import settings
+from src.database import db as database
+from src.database.db import (READ_FALLBACK, ReadFallback, engine_options, get_db, instrument, is_connection_error,
+                             make_async_url)
+from src.services.auth import Principal, auth_service
+from src.services.cache import LRUCache, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """
+    A read replica with its own engine and session factory.
+    It is checked with SELECT 1 at most once per check_interval and skipped for check_interval after a failure.
+    A check, including the connect, fails after connect_timeout seconds.
+    """
+
+    def __init__(self, url: str, is_async: bool, check_interval: float, connect_timeout: float = 2.0):
+        """
+        :param url: str: The synchronous database url of the replica
+        :param is_async: bool: Create an asyncio engine, as settings.database_async does for the primary
+        :param check_interval: float: Seconds between health checks, and before a failed replica is retried
+        :param connect_timeout: float: Seconds before a health check of an unresponsive replica fails
+        """
+        self.url = url
+        self.check_interval = check_interval
+        self.connect_timeout = connect_timeout
+        if is_async:
+            async_url = make_async_url(url)
+            self.engine = create_async_engine(async_url, **self._options(async_url, is_async=True))
+            self.session = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            self.engine = create_engine(url, **self._options(url, is_async=False))
+            self.session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        instrument(self.engine.sync_engine if is_async else self.engine)
+        self.healthy = True
+        self.checked_at = float('-inf')
+
+    def _options(self, url: str, is_async: bool) -> dict:
+        options = engine_options(url, is_async=is_async)
+        if make_url(url).get_backend_name() == 'postgresql':
+            # asyncpg takes the connect timeout in seconds as timeout, libpq in whole seconds as connect_timeout.
+            timeout = {'timeout': self.connect_timeout} if is_async \
+                else {'connect_timeout': max(1, math.ceil(self.connect_timeout))}
+            options['connect_args'] = {**options.get('connect_args', {}), **timeout}
+        return options
+
+    def mark_down(self, err: Exception) -> None:
+        logger.warning("Replica %s marked down: %s", self.engine.url, err)
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+    async def available(self) -> bool:
+        """
+        The available function tells whether the replica may serve a request, running a health check when one is due.
+        :return: True if the replica is healthy
+        """
+        if time.monotonic() - self.checked_at < self.check_interval:
+            return self.healthy
+        self.checked_at = time.monotonic()
+        db = self.session()
+        try:
+            await asyncio.wait_for(database.execute(db, select(1)), self.connect_timeout)
+            self.healthy = True
+        except (DBAPIError, OSError, asyncio.TimeoutError) as err:
+            # asyncpg raises connection errors unwrapped, e.g. ConnectionRefusedError.
+            self.mark_down(err)
+        finally:
+            await database.close(db)
+        return self.healthy
+
+
+class ReplicaSet:
+    """
+    Distributes reads over the healthy replicas in round-robin order.
+    """
+
+    def __init__(self, urls: list[str], is_async: bool, check_interval: float, connect_timeout: float = 2.0):
+        self.replicas = [Replica(url, is_async, check_interval, connect_timeout) for url in urls]
+        self._next = itertools.count()
+        self.reads = 0
+        self.fallbacks = 0
+
+    async def choose(self) -> Replica | None:
+        """
+        The choose function returns the next healthy replica, or None when all of them are down.
+        :return: A Replica or None
+        """
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if await replica.available():
+                self.reads += 1
+                return replica
+        self.fallbacks += 1
+        return None
+
+    async def dispose(self) -> None:
+        """
+        The dispose function closes the pooled connections of every replica, on shutdown.
+        :return: None
+        """
+        for replica in self.replicas:
+            await database.dispose(replica.engine)
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(replica.healthy for replica in self.replicas),
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+class ReadYourWrites:
+    """
+    Remembers which users wrote recently, so their reads go to the primary until replicas have caught up.
+    A per-worker map answers for writes made through this worker; Redis shares the window with the other workers.
+    """
+
+    def __init__(self, r, window: float, local_size: int = 10000):
+        """
+        :param r: redis.Redis: The Redis client
+        :param window: float: Seconds a user stays pinned to the primary after a write
+        :param local_size: int: The number of recent writers remembered by this worker
+        """
+        self.r = r
+        self.window = window
+        self.local = LRUCache(local_size, window)
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"rw_pin:{user_id}"
+
+    async def pin(self, user_id: int) -> None:
+        """
+        The pin function records a write of a user.
+        :param user_id: int: The id of the user
+        :return: None
+        """
+        self.local.set(user_id, True)
+        try:
+            await self.r.set(self._key(user_id), 1, px=int(self.window * 1000))
+        except RedisError as err:
+            logger.warning("Read-your-writes pin failed: %s", err)
+
+    async def pinned(self, user_id: int) -> bool:
+        """
+        The pinned function tells whether a user wrote within the window.
+        Without Redis every user counts as pinned, trading replica offload for consistency.
+        :param user_id: int: The id of the user
+        :return: True if the user's reads must go to the primary
+        """
+        if self.local.get(user_id):
+            return True
+        try:
+            return bool(await self.r.exists(self._key(user_id)))
+        except RedisError as err:
+            logger.warning("Read-your-writes check failed: %s", err)
+            return True
+
+
+@lru_cache
+def get_replica_set() -> ReplicaSet:
+    """
+    The get_replica_set function returns the replicas from settings.sqlalchemy_replica_urls,
+    created with their engines on first use.
+    :return: The ReplicaSet
+    """
+    return ReplicaSet(settings.sqlalchemy_replica_urls, settings.database_async, settings.replica_check_interval,
+                      settings.replica_connect_timeout)
+
+
+async def dispose_replicas() -> None:
+    """
+    The dispose_replicas function closes the pooled connections of the replicas, if they were created.
+    :return: None
+    """
+    if get_replica_set.cache_info().currsize:
+        await get_replica_set().dispose()
+
+
+@lru_cache
+def get_read_your_writes() -> ReadYourWrites:
+    """
+    The get_read_your_writes function returns the shared read-your-writes pins, created on first use.
+    :return: The ReadYourWrites
+    """
+    return ReadYourWrites(get_redis_client(), settings.read_your_writes_window)
+
+
+async def pin_primary(user_id: int) -> None:
+    """
+    The pin_primary function sends a user's reads to the primary for settings.read_your_writes_window seconds.
+    Repositories call it after committing a user's write.
+    :param user_id: int: The id of the user
+    :return: None
+    """
+    if get_replica_set().replicas:
+        await get_read_your_writes().pin(user_id)
+
+
+async def get_read_db(primary: Session | AsyncSession = Depends(get_db),
+                      current_user: Principal = Depends(auth_service.get_current_principal)):
+    """
+    The get_read_db function is a dependency yielding a session for read-only endpoints.
+    It uses the next healthy replica from settings.sqlalchemy_replica_urls and falls back to the primary session
+    when there are none, all of them are down, or the user wrote within the read-your-writes window.
+    A replica that fails during the request is marked down and database.execute reruns the read on the primary;
+    an export streams from the replica without this fallback, as part of it may already be sent.
+    :param primary: Session | AsyncSession: The primary session, used as the fallback
+    :param current_user: Principal: The user whose recent writes pin reads to the primary
+    :return: A database session
+    """
+    replica = None
+    replica_set = get_replica_set()
+    if replica_set.replicas and not await get_read_your_writes().pinned(current_user.id):
+        replica = await replica_set.choose()
+    if replica is None:
+        yield primary
+        return
+    db = replica.session()
+    fallback = ReadFallback(primary, replica.mark_down)
+    db.info[READ_FALLBACK] = fallback
+    try:
+        yield db
+    except (DBAPIError, OSError, asyncio.TimeoutError) as err:
+        if is_connection_error(err) and not fallback.failed:
+            replica.mark_down(err)
+        raise
+    finally:
+        await database.close(db)
@@ -1,40 +1,137 @@
-from typing import List
-from datetime import datetime, timedelta
-from sqlalchemy import and_
+from calendar import isleap
+from typing import AsyncIterator, List
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, bindparam, case, column, delete, func, insert, or_, select, table, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.database import db as database
+from src.database.models import Contact, User, birthday_ordinal
+from src.schemas import (ContactImportError, ContactImportReport, ContactModel, ContactOperation, ContactOperationResult,
+                         ContactResponse)
+from src.database.replicas import pin_primary
+from src.services.auth import Principal
+from src.services.cache import get_contacts_cache
 
 
-async def get_contacts(skip: int, limit: int, db: Session, user: User) -> List[Contact]:
+# The columns of ContactResponse, in its field order, for queries returning plain rows.
+RESPONSE_COLUMNS = tuple(getattr(Contact, field) for field in ContactResponse.__fields__)
+
+
+def _select_contacts(rows: bool):
+    return select(*RESPONSE_COLUMNS) if rows else select(Contact)
+
+
+async def _written(user: User | Principal) -> None:
+    # Called after a user's write commits: cached listings are stale, and replicas may still lag behind.
+    await get_contacts_cache().bump(user.id)
+    await pin_primary(user.id)
+
+
+async def _fetch(db: Session | AsyncSession, statement, rows: bool) -> list:
+    result = await database.execute(db, statement)
+    return result.all() if rows else result.scalars().all()
+
+
+SORT_COLUMNS = {
+    'id': Contact.id,
+    'name': Contact.name,
+    'surname': Contact.surname,
+    'birthday': Contact.birthday,
+}
+
+
+def get_keyset(contact: Contact, sort: str = 'id') -> list:
+    """
+    Returns the keyset of a contact for the given sort key, used to build a pagination cursor.
+
+    :param contact: The last contact of a page.
+    :type contact: Contact
+    :param sort: The sort key of the listing.
+    :type sort: str
+    :return: The sort key, the value of the sort column and the contact id.
+    :rtype: list
+    """
+    return [sort, getattr(contact, sort), contact.id]
+
+
+def parse_keyset(keyset: list, sort: str = 'id') -> tuple | None:
+    """
+    Validates a keyset decoded from a pagination cursor against the requested sort key.
+
+    :param keyset: The decoded keyset.
+    :type keyset: list
+    :param sort: The sort key of the listing.
+    :type sort: str
+    :return: The value of the sort column and the contact id, or None if the keyset does not match.
+    :rtype: tuple | None
+    """
+    if len(keyset) != 3 or keyset[0] != sort or not isinstance(keyset[2], int):
+        return None
+    value = keyset[1]
+    try:
+        if sort == 'birthday':
+            value = date.fromisoformat(value)
+        elif sort == 'id':
+            value = int(value)
+        elif not isinstance(value, str):
+            return None
+    except (TypeError, ValueError):
+        return None
+    return value, keyset[2]
+
+
+async def get_contacts(skip: int, limit: int, db: Session | AsyncSession, user: User | Principal,
+                       after: tuple | None = None, sort: str = 'id', rows: bool = False) -> List[Contact]:
     """
     Retrieves a list of contacts for a specific user with specified pagination parameters.
+    Contacts are ordered by the sort key and then by id. When after is given the page starts right after
+    that keyset (keyset pagination, served by the (user_id, sort key, id) indexes) and skip is ignored.
 
     :param skip: The number of contacts to skip.
     :type skip: int
     :param limit: The maximum number of contacts to return.
     :type limit: int
     :param user: The user to retrieve contacts for.
-    :type user: User
+    :type user: User | Principal
     :param db: The database session.
-    :type db: Session
+    :type db: Session | AsyncSession
+    :param after: The keyset of the last contact of the previous page, as returned by parse_keyset.
+    :type after: tuple | None
+    :param sort: One of the SORT_COLUMNS keys.
+    :type sort: str
+    :param rows: Return rows of the RESPONSE_COLUMNS instead of ORM objects, skipping the identity map.
+    :type rows: bool
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+    sort_column = SORT_COLUMNS[sort]
+    statement = _select_contacts(rows).where(Contact.user_id == user.id)
+    if after is None:
+        statement = statement.offset(skip)
+    elif sort == 'id':
+        statement = statement.where(Contact.id > after[1])
+    else:
+        statement = statement.where(tuple_(sort_column, Contact.id) > tuple_(*after))
+    if sort == 'id':
+        statement = statement.order_by(Contact.id)
+    else:
+        statement = statement.order_by(sort_column, Contact.id)
+    statement = statement.limit(limit)
+    return await _fetch(db, statement, rows)
 
 
-async def create_contact(body: ContactModel, db: Session, user: User) -> Contact:
+async def create_contact(body: ContactModel, db: Session | AsyncSession, user: User | Principal) -> Contact:
     """
     Creates a new contact for a specific user.
 
     :param body: The data for the contact to create.
     :type body: ContactModel
     :param user: The user to create the contact for.
-    :type user: User
+    :type user: User | Principal
     :param db: The database session.
-    :type db: Session
+    :type db: Session | AsyncSession
     :return: The newly created contact.
     :rtype: Contact
     """
@@ -46,28 +143,187 @@ async def create_contact(body: ContactModel, db: Session, user: User) -> Contact
                       description = body.description,
                       user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await database.commit(db)
+    await _written(user)
+    await database.refresh(db, contact)
     return contact
 
 
-async def get_contact(contact_id: int, db: Session, user: User) -> Contact:
+def _report_error(report: ContactImportReport, row: int, detail: str, max_errors: int) -> None:
+    report.failed += 1
+    if len(report.errors) < max_errors:
+        report.errors.append(ContactImportError(row=row, detail=detail))
+
+
+async def _insert_batch(batch: list[tuple[int, ContactModel]], db: Session | AsyncSession, user: User | Principal,
+                        report: ContactImportReport, max_errors: int) -> None:
+    rows = [dict(body.dict(), user_id=user.id) for _, body in batch]
+    try:
+        await database.execute(db, insert(Contact), rows)
+        await database.commit(db)
+        report.inserted += len(rows)
+        return
+    except IntegrityError:
+        await database.rollback(db)
+    # Retry row by row to find out which rows were rejected.
+    for (row, _), values in zip(batch, rows):
+        try:
+            await database.execute(db, insert(Contact), [values])
+            await database.commit(db)
+            report.inserted += 1
+        except IntegrityError:
+            await database.rollback(db)
+            _report_error(report, row, "Contact with this email already exists", max_errors)
+
+
+async def import_contacts(contacts: AsyncIterator[tuple[int, ContactModel | None, str | None]],
+                          db: Session | AsyncSession, user: User | Principal,
+                          batch_size: int = 1000, max_errors: int = 1000) -> ContactImportReport:
+    """
+    Inserts a stream of contacts for a specific user in batches.
+
+    Every batch is one multi-row INSERT in its own transaction, so at most batch_size contacts are held in memory.
+    When a batch violates a constraint it is retried row by row and only the offending rows are reported.
+
+    :param contacts: (row number, contact, error) tuples, as produced by src.services.contacts_io.read_contacts.
+    :type contacts: AsyncIterator[tuple[int, ContactModel | None, str | None]]
+    :param db: The database session.
+    :type db: Session | AsyncSession
+    :param user: The user to create the contacts for.
+    :type user: User | Principal
+    :param batch_size: The number of contacts per INSERT and transaction.
+    :type batch_size: int
+    :param max_errors: The number of errors listed in the report, further errors are only counted.
+    :type max_errors: int
+    :return: The number of inserted and failed rows, and the errors.
+    :rtype: ContactImportReport
+    """
+    report = ContactImportReport()
+    batch = []
+    async for row, body, error in contacts:
+        if error is not None:
+            _report_error(report, row, error, max_errors)
+            continue
+        batch.append((row, body))
+        if len(batch) >= batch_size:
+            await _insert_batch(batch, db, user, report, max_errors)
+            batch = []
+    if batch:
+        await _insert_batch(batch, db, user, report, max_errors)
+    if report.inserted:
+        await _written(user)
+    return report
+
+
+EXPORT_COLUMNS = (Contact.id, Contact.name, Contact.surname, Contact.email, Contact.phone_number,
+                  Contact.birthday, Contact.description)
+
+
+def export_contacts(db: Session | AsyncSession, user: User | Principal, batch_size: int = 1000) -> AsyncIterator[list]:
+    """
+    Streams all contacts of a specific user, ordered by id, as plain rows instead of ORM objects.
+
+    :param db: The database session.
+    :type db: Session | AsyncSession
+    :param user: The user to export the contacts of.
+    :type user: User | Principal
+    :param batch_size: The number of rows fetched from the server-side cursor at a time.
+    :type batch_size: int
+    :return: An async iterator of lists of rows with the EXPORT_COLUMNS.
+    :rtype: AsyncIterator[list]
+    """
+    statement = select(*EXPORT_COLUMNS).where(Contact.user_id == user.id).order_by(Contact.id)
+    return database.stream_partitions(db, statement, batch_size)
+
+
+async def batch_contacts(operations: List[ContactOperation], db: Session | AsyncSession,
+                         user: User | Principal) -> List[ContactOperationResult] | None:
+    """
+    Applies a list of create, update and delete operations for a specific user in a single transaction.
+
+    Operations are grouped by kind and each group runs as one set-based statement: a multi-row INSERT ... RETURNING,
+    an executemany UPDATE and a DELETE ... WHERE id IN (...) RETURNING, all scoped to the user.
+    Updates run before deletes; only the first update or delete of a given id is applied, later ones are reported
+    as duplicates. Ids the user does not own are reported as not_found.
+
+    :param operations: The operations to apply.
+    :type operations: List[ContactOperation]
+    :param db: The database session.
+    :type db: Session | AsyncSession
+    :param user: The user owning the contacts.
+    :type user: User | Principal
+    :return: One result per operation, in request order, or None if a constraint was violated and nothing was applied.
+    :rtype: List[ContactOperationResult] | None
+    """
+    results = [ContactOperationResult(index=index, op=operation.op, id=operation.id, status='not_found')
+               for index, operation in enumerate(operations)]
+    creates, updates, deletes, seen = [], [], [], set()
+    for index, operation in enumerate(operations):
+        if operation.op == 'create':
+            creates.append(index)
+        elif operation.id in seen:
+            results[index].status = 'duplicate'
+        else:
+            seen.add(operation.id)
+            (updates if operation.op == 'update' else deletes).append(index)
+
+    try:
+        if creates:
+            statement = insert(Contact).returning(Contact.id, sort_by_parameter_order=True)
+            rows = [dict(operations[index].data.dict(), user_id=user.id) for index in creates]
+            ids = (await database.execute(db, statement, rows)).scalars().all()
+            for index, contact_id in zip(creates, ids):
+                results[index].id, results[index].status = contact_id, 'created'
+
+        if updates:
+            statement = select(Contact.id).where(Contact.user_id == user.id,
+                                                 Contact.id.in_([operations[index].id for index in updates]))
+            owned = set((await database.execute(db, statement)).scalars().all())
+            updates = [index for index in updates if operations[index].id in owned]
+        if updates:
+            contacts = Contact.__table__
+            statement = update(contacts).where(contacts.c.id == bindparam('contact_id'),
+                                               contacts.c.user_id == user.id)
+            rows = [dict(operations[index].data.dict(), contact_id=operations[index].id) for index in updates]
+            await database.execute(db, statement, rows)
+            for index in updates:
+                results[index].status = 'updated'
+
+        if deletes:
+            statement = delete(Contact).where(Contact.user_id == user.id,
+                                              Contact.id.in_([operations[index].id for index in deletes])) \
+                .returning(Contact.id).execution_options(synchronize_session=False)
+            deleted = set((await database.execute(db, statement)).scalars().all())
+            for index in deletes:
+                if operations[index].id in deleted:
+                    results[index].status = 'deleted'
+
+        await database.commit(db)
+    except IntegrityError:
+        await database.rollback(db)
+        return None
+    await _written(user)
+    return results
+
+
+async def get_contact(contact_id: int, db: Session | AsyncSession, user: User | Principal) -> Contact:
     """
     Retrieves a single contact with the specified ID for a specific user.
 
     :param contact_id: The ID of the contact to retrieve.
     :type contact_id: int
     :param user: The user to retrieve the contact for.
-    :type user: User
+    :type user: User | Principal
     :param db: The database session.
-    :type db: Session
+    :type db: Session | AsyncSession
     :return: The contact with the specified ID, or None if it does not exist.
     :rtype: Contact | None
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    statement = select(Contact).where(and_(Contact.id == contact_id, Contact.user_id == user.id))
+    return (await database.execute(db, statement)).scalars().first()
 
 
-async def update_contact(contact_id: int, body: ContactModel, db: Session, user: User) -> Contact | None:
+async def update_contact(contact_id: int, body: ContactModel, db: Session | AsyncSession, user: User | Principal) -> Contact | None:
     """
     Updates a single contact with the specified ID for a specific user.
 
@@ -76,13 +332,13 @@ async def update_contact(contact_id: int, body: ContactModel, db: Session, user:
     :param body: The updated data for the contact.
     :type body: ContactModel
     :param user: The user to update the contact for.
-    :type user: User
+    :type user: User | Principal
     :param db: The database session.
-    :type db: Session
+    :type db: Session | AsyncSession
     :return: The updated contact, or None if it does not exist.
     :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    contact = await get_contact(contact_id, db, user)
     if contact:
         contact.name = body.name
         contact.surname = body.surname
@@ -90,85 +346,137 @@ async def update_contact(contact_id: int, body: ContactModel, db: Session, user:
         contact.phone_number = body.phone_number
         contact.birthday = body.birthday
         contact.description = body.description
-        db.commit()
+        await database.commit(db)
+        await _written(user)
     return contact
 
 
-async def remove_contact(contact_id: int, db: Session, user: User) -> Contact | None:
+async def remove_contact(contact_id: int, db: Session | AsyncSession, user: User | Principal) -> Contact | None:
     """
     Removes a single contact with the specified ID for a specific user.
 
     :param contact_id: The ID of the contact to remove.
     :type contact_id: int
     :param user: The user to remove the contact for.
-    :type user: User
+    :type user: User | Principal
     :param db: The database session.
-    :type db: Session
+    :type db: Session | AsyncSession
     :return: The removed contact, or None if it does not exist.
     :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    contact = await get_contact(contact_id, db, user)
     if contact:
-        db.delete(contact)
-        db.commit()
+        await database.delete(db, contact)
+        await database.commit(db)
+        await _written(user)
     return contact
 
 
-async def get_contacts_by_info(info: str, db: Session, user: User) -> List[Contact]:
+SEARCH_COLUMNS = (Contact.name, Contact.surname, Contact.email, Contact.phone_number)
+contacts_search = table('contacts_search', column('rowid'))
+
+
+def _escape_like(info: str) -> str:
+    return info.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+async def get_contacts_by_info(info: str, db: Session | AsyncSession, user: User | Principal,
+                               skip: int = 0, limit: int = 100, rows: bool = False) -> List[Contact]:
     """
-    The get_contacts_by_info function takes a string and returns a list of contacts that have the string in their first name, second name or email.
+    The get_contacts_by_info function takes a string and returns a list of contacts that have the string in their
+    name, surname, email or phone number. It runs a single query, so every contact is returned at most once,
+    best matches first.
+        On PostgreSQL the ILIKE filter is served by the pg_trgm GIN indexes and ranked by trigram similarity.
+        On SQLite it uses the contacts_search FTS5 trigram table ranked by bm25, for searches of at least 3 characters.
+        Anything else falls back to an unranked LIKE scan.
         Args:
             info (str): The string to search for.
             db (Session): A database session object.
             user (User): An authenticated user object.
+            skip (int): The number of matches to skip.
+            limit (int): The maximum number of matches to return.
     
     :param info: str: Pass the information that we want to search for
-    :param db: Session: Create a connection to the database
-    :param user: User: Get the user id from the database
+    :param db: Session | AsyncSession: Create a connection to the database
+    :param user: User | Principal: Get the user id from the database
+    :param skip: int: Skip a number of matches
+    :param limit: int: Limit the number of matches returned
+    :param rows: bool: Return rows of the RESPONSE_COLUMNS instead of ORM objects
     :return: A list of contacts with the specified information
     """
-    response = []
-    info_by_name = db.query(Contact).filter(and_(Contact.name.like(f'%{info}%'), Contact.user_id == user.id)).all()
-    if info_by_name:
-        for contact in info_by_name:
-            response.append(contact)
-    info_by_surname = db.query(Contact).filter(and_(Contact.name.like(f'%{info}%'), Contact.user_id == user.id)).all()
-    if info_by_surname:
-        for contact in info_by_surname:
-            response.append(contact)
-    info_by_email = db.query(Contact).filter(and_(Contact.name.like(f'%{info}%'), Contact.user_id == user.id)).all()
-    if info_by_email:
-        for contact in info_by_email:
-            response.append(contact)
-    return response
-
-async def get_birthday_per_week(days: int, db: Session, user: User):
-    """
-    The get_birthday_per_week function returns a list of contacts whose birthday is within the next 7 days.
+    dialect = db.get_bind().dialect.name
+    statement = _select_contacts(rows).where(Contact.user_id == user.id)
+    if dialect == 'sqlite' and len(info) >= 3:
+        query = '"' + info.replace('"', '""') + '"'
+        statement = statement.join(contacts_search, contacts_search.c.rowid == Contact.id) \
+            .where(text("contacts_search MATCH :query").bindparams(query=query)) \
+            .order_by(text("bm25(contacts_search)"), Contact.id)
+    else:
+        pattern = f'%{_escape_like(info)}%'
+        statement = statement.where(or_(*(search_column.ilike(pattern, escape='\\')
+                                          for search_column in SEARCH_COLUMNS)))
+        if dialect == 'postgresql':
+            rank = func.greatest(*(func.similarity(func.coalesce(search_column, ''), info)
+                                   for search_column in SEARCH_COLUMNS))
+            statement = statement.order_by(rank.desc(), Contact.id)
+        else:
+            statement = statement.order_by(Contact.id)
+    statement = statement.offset(skip).limit(limit)
+    return await _fetch(db, statement, rows)
+
+
+def _first_ordinal(day: date) -> int:
+    """
+    Returns the lowest birthday_ordinal celebrated on the given day.
+    In a non-leap year Feb 29 birthdays are celebrated on Mar 1, so Mar 1 starts at 229 instead of 301.
+    """
+    ordinal = birthday_ordinal(day)
+    if ordinal == 301 and not isleap(day.year):
+        return 229
+    return ordinal
+
+
+def _birthday_ranges(today: date, days: int) -> list[tuple[int, int]]:
+    """
+    Splits the window [today, today + days] into inclusive birthday_ordinal ranges, one per calendar year it touches.
+    """
+    if days < 0:
+        return []
+    if days >= 365:
+        return [(101, 1231)]
+    end = today + timedelta(days=days)
+    segments = [(today, end)] if end.year == today.year else [(today, date(today.year, 12, 31)),
+                                                               (date(end.year, 1, 1), end)]
+    return [(_first_ordinal(start), birthday_ordinal(stop)) for start, stop in segments]
+
+
+async def get_birthday_per_week(days: int, db: Session | AsyncSession, user: User | Principal, today: date | None = None,
+                                rows: bool = False):
+    """
+    The get_birthday_per_week function returns a list of contacts whose birthday is within the next days days,
+    ordered by the next occurrence of the birthday.
+    The filter runs in the database on the indexed (user_id, birthday_ordinal) pair, so only matching rows are loaded.
+    Windows crossing the new year wrap around, and Feb 29 birthdays are celebrated on Mar 1 in non-leap years.
         Args:
             days (int): The number of days to look ahead for birthdays.
             db (Session): A database session object that can be used to query the database.
             user (User): The user who's contacts we want to query.
+            today (date): The first day of the window, defaults to the current date.
     
     :param days: int: Specify the number of days in which we want to get the birthdays
-    :param db: Session: Access the database
-    :param user: User: Get the user id of the current logged in user
-    :return: A list of contacts whose birthdays are in the next 7 days
-    """
-    response = []
-    all_contacts = db.query(Contact).filter(Contact.user_id == user.id).all()
-    today = datetime.now().date()
-    delta = timedelta(days=days)
-
-    for contact in all_contacts:
-        contact_next_birthday = datetime(year=today.year,
-                                         month=contact.birthday.month,
-                                         day=contact.birthday.day).date()
-        if contact_next_birthday < today:
-            continue
-        if contact_next_birthday - today > delta:
-            continue
-
-        response.append(contact)
-    return response
-
+    :param db: Session | AsyncSession: Access the database
+    :param user: User | Principal: Get the user id of the current logged in user
+    :param today: date: Override the current date
+    :param rows: bool: Return rows of the RESPONSE_COLUMNS instead of ORM objects
+    :return: A list of contacts whose birthdays are in the next days days
+    """
+    today = today or datetime.now().date()
+    ranges = _birthday_ranges(today, days)
+    if not ranges:
+        return []
+    today_ordinal = _first_ordinal(today)
+    statement = _select_contacts(rows).where(Contact.user_id == user.id,
+                                             or_(*(Contact.birthday_ordinal.between(low, high) for low, high in ranges)))
+    statement = statement.order_by(case((Contact.birthday_ordinal >= today_ordinal, 0), else_=1),
+                                   Contact.birthday_ordinal, Contact.id)
+    return await _fetch(db, statement, rows)
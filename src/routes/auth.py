@@ -1,28 +1,29 @@
-from typing import List
-
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from src.conf.config import settings
 from src.database.db import get_db
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.jobs import get_job_queue
+from src.services.refresh_tokens import RefreshTokenReused, get_refresh_token_store
+import src.services.email  # noqa: F401, registers the send_email job
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: Session | AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
     It takes in a UserModel object, which is validated by pydantic.
     If the email already exists, it will return an HTTP 409 error code (conflict).
-    Otherwise, it will create a new user and send them an email to verify their account.
+    Otherwise, it will create a new user and enqueue a job that emails them a link to verify their account.
     :param body: UserModel: Validate the request body
-    :param background_tasks: BackgroundTasks: Add tasks to the background task queue
     :param request: Request: Get the base url of the server
     :param db: Session: Get the database session
     :return: A dict with the user and a message
@@ -30,18 +31,20 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    await get_job_queue().enqueue("send_email", email=new_user.email, username=new_user.username,
+                                  host=str(request.base_url))
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session | AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
     It takes the username and password from the request body,
     verifies that they are correct, and returns an access token.
+    The refresh token is stored in users.refresh_token, or in the Redis refresh token store when settings.refresh_token_store is 'redis'.
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
     :param db: Session: Get a database session
     :return: A dictionary with the keys access_token, refresh_token and token_type
@@ -51,40 +54,66 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password_async(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token = await auth_service.create_access_token(data=await auth_service.access_token_claims(user))
+    if settings.refresh_token_store == 'redis':
+        claims = await get_refresh_token_store().issue(user.email)
+        refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, **claims})
+    else:
+        refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
+        await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session | AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
     The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
-    If the user's current refresh_token does not match what was passed into this function then it will return an error.
+    If the user's current refresh_token does not match what was passed into this function then it will return an error
+    and revoke the access tokens issued to the user.
+    With settings.refresh_token_store set to 'redis' the token is rotated in the Redis refresh token store instead,
+    and replaying an already rotated token revokes its family the same way.
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
     :param db: Session: Get the database session
     :return: A dictionary with the access_token, refresh_token and token_type
     """
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
+    payload = await auth_service.decode_refresh_token_claims(token)
+    email = payload["sub"]
     user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    if settings.refresh_token_store == 'redis' and "fam" in payload:
+        try:
+            claims = await get_refresh_token_store().rotate(email, payload)
+        except RefreshTokenReused:
+            await auth_service.revoke_tokens(user)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        if claims is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    elif user.refresh_token != token:
         await repository_users.update_token(user, None, db)
+        await auth_service.revoke_tokens(user)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    elif settings.refresh_token_store == 'redis':
+        # A token issued while users.refresh_token was in use: move the session to the store and clear the column.
+        claims = await get_refresh_token_store().issue(email)
+        await repository_users.update_token(user, None, db)
+    else:
+        claims = {}
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token = await auth_service.create_access_token(data=await auth_service.access_token_claims(user))
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, **claims})
+    if settings.refresh_token_store != 'redis':
+        await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: Session | AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
     It takes the token from the URL and uses it to get the user's email address.
@@ -105,8 +134,8 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request,
+                        db: Session | AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that they can click on
     to confirm their email address. The function takes in a RequestEmail object, which contains the
@@ -114,7 +143,6 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     user with that email address, and if so returns an error message saying as much. If not, it sends them
     an email containing a link they can click on.
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the server
     :param db: Session: Get the database session
     :return: A message to the user
@@ -124,5 +152,5 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await get_job_queue().enqueue("send_email", email=user.email, username=user.username, host=str(request.base_url))
     return {"message": "Check your email for confirmation."}
\ No newline at end of file
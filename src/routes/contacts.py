@@ -1,65 +1,223 @@
-from typing import List
+from datetime import date
+from typing import Awaitable, Callable, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_limiter.depends import RateLimiter
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
-from src.database.models import User
-from src.schemas import ContactModel, ContactResponse
+from src.database.replicas import get_read_db
+from src.conf.config import settings
+from src.schemas import (
+    ContactBatchRequest,
+    ContactBatchResponse,
+    ContactImportReport,
+    ContactModel,
+    ContactResponse,
+)
 from src.repository import contacts as repository_contacts
-from src.services.auth import auth_service
+from src.services import contacts_io
+from src.services.auth import Principal, auth_service
+from src.services.cache import get_contacts_cache
+from src.services.pagination import decode_cursor, encode_cursor
+from src.services.profiling import profiled
+from src.services.rate_limit import RateLimiter
 
 router = APIRouter(prefix='/contacts', tags=['contacts'] )
+read_limit = RateLimiter('contacts:read')
+create_limit = RateLimiter('contacts:create')
+batch_limit = RateLimiter('contacts:batch')
+import_limit = RateLimiter('contacts:import')
 
 
-@router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                     current_user: User = Depends(auth_service.get_current_user)):
+@profiled('serialize')
+def _serialize(contacts) -> bytes:
+    """
+    The _serialize function renders a list of contacts as the JSON body of a List[ContactResponse] response.
+    With settings.contacts_fast_json the repository returns plain rows, which are dumped by orjson directly.
+    :param contacts: ORM contacts, or rows of RESPONSE_COLUMNS with settings.contacts_fast_json
+    :return: The JSON body
+    """
+    if settings.contacts_fast_json:
+        return contacts_io.dump_response_rows(contacts)
+    return JSONResponse(jsonable_encoder([ContactResponse.from_orm(contact) for contact in contacts])).body
+
+
+async def _cached_response(request: Request, user: Principal, key: str,
+                           load: Callable[[], Awaitable[tuple[dict, bytes]]]) -> Response:
+    """
+    The _cached_response function serves a JSON response from the user's contacts cache.
+    The strong ETag depends on the address-book version and key, so If-None-Match gets a 304 without touching
+    the database, and a repeated read is answered from Redis. Without Redis the response is always loaded.
+    :param request: Request: Read the If-None-Match header
+    :param user: Principal: The owner of the address book
+    :param key: str: Identifies the route and every query parameter the response depends on
+    :param load: Callable[[], Awaitable[tuple[dict, bytes]]]: Builds the headers and body on a miss
+    :return: The response
+    """
+    contacts_cache = get_contacts_cache()
+    version = await contacts_cache.version(user.id)
+    if version is None:
+        headers, body = await load()
+        return Response(body, media_type="application/json", headers=headers)
+    etag = contacts_cache.etag(user.id, version, key)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    # Weak comparison: CompressionMiddleware sends the ETag of a compressed body as W/"...".
+    if etag in (tag.strip().removeprefix("W/") for tag in request.headers.get("If-None-Match", "").split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    cached = await contacts_cache.get(user.id, version, key)
+    if cached is None:
+        headers, body = await load()
+        await contacts_cache.set(user.id, version, key, headers, body)
+    else:
+        headers, body = cached
+    return Response(body, media_type="application/json", headers={**headers, **cache_headers})
+
+
+@router.get("/", response_model=List[ContactResponse], dependencies=[Depends(read_limit)])
+async def read_contacts(request: Request, skip: int = 0, limit: int = 100,
+                        after: str | None = None, sort: str = Query('id', regex='^(id|name|surname|birthday)$'),
+                        db: Session | AsyncSession = Depends(get_read_db),
+                        current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The read_contacts function returns a list of contacts.
-    :param skip: int: Skip a number of records in the database
+    Pages are ordered by the sort key and then by id. When a full page is returned, the X-Next-Cursor
+    header holds an opaque cursor; pass it back as after to get the next page without the cost of skip.
+    Pages are cached per address-book version and carry an ETag for conditional requests.
+    :param request: Request: Read the If-None-Match header
+    :param skip: int: Skip a number of records in the database, ignored when after is given
     :param limit: int: Limit the number of contacts returned
+    :param after: str: The cursor returned with the previous page
+    :param sort: str: Sort by id, name, surname or birthday
     :param db: Session: Pass a database session to the function
-    :param current_user: User: Get the user who is making the request
+    :param current_user: Principal: Get the user who is making the request
     :return: A list of contacts, which is the same as the return type of get_contacts
     """
-    contacts = await repository_contacts.get_contacts(skip, limit, db, current_user)
-    return contacts
+    keyset = None
+    if after is not None:
+        keyset = repository_contacts.parse_keyset(decode_cursor(after), sort)
+        if keyset is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
-@router.post("/", response_model=ContactResponse, description='No more than 1 requests per minute',
-            dependencies=[Depends(RateLimiter(times=1, seconds=60))], status_code=status.HTTP_201_CREATED)
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+    async def load():
+        contacts = await repository_contacts.get_contacts(skip, limit, db, current_user, after=keyset, sort=sort,
+                                                          rows=settings.contacts_fast_json)
+        headers = {}
+        if contacts and len(contacts) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(repository_contacts.get_keyset(contacts[-1], sort))
+        return headers, _serialize(contacts)
+
+    key = f"list:{sort}:{after if keyset is not None else skip}:{limit}"
+    return await _cached_response(request, current_user, key, load)
+
+@router.post("/", response_model=ContactResponse, dependencies=[Depends(create_limit)],
+             status_code=status.HTTP_201_CREATED)
+async def create_contact(body: ContactModel, db: Session | AsyncSession = Depends(get_db),
+                         current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The create_contact function creates a new contact in the database.
     :param body: ContactModel: Define the body of the request
     :param db: Session: Pass the database session to the function
-    :param current_user: User: Get the current user from the database
+    :param current_user: Principal: Get the current user from the access token
     :return: A contact object
     """
     return await repository_contacts.create_contact(body, db, current_user)
 
+@router.post("/import", response_model=ContactImportReport, dependencies=[Depends(import_limit)])
+async def import_contacts(request: Request, format: str | None = Query(None, regex='^(csv|ndjson)$'),
+                          db: Session | AsyncSession = Depends(get_db),
+                          current_user: Principal = Depends(auth_service.get_current_principal)):
+    """
+    The import_contacts function creates contacts from a CSV or NDJSON request body.
+    The body is streamed and inserted in batches of settings.import_batch_size rows, so any file size can be imported.
+    CSV files need a header row with the ContactModel field names, NDJSON files hold one ContactModel object per line.
+    :param request: Request: Stream the request body
+    :param format: str: csv or ndjson, defaults to the format given by the Content-Type header
+    :param db: Session: Pass the database session to the function
+    :param current_user: Principal: Get the current user from the access token
+    :return: The number of imported and rejected rows, with the reason for every rejected row
+    """
+    content_type = request.headers.get('content-type', '')
+    if format is None:
+        if 'csv' in content_type:
+            format = 'csv'
+        elif 'ndjson' in content_type or 'jsonl' in content_type:
+            format = 'ndjson'
+        else:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                detail="Send text/csv or application/x-ndjson, or set the format parameter")
+    contacts = contacts_io.read_contacts(request.stream(), format)
+    return await repository_contacts.import_contacts(contacts, db, current_user,
+                                                     batch_size=settings.import_batch_size,
+                                                     max_errors=settings.import_max_errors)
+
+@router.post("/batch", response_model=ContactBatchResponse, dependencies=[Depends(batch_limit)])
+async def batch_contacts(body: ContactBatchRequest, db: Session | AsyncSession = Depends(get_db),
+                         current_user: Principal = Depends(auth_service.get_current_principal)):
+    """
+    The batch_contacts function creates, updates and deletes many contacts in one request and one transaction.
+    :param body: ContactBatchRequest: The list of operations
+    :param db: Session: Pass the database session to the function
+    :param current_user: Principal: Get the current user from the access token
+    :return: The result of every operation, in request order
+    """
+    results = await repository_contacts.batch_contacts(body.operations, db, current_user)
+    if results is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Contact with this email already exists, no operation was applied")
+    return {"results": results}
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(format: str = Query('ndjson', regex='^(csv|ndjson)$'), gzip: bool = False,
+                          db: Session | AsyncSession = Depends(get_read_db),
+                          current_user: Principal = Depends(auth_service.get_current_principal)):
+    """
+    The export_contacts function streams the whole address book of the current user as NDJSON or CSV.
+    Rows are read from a server-side cursor settings.export_batch_size at a time and sent as soon as they are
+    serialized, so memory use stays flat whatever the number of contacts.
+    :param format: str: ndjson or csv
+    :param gzip: bool: Compress the response with gzip
+    :param db: Session: Pass the database session to the function
+    :param current_user: Principal: Get the current user from the access token
+    :return: A streaming response with the contacts
+    """
+    partitions = repository_contacts.export_contacts(db, current_user, settings.export_batch_size)
+    if format == 'csv':
+        body, media_type = contacts_io.write_csv(partitions), 'text/csv'
+    else:
+        body, media_type = contacts_io.write_ndjson(partitions), 'application/x-ndjson'
+    headers = {'Content-Disposition': f'attachment; filename="contacts.{format}"'}
+    if gzip:
+        body = contacts_io.gzip_stream(body)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def read_contact(contact_id: int, db: Session = Depends(get_db),
-                       current_user: User = Depends(auth_service.get_current_user)):
+async def read_contact(contact_id: int, request: Request, db: Session | AsyncSession = Depends(get_read_db),
+                       current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The read_contact function is used to read a single contact from the database.
     It takes in an integer representing the ID of the contact, and returns a Contact object.
+    The response is cached per address-book version and carries an ETag for conditional requests.
     :param contact_id: int: Specify the contact id
+    :param request: Request: Read the If-None-Match header
     :param db: Session: Pass a database session to the function
-    :param current_user: User: Pass the current user to the function
+    :param current_user: Principal: Pass the current user to the function
     :return: A contact object
     """
-    contact = await repository_contacts.get_contact(contact_id, db, current_user)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    async def load():
+        contact = await repository_contacts.get_contact(contact_id, db, current_user)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        return {}, JSONResponse(jsonable_encoder(ContactResponse.from_orm(contact))).body
+
+    return await _cached_response(request, current_user, f"contact:{contact_id}", load)
 
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(body: ContactModel, contact_id: int, db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+async def update_contact(body: ContactModel, contact_id: int, db: Session | AsyncSession = Depends(get_db),
+                         current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The update_contact function updates a contact in the database.
     The function takes three arguments:
@@ -68,7 +226,7 @@ async def update_contact(body: ContactModel, contact_id: int, db: Session = Depe
     :param contact_id: int: Identify the contact to be updated
     :param body: ContactModel: Define the body of the request
     :param db: Session: Pass the database session to the function
-    :param current_user: User: Get the user that is currently logged in
+    :param current_user: Principal: Get the user that is currently logged in
     :return: The updated contact
     """
     contact = await repository_contacts.update_contact(contact_id, body, db, current_user)
@@ -77,13 +235,13 @@ async def update_contact(body: ContactModel, contact_id: int, db: Session = Depe
     return contact
 
 @router.delete("/{contact_id}", response_model=ContactResponse)
-async def remove_contact(contact_id: int, db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+async def remove_contact(contact_id: int, db: Session | AsyncSession = Depends(get_db),
+                         current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The remove_contact function removes a contact from the database.
     :param contact_id: int: Specify the contact to be deleted
     :param db: Session: Access the database
-    :param current_user: User: Get the user that is currently logged in
+    :param current_user: Principal: Get the user that is currently logged in
     :return: The contact that was deleted
     """
     contact = await repository_contacts.remove_contact(contact_id, db, current_user)
@@ -92,37 +250,50 @@ async def remove_contact(contact_id: int, db: Session = Depends(get_db),
     return contact
 
 @router.get("/find/{info}", response_model=List[ContactResponse])
-async def find_contacts_by_info(info: str, db: Session = Depends(get_db), 
-                                current_user: User = Depends(auth_service.get_current_user)):
+async def find_contacts_by_info(info: str, skip: int = 0, limit: int = 100,
+                                db: Session | AsyncSession = Depends(get_read_db),
+                                current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The find_contacts_by_info function is used to find contacts by some info.
         Args:
-            info (str): The contacts's name, email or phone number.
+            info (str): The contacts's name, surname, email or phone number.
     
     :param info: str: Pass the search string to the function
+    :param skip: int: Skip a number of matches
+    :param limit: int: Limit the number of matches returned
     :param db: Session: Get the database session
-    :param current_user: User: Get the current user
-    :return: A list of contacts
+    :param current_user: Principal: Get the current user
+    :return: A list of contacts, best matches first
     """
-    contacts = await repository_contacts.get_contacts_by_info(info, db, current_user)
+    contacts = await repository_contacts.get_contacts_by_info(info, db, current_user, skip, limit,
+                                                              rows=settings.contacts_fast_json)
     if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contacts not found")
-    return contacts
+    return Response(_serialize(contacts), media_type="application/json")
 
 @router.get("/birthday/{days}", response_model=List[ContactResponse])
-async def find_birthday_per_week(days: int, db: Session = Depends(get_db), 
-                                 current_user: User = Depends(auth_service.get_current_user)):
+async def find_birthday_per_week(days: int, request: Request, db: Session | AsyncSession = Depends(get_read_db),
+                                 current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     The find_birthday_per_week function returns a list of users that have their birthday in the next 7 days.
         The function takes an integer as input, which is the number of days to look ahead for birthdays.
         It then queries the database and returns a list of users with their birthday in that time frame.
     
+    The response is cached per address-book version and day, and carries an ETag for conditional requests.
+    
     :param days: int: Specify the amount of days that we want to search for birthdays
+    :param request: Request: Read the If-None-Match header
     :param db: Session: Inject the database session into the function
-    :param current_user: User: Get the current user
+    :param current_user: Principal: Get the current user
     :return: A list of users with a birthday in the next 7 days
     """
-    contacts = await repository_contacts.get_birthday_per_week(days, db, current_user)
-    if contacts is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contacts not found")
-    return contacts
+    today = date.today()
+
+    async def load():
+        contacts = await repository_contacts.get_birthday_per_week(days, db, current_user, today=today,
+                                                                   rows=settings.contacts_fast_json)
+        if contacts is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contacts not found")
+        return {}, _serialize(contacts)
+
+    return await _cached_response(request, current_user, f"birthday:{days}:{today.isoformat()}", load)
@@ -0,0 +1,93 @@
+import secrets
+
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from src.conf.config import settings
+from src.database.db import pool_stats
+from src.database.replicas import get_replica_set
+from src.services.auth import auth_service
+from src.services.email import get_mail_dispatcher
+from src.services.jobs import get_job_queue
+from src.services.metrics import registry
+from src.services.rate_limit import limiters
+from src.services.refresh_tokens import get_refresh_token_store
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+security = HTTPBearer(auto_error=False)
+
+
+async def verify_metrics_token(credentials: HTTPAuthorizationCredentials | None = Security(security)):
+    """
+    The verify_metrics_token function admits a request that sends settings.metrics_token as its bearer token.
+    :param credentials: HTTPAuthorizationCredentials | None: The bearer token of the request, if any
+    :return: None
+    """
+    token = settings.metrics_token
+    if credentials is None or not token or not secrets.compare_digest(credentials.credentials, token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"], dependencies=[Depends(verify_metrics_token)])
+
+
+def _if_created(factory, stats):
+    # A scrape reports the components created so far and never creates one,
+    # so it opens no process pool, SMTP connection or replica engine.
+    return lambda: stats() if factory.cache_info().currsize else {}
+
+
+registry.register_stats('password_hash',
+                        lambda: auth_service.hasher.stats() if 'hasher' in vars(auth_service) else {},
+                        counters=('calls', 'rejected', 'wait_seconds', 'run_seconds'))
+registry.register_stats('token_cache',
+                        lambda: auth_service.token_cache.stats() if 'token_cache' in vars(auth_service) else {},
+                        counters=('hits', 'misses'))
+registry.register_stats('refresh_tokens',
+                        _if_created(get_refresh_token_store, lambda: get_refresh_token_store().stats()),
+                        counters=('issued', 'rotated', 'reused'))
+registry.register_stats('mail', _if_created(get_mail_dispatcher, lambda: get_mail_dispatcher().stats()),
+                        counters=('sent', 'failed', 'retried', 'batches', 'connections_opened'))
+registry.register_stats('jobs', _if_created(get_job_queue, lambda: get_job_queue().stats()),
+                        counters=('enqueued', 'completed', 'retried', 'dead_lettered'))
+registry.register_stats('rate_limit', lambda: {name: limiter.stats() for name, limiter in limiters.items()},
+                        counters=('allowed', 'rejected', 'rejected_local', 'errors'), label='limiter')
+registry.register_stats('db_pool', pool_stats, counters=('checkouts', 'timeouts', 'overflow_events',
+                                                         'wait_seconds_total'), label='engine')
+registry.register_stats('db_replicas', _if_created(get_replica_set, lambda: get_replica_set().stats()),
+                        counters=('reads', 'fallbacks'))
+
+
+@router.get("", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    The read_metrics function returns the metrics of this process in the Prometheus text format:
+    request latency per route, SQL statements and Redis commands per request, and the counters of
+    the password hasher, mail dispatcher, job queue, rate limiters, token cache and connection pools.
+    Components not used yet by this process are left out.
+    :return: The exposition text
+    """
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/pool")
+async def read_pool_metrics():
+    """
+    The read_pool_metrics function returns the usage and counters of the database connection pools,
+    including checkout wait times, timeouts and overflow connections.
+    Read replicas are listed under 'replicas' with their health and the reads routed to them,
+    once a read has been routed to them.
+    :return: A dict of pool statistics keyed by engine
+    """
+    stats = pool_stats()
+    replica_set = get_replica_set() if get_replica_set.cache_info().currsize else None
+    if replica_set is not None and replica_set.replicas:
+        stats["replicas"] = {
+            **replica_set.stats(),
+            "pools": [replica.engine.pool.stats() for replica in replica_set.replicas
+                      if hasattr(replica.engine.pool, "stats")],
+        }
+    return stats
@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
+from fastapi import APIRouter, Depends, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.avatars import AvatarStorage, get_avatar_storage, read_upload
 from src.conf.config import settings
 from src.schemas import UserDb
 
@@ -20,25 +20,24 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: Session | AsyncSession = Depends(get_db),
+                             storage: AvatarStorage = Depends(get_avatar_storage)):
     """
     The update_avatar_user function updates the avatar of a user.
     The function takes in an UploadFile object, which is a file that has been uploaded to the server.
     It also takes in a User object and Session object as dependencies.
+    The file is read in chunks up to settings.avatar_max_size and uploaded without blocking the event loop;
+    the user's avatar url is updated once the upload has finished.
     :param file: UploadFile: Get the file from the request body
     :param current_user: User: Get the current user's email
     :param db: Session: Get the database session
+    :param storage: AvatarStorage: The storage the avatar is uploaded to
     :return: The updated user object
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'ContactsApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'ContactsApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+    data = await read_upload(file, settings.avatar_max_size)
+    try:
+        src_url = await storage.save(current_user.username, data, file.content_type)
+    finally:
+        data.close()
     user = await repository_users.update_avatar(current_user.email, src_url, db)
-    return user
\ No newline at end of file
+    return user
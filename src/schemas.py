@@ -1,5 +1,7 @@
 from datetime import date, datetime
-from pydantic import BaseModel, Field, EmailStr
+from typing import List, Literal
+
+from pydantic import BaseModel, Field, EmailStr, root_validator
 
 
 class ContactModel(BaseModel):
@@ -23,6 +25,46 @@ class ContactResponse(ContactModel):
         orm_mode = True
 
 
+class ContactImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class ContactImportReport(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: List[ContactImportError] = []
+
+
+class ContactOperation(BaseModel):
+    op: Literal['create', 'update', 'delete']
+    id: int | None = None
+    data: ContactModel | None = None
+
+    @root_validator(skip_on_failure=True)
+    def check_arguments(cls, values):
+        if values['op'] != 'create' and values['id'] is None:
+            raise ValueError(f"{values['op']} needs an id")
+        if values['op'] != 'delete' and values['data'] is None:
+            raise ValueError(f"{values['op']} needs data")
+        return values
+
+
+class ContactBatchRequest(BaseModel):
+    operations: List[ContactOperation] = Field(min_items=1, max_items=1000)
+
+
+class ContactOperationResult(BaseModel):
+    index: int
+    op: str
+    id: int | None = None
+    status: Literal['created', 'updated', 'deleted', 'not_found', 'duplicate']
+
+
+class ContactBatchResponse(BaseModel):
+    results: List[ContactOperationResult]
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: str
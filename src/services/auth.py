@@ -1,5 +1,6 @@
-import pickle
-import redis.asyncio as redis
+import logging
+from dataclasses import dataclass
+from functools import cached_property
 from typing import Optional
 
 from jose import JWTError, jwt
@@ -7,19 +8,67 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
+from src.database.models import User
 from src.repository import users as repository_users
+from src.services.cache import TokenCache, get_redis_client, get_user_cache
+from src.services.hashing import PasswordHasher
+from src.services.profiling import profiled
+from src.services.refresh_tokens import get_refresh_token_store
 from src.conf.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated user as described by the claims of an access token, without a database row behind it.
+    It has the attributes the contacts repository reads from a User.
+    """
+    id: int
+    email: str
+    username: str
+    confirmed: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> 'Principal':
+        return cls(id=user.id, email=user.email, username=user.username, confirmed=user.confirmed)
+
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    SECRET_KEY = settings.secret_key
-    ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+
+    # Everything configured by the settings is created on first use, so importing the routes reads no settings.
+    @cached_property
+    def pwd_context(self) -> CryptContext:
+        return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+    @cached_property
+    def hasher(self) -> PasswordHasher:
+        return PasswordHasher(rounds=settings.bcrypt_rounds,
+                              workers=settings.password_hash_workers,
+                              max_pending=settings.password_hash_max_pending)
+
+    @cached_property
+    def r(self):
+        return get_redis_client()
+
+    @cached_property
+    def token_cache(self) -> TokenCache:
+        return TokenCache(settings.token_cache_size)
+
+    @property
+    def SECRET_KEY(self) -> str:
+        return settings.secret_key
+
+    @property
+    def ALGORITHM(self) -> str:
+        return settings.algorithm
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -43,6 +92,26 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def verify_password_async(self, plain_password, hashed_password):
+        """
+        The verify_password_async function is the non-blocking variant of verify_password.
+        The bcrypt check runs on the hasher's worker pool instead of the event loop.
+        :param self: Represent the instance of the class
+        :param plain_password: Pass in the password that is being verified
+        :param hashed_password: Compare the hashed password stored in the database with
+        :return: True if the password is correct, and false otherwise
+        """
+        return await self.hasher.verify(plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str):
+        """
+        The get_password_hash_async function is the non-blocking variant of get_password_hash.
+        :param self: Represent the instance of the class
+        :param password: str: Pass in the password that is to be hashed
+        :return: A hash of the password that is stored in the database
+        """
+        return await self.hasher.hash(password)
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -81,7 +150,7 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
@@ -104,11 +173,52 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def decode_refresh_token_claims(self, refresh_token: str) -> dict:
+        """
+        The decode_refresh_token_claims function is the variant of decode_refresh_token returning all claims,
+        including the jti and fam claims of tokens issued by the Redis refresh token store.
+        :param self: Represent the instance of the class
+        :param refresh_token: str: Pass in the refresh token that we are trying to decode
+        :return: The claims of the token
+        """
+        try:
+            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+        if payload.get('scope') != 'refresh_token':
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+        return payload
+
+    def verify_access_token(self, token: str) -> dict | None:
+        """
+        The verify_access_token function returns the claims of a valid access token, or None.
+        Verified claims are kept in token_cache until the token expires, so the signature is checked once per worker.
+        :param self: Access the class attributes
+        :param token: str: The encoded access token
+        :return: The claims, or None if the token is invalid, expired or not an access token
+        """
+        payload = self.token_cache.get(token)
+        if payload is not None:
+            return payload
+        try:
+            # Decode JWT
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            return None
+        if payload.get('scope') != 'access_token' or payload.get("sub") is None:
+            return None
+        self.token_cache.set(token, payload)
+        return payload
+
+    @profiled('auth')
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session | AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
         protected endpoints. It takes a token as an argument and returns the user
         if it's valid, or raises an exception otherwise.
+        Verified tokens are kept in token_cache until they expire and users are read through user_cache,
+        so most requests skip both the signature check and the database lookup.
+        A token carrying a ver claim is rejected once the user's tokens were revoked with revoke_tokens.
         :param self: Access the class attributes
         :param token: str: Get the token from the request header
         :param db: Session: Get the database session
@@ -120,23 +230,123 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+        payload = self.verify_access_token(token)
+        if payload is None:
             raise credentials_exception
-        
-        user = await repository_users.get_user_by_email(email, db)
+        email = payload["sub"]
+
+        user_cache = get_user_cache()
+        user = await user_cache.get(email)
         if user is None:
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise credentials_exception
+            await user_cache.set(user)
+        if "ver" in payload and await self.tokens_revoked(user.id, payload["ver"]):
             raise credentials_exception
         return user
     
+    @staticmethod
+    def _token_version_key(user_id: int) -> str:
+        return f"token_version:{user_id}"
+
+    async def get_token_version(self, user_id: int) -> int:
+        """
+        The get_token_version function reads the current access-token version of a user from Redis.
+        :param self: Represent the instance of the class
+        :param user_id: int: The id of the user
+        :return: The version, 0 if tokens were never revoked
+        """
+        version = await self.r.get(self._token_version_key(user_id))
+        return int(version) if version is not None else 0
+
+    async def tokens_revoked(self, user_id: int, version: int) -> bool:
+        """
+        The tokens_revoked function tells whether tokens issued with version were revoked since.
+        While Redis is unavailable the token is accepted, as the signature and expiry were already checked.
+        :param self: Represent the instance of the class
+        :param user_id: int: The id of the user
+        :param version: int: The ver claim of the token
+        :return: True if the token must be rejected
+        """
+        try:
+            return version != await self.get_token_version(user_id)
+        except RedisError as err:
+            logger.warning("Token version lookup failed, accepting the token: %s", err)
+            return False
+
+    async def revoke_tokens(self, user: User | Principal) -> None:
+        """
+        The revoke_tokens function invalidates every access token issued to the user so far
+        by bumping the user's token version in Redis.
+        With settings.refresh_token_store set to 'redis' the refresh token families of every device are revoked too.
+        :param self: Represent the instance of the class
+        :param user: User | Principal: The user whose tokens are revoked
+        :return: None
+        :raises HTTPException: 503 if the refresh token store is unavailable, as the refresh tokens would stay valid
+        """
+        self.token_cache.revoke_subject(user.email)
+        try:
+            await self.r.incr(self._token_version_key(user.id))
+        except RedisError as err:
+            logger.warning("Token revocation for user %s failed: %s", user.id, err)
+        if settings.refresh_token_store == 'redis':
+            await get_refresh_token_store().revoke_all(user.email)
+
+    async def access_token_claims(self, user: User) -> dict:
+        """
+        The access_token_claims function returns the claims to pass to create_access_token for a user.
+        The token carries the user's token version, so revoke_tokens invalidates it in every worker.
+        With settings.auth_claims_principal enabled it also carries the user's id, username and
+        confirmed flag, so get_current_principal can authenticate it without the database.
+        :param self: Represent the instance of the class
+        :param user: User: The user logging in
+        :return: A dict of claims
+        """
+        claims = {"sub": user.email}
+        try:
+            version = await self.get_token_version(user.id)
+        except RedisError as err:
+            logger.warning("Token version lookup failed, issuing a plain token: %s", err)
+            return claims
+        claims["ver"] = version
+        if settings.auth_claims_principal:
+            claims.update({"uid": user.id, "username": user.username, "confirmed": user.confirmed})
+        return claims
+
+    @profiled('auth')
+    async def get_current_principal(self, token: str = Depends(oauth2_scheme),
+                                    db: Session | AsyncSession = Depends(get_db)) -> Principal:
+        """
+        The get_current_principal function is a dependency for endpoints that only need the user's id and flags.
+        It builds a Principal from the claims of the access token and checks the token version in Redis,
+        so a revoked token is rejected at once without loading the user.
+        Tokens without a uid claim, and any request while Redis is unavailable, fall back to get_current_user.
+        :param self: Access the class attributes
+        :param token: str: Get the token from the request header
+        :param db: Session: Get the database session, only used by the fallback
+        :return: A Principal
+        """
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        payload = self.verify_access_token(token)
+        if payload is None:
+            raise credentials_exception
+        if "uid" not in payload:
+            return Principal.from_user(await self.get_current_user(token, db))
+        try:
+            version = await self.get_token_version(payload["uid"])
+        except RedisError as err:
+            logger.warning("Token version lookup failed, loading the user: %s", err)
+            return Principal.from_user(await self.get_current_user(token, db))
+        if payload.get("ver") != version:
+            raise credentials_exception
+        return Principal(id=payload["uid"], email=payload["sub"], username=payload["username"],
+                         confirmed=payload["confirmed"])
+
     def create_email_token(self, data: dict):
         """
         The create_email_token function takes a dictionary of data and returns a token.
@@ -0,0 +1,116 @@
+import asyncio
+import mimetypes
+import re
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile, status
+
+from src.conf.config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def read_upload(file: UploadFile, max_size: int) -> BinaryIO:
+    """
+    The read_upload function copies an uploaded file chunk by chunk into a spooled temporary file,
+    so a large upload never sits in memory as a whole and an oversized one is rejected without reading it all.
+    :param file: UploadFile: The uploaded file
+    :param max_size: int: The maximum size in bytes
+    :return: The spooled file, positioned at its start
+    """
+    if not (file.content_type or '').startswith('image/'):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Avatar must be an image")
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            spooled.close()
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Avatar is larger than {max_size} bytes")
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+class AvatarStorage(ABC):
+    """
+    Stores avatar images and returns the url they are served from.
+    Implementations must not block the event loop.
+    """
+
+    @abstractmethod
+    async def save(self, name: str, data: BinaryIO, content_type: str) -> str:
+        """
+        The save function stores an avatar, replacing the previous one with the same name.
+        :param name: str: The name of the avatar, unique per user
+        :param data: BinaryIO: The image, positioned at its start
+        :param content_type: str: The media type of the image
+        :return: The url of the stored avatar
+        """
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Uploads avatars to Cloudinary and serves them as 250x250 crops.
+    The SDK is configured once, when the storage is created, and only imported then.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        import cloudinary
+
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+
+    async def save(self, name: str, data: BinaryIO, content_type: str) -> str:
+        import cloudinary.uploader
+
+        public_id = f'ContactsApp/{name}'
+        # The SDK uploads over blocking HTTP, so it runs on a worker thread.
+        r = await asyncio.to_thread(cloudinary.uploader.upload, data, public_id=public_id, overwrite=True)
+        return cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop='fill',
+                                                               version=r.get('version'))
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Writes avatars to a local directory, for tests and offline development.
+    The directory is served by the application under base_url.
+    """
+
+    def __init__(self, root: str | Path, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+
+    @staticmethod
+    def filename(name: str, content_type: str) -> str:
+        # Names come from usernames, so anything that could leave the directory is replaced.
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', name)
+        return safe + (mimetypes.guess_extension(content_type) or '')
+
+    def _write(self, path: Path, data: BinaryIO) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(data, target, CHUNK_SIZE)
+
+    async def save(self, name: str, data: BinaryIO, content_type: str) -> str:
+        filename = self.filename(name, content_type)
+        await asyncio.to_thread(self._write, self.root / filename, data)
+        return f"{self.base_url}/{filename}?v={time.time_ns()}"
+
+
+@lru_cache
+def get_avatar_storage() -> AvatarStorage:
+    """
+    The get_avatar_storage function is a dependency returning the storage selected by settings.avatar_storage,
+    created on first use and shared afterwards.
+    :return: The avatar storage
+    """
+    if settings.avatar_storage == 'local':
+        return LocalStorage(settings.avatar_local_dir, settings.avatar_local_url)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret)
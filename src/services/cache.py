@@ -0,0 +1,381 @@
+import hashlib
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.metrics import InstrumentedRedis
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    A small in-process least-recently-used cache with per-entry expiry.
+    It is not shared between workers, so it only fronts a shared store such as Redis.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None,
+                 on_evict: Callable[[object, object], None] | None = None):
+        """
+        :param maxsize: int: The maximum number of entries kept before the least recently used is evicted
+        :param ttl: float | None: The default lifetime of an entry in seconds, None to keep entries until evicted
+        :param on_evict: Callable | None: Called with the key and value of an entry dropped as expired or to make room
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """
+        The get function returns the value stored under key, or None if it is missing or expired.
+        :param key: The cache key
+        :return: The cached value or None
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self._evicted(key, value)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, expires_at: float | None = None) -> None:
+        """
+        The set function stores value under key, evicting the least recently used entry when full.
+        :param key: The cache key
+        :param value: The value to store
+        :param expires_at: float | None: time.monotonic() deadline of the entry, defaults to now + ttl
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.monotonic() + self.ttl
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, (old, _) = self._data.popitem(last=False)
+            self._evicted(evicted, old)
+
+    def pop(self, key):
+        """
+        The pop function removes key from the cache if it is present.
+        :param key: The cache key
+        :return: The removed value, or None if key was missing
+        """
+        item = self._data.pop(key, None)
+        return item[0] if item is not None else None
+
+    def _evicted(self, key, value) -> None:
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenCache:
+    """
+    Caches the verified claims of JWTs in process, so a token's signature is checked once per worker.
+    Entries are keyed by a sha256 digest of the token, never the token itself, and expire at the token's exp claim.
+    The keys are also indexed by the sub claim, so revoking a user's tokens does not scan the cache.
+    """
+
+    def __init__(self, maxsize: int):
+        """
+        :param maxsize: int: The maximum number of tokens kept before the least recently used is evicted
+        """
+        self._tokens = LRUCache(maxsize, on_evict=self._unindex)
+        self._subjects: dict[str, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        """
+        The get function returns the cached claims of a token, or None if it was not verified yet or has expired.
+        :param token: str: The encoded token
+        :return: The claims or None
+        """
+        claims = self._tokens.get(self.key(token))
+        if claims is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return claims
+
+    def set(self, token: str, claims: dict) -> None:
+        """
+        The set function caches the claims of a verified token until its exp claim.
+        Tokens without exp are not cached.
+        :param token: str: The encoded token
+        :param claims: dict: The verified claims
+        :return: None
+        """
+        exp = claims.get("exp")
+        if exp is None:
+            return
+        key = self.key(token)
+        self._tokens.set(key, claims, expires_at=time.monotonic() + exp - time.time())
+        self._subjects.setdefault(claims.get("sub"), set()).add(key)
+
+    def _unindex(self, key: str, claims: dict) -> None:
+        keys = self._subjects.get(claims.get("sub"))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._subjects[claims.get("sub")]
+
+    def revoke(self, token: str) -> None:
+        """
+        The revoke function drops a token, so its next use is verified again.
+        :param token: str: The encoded token
+        :return: None
+        """
+        key = self.key(token)
+        claims = self._tokens.pop(key)
+        if claims is not None:
+            self._unindex(key, claims)
+
+    def revoke_subject(self, sub: str) -> None:
+        """
+        The revoke_subject function drops every cached token issued to sub.
+        :param sub: str: The sub claim, the user's email
+        :return: None
+        """
+        for key in self._subjects.pop(sub, ()):
+            self._tokens.pop(key)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the size of the cache and its hit and miss counters.
+        :return: A dict of counters
+        """
+        return {"size": len(self._tokens), "hits": self.hits, "misses": self.misses}
+
+
+class UserCache:
+    """
+    A read-through cache of authenticated users keyed by email.
+    A short-lived per-worker LRU tier sits in front of Redis; a Redis outage degrades to a database lookup.
+    """
+    cached_columns = ('id', 'username', 'email', 'created_at', 'avatar', 'confirmed')
+
+    def __init__(self, r: redis.Redis, ttl: int, local_size: int, local_ttl: float):
+        """
+        :param r: redis.Redis: The Redis client
+        :param ttl: int: Lifetime of a cached user in Redis, in seconds
+        :param local_size: int: The number of users kept in the in-process tier
+        :param local_ttl: float: Lifetime of a user in the in-process tier, in seconds.
+            It bounds how long another worker may serve a user after an invalidation.
+        """
+        self.r = r
+        self.ttl = ttl
+        self.local = LRUCache(local_size, local_ttl)
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return f"user:{email}"
+
+    async def get(self, email: str) -> User | None:
+        """
+        The get function returns the cached user with the given email, or None on a miss.
+        :param email: str: The user's email
+        :return: A detached User object or None
+        """
+        user = self.local.get(email)
+        if user is not None:
+            return user
+        try:
+            data = await self.r.get(self._key(email))
+        except RedisError as err:
+            logger.warning("User cache read failed: %s", err)
+            return None
+        if data is None:
+            return None
+        user = pickle.loads(data)
+        self.local.set(email, user)
+        return user
+
+    async def set(self, user: User) -> None:
+        """
+        The set function caches a detached copy of the user.
+        The password hash and the refresh token are never written to the cache.
+        :param user: User: The user loaded from the database
+        :return: None
+        """
+        cached = User(**{column: getattr(user, column) for column in self.cached_columns})
+        self.local.set(user.email, cached)
+        try:
+            await self.r.set(self._key(user.email), pickle.dumps(cached), ex=self.ttl)
+        except RedisError as err:
+            logger.warning("User cache write failed: %s", err)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops the user with the given email from both cache tiers.
+        :param email: str: The user's email
+        :return: None
+        """
+        self.local.pop(email)
+        try:
+            await self.r.delete(self._key(email))
+        except RedisError as err:
+            logger.warning("User cache invalidation failed: %s", err)
+
+
+class ContactsCache:
+    """
+    Caches serialized contact responses per user, keyed by the user's address-book version.
+
+    Every write to a user's contacts bumps the version, so cached bodies and ETags of older versions
+    are never served again and simply expire. A missing version is initialized from the clock,
+    so a flushed Redis cannot make an old ETag match again.
+    """
+
+    def __init__(self, r: redis.Redis, ttl: int):
+        """
+        :param r: redis.Redis: The Redis client
+        :param ttl: int: Lifetime of a cached response in seconds
+        """
+        self.r = r
+        self.ttl = ttl
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f"contacts_version:{user_id}"
+
+    @staticmethod
+    def _key(user_id: int, version: int, key: str) -> str:
+        return f"contacts:{user_id}:{version}:{key}"
+
+    @staticmethod
+    def etag(user_id: int, version: int, key: str) -> str:
+        """
+        The etag function returns the strong ETag of a response.
+        :param user_id: int: The id of the user
+        :param version: int: The address-book version the response was built from
+        :param key: str: The route and query parameters of the response
+        :return: A quoted ETag
+        """
+        digest = hashlib.sha256(f"{user_id}:{version}:{key}".encode()).hexdigest()[:32]
+        return f'"{digest}"'
+
+    async def version(self, user_id: int) -> int | None:
+        """
+        The version function returns the current address-book version of a user.
+        :param user_id: int: The id of the user
+        :return: The version, or None if Redis is unavailable
+        """
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.set(self._version_key(user_id), time.time_ns() // 1000, nx=True)
+                pipe.get(self._version_key(user_id))
+                _, version = await pipe.execute()
+        except RedisError as err:
+            logger.warning("Contacts version read failed: %s", err)
+            return None
+        return int(version)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        The bump function moves a user's address book to a new version after a write.
+        :param user_id: int: The id of the user
+        :return: None
+        """
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.set(self._version_key(user_id), time.time_ns() // 1000, nx=True)
+                pipe.incr(self._version_key(user_id))
+                await pipe.execute()
+        except RedisError as err:
+            logger.warning("Contacts version bump failed: %s", err)
+
+    async def get(self, user_id: int, version: int, key: str) -> tuple[dict, bytes] | None:
+        """
+        The get function returns a cached response.
+        :param user_id: int: The id of the user
+        :param version: int: The current address-book version
+        :param key: str: The route and query parameters of the response
+        :return: A (headers, body) tuple, or None on a miss
+        """
+        try:
+            data = await self.r.get(self._key(user_id, version, key))
+        except RedisError as err:
+            logger.warning("Contacts cache read failed: %s", err)
+            return None
+        return pickle.loads(data) if data is not None else None
+
+    async def set(self, user_id: int, version: int, key: str, headers: dict, body: bytes) -> None:
+        """
+        The set function caches a response built from the given address-book version.
+        :param user_id: int: The id of the user
+        :param version: int: The address-book version read before the response was built
+        :param key: str: The route and query parameters of the response
+        :param headers: dict: Headers to send with the body
+        :param body: bytes: The serialized body
+        :return: None
+        """
+        try:
+            await self.r.set(self._key(user_id, version, key), pickle.dumps((headers, body)), ex=self.ttl)
+        except RedisError as err:
+            logger.warning("Contacts cache write failed: %s", err)
+
+
+@lru_cache
+def get_redis_client() -> redis.Redis:
+    """
+    The get_redis_client function returns the shared Redis client, created on first use.
+    The client connects lazily, so creating it opens no connection.
+    :return: The Redis client
+    """
+    client_class = InstrumentedRedis if settings.metrics_enabled else redis.Redis
+    return client_class(host=settings.redis_host, port=settings.redis_port, db=0)
+
+
+async def close_redis_client() -> None:
+    """
+    The close_redis_client function closes the connections of the shared Redis client, if it was created.
+    :return: None
+    """
+    if get_redis_client.cache_info().currsize:
+        await get_redis_client().connection_pool.disconnect()
+
+
+@lru_cache
+def get_user_cache() -> UserCache:
+    """
+    The get_user_cache function returns the shared user cache, created on first use.
+    :return: The UserCache
+    """
+    return UserCache(get_redis_client(),
+                     ttl=settings.user_cache_ttl,
+                     local_size=settings.user_cache_local_size,
+                     local_ttl=settings.user_cache_local_ttl)
+
+
+@lru_cache
+def get_contacts_cache() -> ContactsCache:
+    """
+    The get_contacts_cache function returns the shared contacts cache, created on first use.
+    :return: The ContactsCache
+    """
+    return ContactsCache(get_redis_client(), ttl=settings.contacts_cache_ttl)
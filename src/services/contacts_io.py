@@ -0,0 +1,161 @@
+import codecs
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, Sequence
+
+import orjson
+from pydantic import ValidationError
+
+from src.schemas import ContactModel, ContactResponse
+
+CONTACT_FIELDS = ('name', 'surname', 'email', 'phone_number', 'birthday', 'description')
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    The iter_lines function decodes a stream of utf-8 byte chunks and yields complete lines with their line endings.
+    Only the current partial line is buffered, so memory use does not depend on the size of the stream.
+    :param chunks: AsyncIterator[bytes]: The byte stream, e.g. Request.stream()
+    :return: An async iterator of lines
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line + '\n'
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """
+    The iter_csv_records function parses CSV lines into dicts keyed by the header row.
+    Quoted fields may span several lines.
+    :param lines: AsyncIterator[str]: The lines of the document
+    :return: An async iterator of (row number, record, error) tuples, the row number of the header being 0
+    """
+    header = None
+    row = 0
+    record = ''
+    async for line in lines:
+        record += line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ''
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield row, dict(zip(header, values)), None
+    if record.strip():
+        yield row + 1, None, "Unterminated quoted field"
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """
+    The iter_ndjson_records function parses newline-delimited JSON objects.
+    :param lines: AsyncIterator[str]: The lines of the document
+    :return: An async iterator of (row number, record, error) tuples, the first object being row 1
+    """
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            yield row, None, f"Invalid JSON: {err}"
+            continue
+        if not isinstance(record, dict):
+            yield row, None, "Expected a JSON object"
+            continue
+        yield row, record, None
+
+
+async def read_contacts(chunks: AsyncIterator[bytes],
+                        fmt: str) -> AsyncIterator[tuple[int, ContactModel | None, str | None]]:
+    """
+    The read_contacts function streams an uploaded CSV or NDJSON document and validates every row with ContactModel.
+    :param chunks: AsyncIterator[bytes]: The request body stream
+    :param fmt: str: 'csv' or 'ndjson'
+    :return: An async iterator of (row number, contact, error) tuples where exactly one of contact and error is set
+    """
+    parse = iter_csv_records if fmt == 'csv' else iter_ndjson_records
+    async for row, record, error in parse(iter_lines(chunks)):
+        if error is not None:
+            yield row, None, error
+            continue
+        try:
+            yield row, ContactModel(**{field: record.get(field) for field in CONTACT_FIELDS}), None
+        except ValidationError as err:
+            yield row, None, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors())
+
+
+EXPORT_FIELDS = ('id',) + CONTACT_FIELDS
+RESPONSE_FIELDS = tuple(ContactResponse.__fields__)
+
+
+def dump_response_rows(rows: Sequence[Sequence]) -> bytes:
+    """
+    The dump_response_rows function serializes plain rows to the JSON a List[ContactResponse] response would produce,
+    without building pydantic models. orjson writes dates in ISO format, as jsonable_encoder does.
+    :param rows: Sequence[Sequence]: Rows with the columns of RESPONSE_FIELDS, in that order
+    :return: The JSON array as utf-8 bytes
+    """
+    return orjson.dumps([dict(zip(RESPONSE_FIELDS, row)) for row in rows])
+
+
+async def write_ndjson(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    The write_ndjson function serializes partitions of contact rows as newline-delimited JSON, one chunk per partition.
+    :param partitions: AsyncIterator[list]: Lists of rows with the EXPORT_FIELDS columns
+    :return: An async iterator of utf-8 chunks
+    """
+    async for partition in partitions:
+        yield b''.join(orjson.dumps(dict(zip(EXPORT_FIELDS, row)), default=str, option=orjson.OPT_APPEND_NEWLINE)
+                       for row in partition)
+
+
+async def write_csv(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    The write_csv function serializes partitions of contact rows as CSV with a header row, one chunk per partition.
+    :param partitions: AsyncIterator[list]: Lists of rows with the EXPORT_FIELDS columns
+    :return: An async iterator of utf-8 chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for partition in partitions:
+        writer.writerows(partition)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """
+    The gzip_stream function compresses a byte stream into a single gzip member chunk by chunk.
+    :param chunks: AsyncIterator[bytes]: The uncompressed stream
+    :param level: int: The compression level
+    :return: An async iterator of gzip-compressed chunks
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,30 +1,327 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
+from src.services.jobs import register_job
 from src.conf.config import settings
 
+if TYPE_CHECKING:
+    import aiosmtplib
+    from fastapi_mail import ConnectionConfig, MessageSchema
+
+logger = logging.getLogger(__name__)
+
+
+# fastapi_mail pulls in httpx and a template engine, and aiosmtplib an SMTP client, so they are imported
+# when the first message is sent rather than when the application starts.
+@lru_cache
+def get_mail_config() -> 'ConnectionConfig':
+    """
+    The get_mail_config function returns the SMTP server and template settings, built on first use.
+    :return: The ConnectionConfig
+    """
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=EmailStr(settings.mail_from),
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME="flatline_code",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    )
+
+
+def __getattr__(name: str):
+    # conf used to be built at import; it is still importable by name.
+    if name == "conf":
+        return get_mail_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@dataclass
+class _QueuedMail:
+    message: 'MessageSchema'
+    template_name: str | None
+    attempts: int = 0
+    future: asyncio.Future | None = None
+    max_retries: int | None = None
+
+    def resolve(self, err: Exception | None = None) -> None:
+        if self.future is None or self.future.done():
+            return
+        if err is None:
+            self.future.set_result(None)
+        else:
+            self.future.set_exception(err)
+
+
+class MailDispatcher:
+    """
+    Sends queued messages over a small pool of long-lived SMTP connections.
+    Each worker owns one connection, takes up to batch_size messages at a time and reconnects only after an error.
+    Failed sends are retried with exponential backoff; a full queue makes submit wait, up to submit_timeout.
+    The config, and with it the template engine, can be given as a function called when the first message is built.
+    """
+
+    def __init__(self, config: 'ConnectionConfig | Callable[[], ConnectionConfig]', connections: int = 2, queue_size: int = 1000, batch_size: int = 20,
+                 max_retries: int = 3, retry_delay: float = 1.0, submit_timeout: float = 5.0):
+        """
+        :param config: ConnectionConfig | Callable[[], ConnectionConfig]: The SMTP server and template settings,
+            or a function returning them
+        :param connections: int: The number of workers, each with its own SMTP connection
+        :param queue_size: int: The number of messages that can wait for a worker
+        :param batch_size: int: The number of messages a worker sends before looking at the queue again
+        :param max_retries: int: The number of retries before a message is dropped
+        :param retry_delay: float: The delay before the first retry in seconds, doubled on every retry
+        :param submit_timeout: float: How long submit waits for room in a full queue
+        """
+        self._config = config
+        self.connections = connections
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.submit_timeout = submit_timeout
+        self.queue_size = queue_size
+        self.queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+        self._templates = None
+        self.started_at = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        self.connections_opened = 0
+
+    @property
+    def config(self) -> 'ConnectionConfig':
+        if callable(self._config):
+            self._config = self._config()
+        return self._config
+
+    @property
+    def templates(self):
+        if self._templates is None and self.config.TEMPLATE_FOLDER:
+            self._templates = self.config.template_engine()
+        return self._templates
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """
+        The start function starts the workers on the running event loop.
+        :return: None
+        """
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.started_at = time.monotonic()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.connections)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        The stop function waits up to timeout seconds for the queued messages and the pending retries,
+        then stops the workers.
+        Messages still unsent at that point are counted as failed, and send fails for them.
+        :param timeout: float: How long to wait for queued messages
+        :return: None
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Mail dispatcher stopped with %d queued and %d retrying messages",
+                           self.queue.qsize(), len(self._retries))
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        while not self.queue.empty():
+            self._abandon([self.queue.get_nowait()])
+        self._workers = []
+        self._retries = set()
+
+    async def _drain(self) -> None:
+        # task_done is called before a retry is scheduled, so the queue can join while messages wait to be requeued.
+        while True:
+            await self.queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*self._retries, return_exceptions=True)
+
+    def _abandon(self, items: list[_QueuedMail]) -> None:
+        for item in items:
+            self.failed += 1
+            logger.error("Dropping mail to %s, the dispatcher stopped", item.message.recipients)
+            item.resolve(RuntimeError("Mail dispatcher stopped before the message was sent"))
+
+    async def submit(self, message: 'MessageSchema', template_name: str | None = None) -> None:
+        """
+        The submit function queues a message without waiting for delivery, starting the workers on first use.
+        :param message: MessageSchema: The message to send
+        :param template_name: str | None: The template rendered with message.template_body
+        :return: None
+        """
+        await self._put(_QueuedMail(message, template_name))
+
+    async def send(self, message: 'MessageSchema', template_name: str | None = None,
+                   max_retries: int | None = None) -> None:
+        """
+        The send function queues a message and waits until it is delivered.
+        :param message: MessageSchema: The message to send
+        :param template_name: str | None: The template rendered with message.template_body
+        :param max_retries: int | None: The retries for this message, self.max_retries by default;
+            0 when the caller retries on its own
+        :return: None
+        :raises: The last SMTP error once the retries are exhausted
+        """
+        item = _QueuedMail(message, template_name, future=asyncio.get_running_loop().create_future(),
+                           max_retries=max_retries)
+        await self._put(item)
+        await item.future
+
+    async def _put(self, item: _QueuedMail) -> None:
+        if not self.running:
+            await self.start()
+        await asyncio.wait_for(self.queue.put(item), self.submit_timeout)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns counters describing the dispatcher, including the queue depth
+        and the number of messages sent per second since start.
+        :return: A dict of counters
+        """
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "connections_opened": self.connections_opened,
+            "sent_per_second": self.sent / elapsed if elapsed else 0.0,
+        }
+
+    async def _build(self, item: _QueuedMail):
+        from fastapi_mail.msg import MailMsg
+
+        message = item.message.copy()
+        if item.template_name and self.templates is not None and message.template_body is not None:
+            template = self.templates.get_template(item.template_name)
+            message.template_body = template.render(**message.template_body)
+        sender = self.config.MAIL_FROM
+        if self.config.MAIL_FROM_NAME is not None:
+            sender = f"{self.config.MAIL_FROM_NAME} <{self.config.MAIL_FROM}>"
+        return await MailMsg(message)._message(sender)
+
+    async def _connect(self) -> 'aiosmtplib.SMTP':
+        import aiosmtplib
+
+        smtp = aiosmtplib.SMTP(hostname=self.config.MAIL_SERVER,
+                               port=self.config.MAIL_PORT,
+                               timeout=self.config.TIMEOUT,
+                               use_tls=self.config.MAIL_SSL_TLS,
+                               start_tls=self.config.MAIL_STARTTLS,
+                               validate_certs=self.config.VALIDATE_CERTS)
+        await smtp.connect()
+        if self.config.USE_CREDENTIALS:
+            await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        self.connections_opened += 1
+        return smtp
+
+    async def _work(self) -> None:
+        import aiosmtplib
+
+        smtp = None
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                self.batches += 1
+                for index, item in enumerate(batch):
+                    try:
+                        mail = await self._build(item)
+                        if not self.config.SUPPRESS_SEND:
+                            if smtp is None or not smtp.is_connected:
+                                smtp = await self._connect()
+                            await smtp.send_message(mail)
+                        self.sent += 1
+                        item.resolve()
+                    except asyncio.CancelledError:
+                        self._abandon(batch[index:])
+                        raise
+                    except (aiosmtplib.SMTPException, OSError) as err:
+                        if smtp is not None:
+                            smtp.close()
+                            smtp = None
+                        self._retry(item, err)
+                    except Exception as err:
+                        self.failed += 1
+                        logger.exception("Dropping mail to %s: %s", item.message.recipients, err)
+                        item.resolve(err)
+                    finally:
+                        self.queue.task_done()
+        finally:
+            if smtp is not None and smtp.is_connected:
+                smtp.close()
+
+    def _retry(self, item: _QueuedMail, err: Exception) -> None:
+        item.attempts += 1
+        max_retries = self.max_retries if item.max_retries is None else item.max_retries
+        if item.attempts > max_retries:
+            self.failed += 1
+            logger.error("Dropping mail to %s after %d attempts: %s", item.message.recipients, item.attempts, err)
+            item.resolve(err)
+            return
+        self.retried += 1
+        task = asyncio.create_task(self._requeue(item, self.retry_delay * 2 ** (item.attempts - 1)))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue(self, item: _QueuedMail, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+            await self.queue.put(item)
+        except asyncio.CancelledError:
+            self._abandon([item])
+            raise
+
+
+@lru_cache
+def get_mail_dispatcher() -> MailDispatcher:
+    """
+    The get_mail_dispatcher function returns the shared mail dispatcher, created on first use.
+    Its workers start when the first message is queued.
+    :return: The MailDispatcher
+    """
+    return MailDispatcher(get_mail_config,
+                          connections=settings.mail_connections,
+                          queue_size=settings.mail_queue_size,
+                          batch_size=settings.mail_batch_size,
+                          max_retries=settings.mail_max_retries,
+                          retry_delay=settings.mail_retry_delay)
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="flatline_code",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
 
 async def send_email(email: EmailStr, username: str, host: str):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
+    It is registered as the send_email job: routes enqueue it on the job queue and the worker process runs it.
     The function takes in three parameters:
         -email: EmailStr, the user's email address.
         -username: str, the username of the user who is registering for an account.  This will be used in a greeting message within the body of the email sent to them.
@@ -32,8 +329,12 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the template
     :param host: str: Pass the hostname of the server to the email template
-    :return: A coroutine, which is an object that can be used to run the function asynchronously
+    :return: None, once the message is delivered by the mail dispatcher
     """
+    # The job queue owns the retries: the dispatcher makes one attempt, and a failed job is retried with backoff
+    # without holding a worker slot.
+    from fastapi_mail import MessageSchema, MessageType
+
     try:
         token_verification = auth_service.create_email_token({"sub": email})
         message = MessageSchema(
@@ -43,7 +344,10 @@ async def send_email(email: EmailStr, username: str, host: str):
             subtype=MessageType.html
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+        await get_mail_dispatcher().send(message, template_name="email_template.html", max_retries=0)
+    except asyncio.TimeoutError:
+        logger.error("Mail queue is full, confirmation email to %s was not sent", email)
+        raise
+
+
+register_job("send_email", send_email)
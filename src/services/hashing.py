@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+
+@lru_cache
+def _context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+def _hash(password: str, rounds: int):
+    started_at = time.time()
+    return started_at, _context(rounds).hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str, rounds: int):
+    started_at = time.time()
+    return started_at, _context(rounds).verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification off the event loop on a bounded worker pool.
+    """
+
+    def __init__(self, rounds: int, workers: int, max_pending: int):
+        """
+        :param rounds: int: The bcrypt cost factor used for new hashes
+        :param workers: int: The number of worker processes, 0 to use the event loop's default thread pool
+        :param max_pending: int: The number of calls allowed to queue or run at once before rejecting with 503
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor | None:
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many concurrent logins, try again later")
+        self.pending += 1
+        submitted_at = time.time()
+        try:
+            started_at, result = await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+        finished_at = time.time()
+        self.calls += 1
+        self.wait_seconds += max(started_at - submitted_at, 0.0)
+        self.run_seconds += finished_at - started_at
+        return result
+
+    async def hash(self, password: str) -> str:
+        """
+        The hash function returns the bcrypt hash of a password, computed on the worker pool.
+        :param password: str: The plain-text password
+        :return: The password hash
+        """
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        The verify function checks a plain-text password against a hash on the worker pool.
+        :param plain_password: str: The password to check
+        :param hashed_password: str: The stored hash
+        :return: True if the password matches the hash
+        """
+        return await self._run(_verify, plain_password, hashed_password, self.rounds)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns counters describing the pool: calls, rejections, queue depth,
+        and the total seconds spent waiting for a worker and hashing.
+        :return: A dict of counters
+        """
+        return {
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "pending": self.pending,
+            "wait_seconds": self.wait_seconds,
+            "run_seconds": self.run_seconds,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
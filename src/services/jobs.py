@@ -0,0 +1,261 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError, ResponseError
+
+from src.conf.config import settings
+from src.services.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    A durable job queue on a Redis stream read by a consumer group.
+
+    A job stays pending in the group until a worker acknowledges it, so jobs of a crashed worker are claimed again
+    by another one after visibility_timeout. A failed job is acknowledged and scheduled again with exponential
+    backoff in a sorted set; after max_attempts it is moved to the dead-letter stream.
+    """
+
+    def __init__(self, r: redis.Redis, stream: str = 'jobs', group: str = 'workers', max_attempts: int = 5,
+                 retry_delay: float = 2.0, visibility_timeout: float = 300.0):
+        """
+        :param r: redis.Redis: The Redis client
+        :param stream: str: The name of the stream, also the prefix of the delayed set and the dead-letter stream
+        :param group: str: The consumer group of the workers
+        :param max_attempts: int: The number of attempts before a job is dead-lettered
+        :param retry_delay: float: The delay before the first retry in seconds, doubled on every retry
+        :param visibility_timeout: float: How long a job may stay unacknowledged before another worker claims it
+        """
+        self.r = r
+        self.stream = stream
+        self.group = group
+        self.delayed = f"{stream}:delayed"
+        self.dead = f"{stream}:dead"
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.visibility_timeout = visibility_timeout
+        self.handlers: dict[str, Callable[..., Awaitable]] = {}
+        self._fallback_tasks: set[asyncio.Task] = set()
+        self.enqueued = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def register(self, name: str, handler: Callable[..., Awaitable]) -> None:
+        """
+        The register function makes an async function available as a job.
+        :param name: str: The job name passed to enqueue
+        :param handler: Callable[..., Awaitable]: The coroutine function, called with the job's keyword arguments
+        :return: None
+        """
+        self.handlers[name] = handler
+
+    async def enqueue(self, job: str, /, **kwargs) -> str | None:
+        """
+        The enqueue function appends a job to the stream.
+        If Redis is unreachable the job runs in this process instead, so it is not lost but not durable either.
+        :param job: str: The name of a registered job
+        :param kwargs: JSON-serializable keyword arguments of the job
+        :return: The stream id of the job, or None if it runs in this process
+        """
+        if job not in self.handlers:
+            raise KeyError(f"Unknown job '{job}'")
+        try:
+            job_id = await self.r.xadd(self.stream, self._fields(job, kwargs, 0))
+        except RedisError as err:
+            logger.warning("Job queue unavailable, running %s in process: %s", job, err)
+            task = asyncio.create_task(self.handlers[job](**kwargs))
+            self._fallback_tasks.add(task)
+            task.add_done_callback(self._fallback_tasks.discard)
+            return None
+        self.enqueued += 1
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    @staticmethod
+    def _fields(name: str, kwargs: dict, attempts: int) -> dict:
+        return {"name": name, "kwargs": json.dumps(kwargs), "attempts": attempts}
+
+    async def ensure_group(self) -> None:
+        """
+        The ensure_group function creates the stream and the consumer group if they do not exist.
+        :return: None
+        """
+        try:
+            await self.r.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as err:
+            if 'BUSYGROUP' not in str(err):
+                raise
+
+    async def promote_delayed(self) -> int:
+        """
+        The promote_delayed function moves the retries that are due from the delayed set back to the stream.
+        :return: The number of promoted jobs
+        """
+        promoted = 0
+        for payload in await self.r.zrangebyscore(self.delayed, '-inf', time.time()):
+            # Only the worker that removes the entry re-adds it, so concurrent workers never duplicate a retry.
+            if await self.r.zrem(self.delayed, payload):
+                await self.r.xadd(self.stream, json.loads(payload))
+                promoted += 1
+        return promoted
+
+    async def claim_stale(self, consumer: str, count: int) -> list:
+        """
+        The claim_stale function takes over jobs that another consumer read but did not acknowledge in time.
+        :param consumer: str: The name of the claiming consumer
+        :param count: int: The maximum number of jobs to claim
+        :return: A list of (job id, fields) tuples
+        """
+        response = await self.r.xautoclaim(self.stream, self.group, consumer,
+                                           min_idle_time=int(self.visibility_timeout * 1000),
+                                           start_id='0-0', count=count)
+        return response[1]
+
+    async def read(self, consumer: str, count: int, block: int) -> list:
+        """
+        The read function reads new jobs for a consumer, waiting up to block milliseconds.
+        :param consumer: str: The name of the consumer
+        :param count: int: The maximum number of jobs to read
+        :param block: int: How long to wait for a job in milliseconds
+        :return: A list of (job id, fields) tuples
+        """
+        response = await self.r.xreadgroup(self.group, consumer, {self.stream: '>'}, count=count, block=block)
+        return response[0][1] if response else []
+
+    async def process(self, job_id, fields: dict) -> None:
+        """
+        The process function runs one job and acknowledges it, scheduling a retry or dead-lettering it on failure.
+        :param job_id: The stream id of the job
+        :param fields: dict: The fields of the stream entry
+        :return: None
+        """
+        fields = {key.decode() if isinstance(key, bytes) else key: value.decode() if isinstance(value, bytes) else value
+                  for key, value in fields.items()}
+        name, attempts = fields["name"], int(fields["attempts"]) + 1
+        try:
+            handler = self.handlers[name]
+            await handler(**json.loads(fields["kwargs"]))
+            self.completed += 1
+        except Exception as err:
+            fields["attempts"] = attempts
+            if attempts >= self.max_attempts:
+                logger.error("Job %s %s failed %d times, dead-lettering: %s", name, job_id, attempts, err)
+                fields["error"] = repr(err)
+                await self.r.xadd(self.dead, fields)
+                self.dead_lettered += 1
+            else:
+                logger.warning("Job %s %s failed, retrying: %s", name, job_id, err)
+                due = time.time() + self.retry_delay * 2 ** (attempts - 1)
+                await self.r.zadd(self.delayed, {json.dumps(fields): due})
+                self.retried += 1
+        await self.r.xack(self.stream, self.group, job_id)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the counters of this process.
+        :return: A dict of counters
+        """
+        return {
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+class Worker:
+    """
+    Runs jobs from a JobQueue with a bounded number of concurrent jobs.
+    """
+
+    def __init__(self, queue: JobQueue, concurrency: int = 8, consumer: str | None = None, block: int = 1000):
+        """
+        :param queue: JobQueue: The queue to consume
+        :param concurrency: int: The maximum number of jobs running at once
+        :param consumer: str | None: The consumer name, defaults to hostname-pid
+        :param block: int: How long a read waits for new jobs, in milliseconds
+        """
+        self.queue = queue
+        self.concurrency = concurrency
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.block = block
+        self._running: set[asyncio.Task] = set()
+
+    async def run_once(self) -> int:
+        """
+        The run_once function promotes due retries, then starts as many claimed or new jobs as there are free slots.
+        :return: The number of started jobs
+        """
+        await self.queue.promote_delayed()
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+            return 0
+        entries = await self.queue.claim_stale(self.consumer, free)
+        if not entries:
+            entries = await self.queue.read(self.consumer, free, self.block)
+        for job_id, fields in entries:
+            if fields is None:
+                continue
+            task = asyncio.create_task(self.queue.process(job_id, fields))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        return len(entries)
+
+    async def run(self, stop: asyncio.Event | None = None) -> None:
+        """
+        The run function processes jobs until stop is set, then waits for the running jobs.
+        :param stop: asyncio.Event | None: Set it to shut the worker down
+        :return: None
+        """
+        stop = stop or asyncio.Event()
+        await self.queue.ensure_group()
+        logger.info("Worker %s consuming %s with concurrency %d", self.consumer, self.queue.stream, self.concurrency)
+        while not stop.is_set():
+            try:
+                await self.run_once()
+            except RedisError as err:
+                logger.error("Job queue unavailable: %s", err)
+                await asyncio.sleep(1)
+        if self._running:
+            await asyncio.wait(self._running)
+
+
+# The job handlers by name. Modules register their jobs here when they are imported,
+# and the shared queue is created with them on first use.
+job_handlers: dict[str, Callable[..., Awaitable]] = {}
+
+
+def register_job(name: str, handler: Callable[..., Awaitable]) -> None:
+    """
+    The register_job function makes an async function available as a job of the shared queue.
+    :param name: str: The job name passed to enqueue
+    :param handler: Callable[..., Awaitable]: The coroutine function, called with the job's keyword arguments
+    :return: None
+    """
+    job_handlers[name] = handler
+
+
+@lru_cache
+def get_job_queue() -> JobQueue:
+    """
+    The get_job_queue function returns the shared job queue, created on first use with the registered jobs.
+    :return: The JobQueue
+    """
+    queue = JobQueue(get_redis_client(),
+                     stream=settings.jobs_stream,
+                     group=settings.jobs_group,
+                     max_attempts=settings.jobs_max_attempts,
+                     retry_delay=settings.jobs_retry_delay,
+                     visibility_timeout=settings.jobs_visibility_timeout)
+    queue.handlers = job_handlers
+    return queue
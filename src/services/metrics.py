@@ -0,0 +1,344 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Upper bounds of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the per-request query and command count histograms.
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class _Metric:
+    """
+    A metric whose values are kept in one shard per thread.
+    A thread only ever writes its own shard, so recording takes no lock; a scrape sums the shards.
+    """
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshots(self) -> Iterable[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # Copying a dict is atomic under the GIL, so a shard can be read while its thread writes to it.
+        return (dict(shard) for shard in shards)
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing value per label set.
+    """
+    type = 'counter'
+
+    def inc(self, labels: tuple = (), amount: float = 1.0) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> dict[tuple, float]:
+        totals = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+
+class Histogram(_Metric):
+    """
+    Counts observations in buckets per label set, with their sum.
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One count per bucket, one for +Inf, then the sum of the observations.
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> dict[tuple, list]:
+        totals = {}
+        for shard in self._snapshots():
+            for labels, counts in shard.items():
+                total = totals.setdefault(labels, [0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    total[i] += count
+        return totals
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    The metrics of the process and the collectors reading other components' stats, rendered in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self, namespace: str = 'app'):
+        self.namespace = namespace
+        self.metrics: list[_Metric] = []
+        self.collectors: list[Callable[[], list[str]]] = []
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(f"{self.namespace}_{name}", help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(f"{self.namespace}_{name}", help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_stats(self, subsystem: str, stats: Callable[[], dict], counters: Iterable[str] = (),
+                       label: str | None = None) -> None:
+        """
+        The register_stats function exports the numbers returned by a component's stats function on every scrape.
+        :param subsystem: str: The name of the component, a prefix of its metric names
+        :param stats: Callable[[], dict]: Returns the stats; with label, a dict of stats per label value
+        :param counters: Iterable[str]: The keys that only increase, exported as counters
+        :param label: str | None: The name of the label distinguishing instances of the component
+        :return: None
+        """
+        counters = set(counters)
+
+        def collect() -> list[str]:
+            per_instance = stats() if label else {None: stats()}
+            families = {}
+            for instance, values in per_instance.items():
+                for key, value in values.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        families.setdefault(key, []).append((instance, value))
+            lines = []
+            for key, samples in families.items():
+                name = f"{self.namespace}_{subsystem}_{key}"
+                kind = 'gauge'
+                if key in counters:
+                    kind = 'counter'
+                    name = name if name.endswith('_total') else f"{name}_total"
+                lines.append(f"# TYPE {name} {kind}")
+                for instance, value in samples:
+                    labels = _labels((label,), (instance,)) if label else ''
+                    lines.append(f"{name}{labels} {_number(value)}")
+            return lines
+
+        self.collectors.append(collect)
+
+    def render(self) -> str:
+        """
+        The render function returns all metrics in the Prometheus text exposition format.
+        :return: The exposition text
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for labels, value in sorted(metric.collect().items()):
+                if metric.type == 'counter':
+                    lines.append(f"{metric.name}{_labels(metric.labelnames, labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*metric.buckets, '+Inf'), value[:-1]):
+                    cumulative += count
+                    le = _labels((*metric.labelnames, 'le'), (*labels, bound))
+                    lines.append(f"{metric.name}_bucket{le} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(metric.labelnames, labels)} {_number(value[-1])}")
+                lines.append(f"{metric.name}_count{_labels(metric.labelnames, labels)} {cumulative}")
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram('http_request_duration_seconds', 'Latency of HTTP requests.',
+                                      ('method', 'route', 'status'))
+request_db_queries = registry.histogram('http_request_db_queries', 'SQL statements run per HTTP request.',
+                                        ('route',), COUNT_BUCKETS)
+request_db_seconds = registry.histogram('http_request_db_seconds', 'Time spent in SQL per HTTP request.',
+                                        ('route',))
+request_redis_commands = registry.histogram('http_request_redis_commands', 'Redis commands run per HTTP request.',
+                                            ('route',), COUNT_BUCKETS)
+request_redis_seconds = registry.histogram('http_request_redis_seconds', 'Time spent in Redis per HTTP request.',
+                                           ('route',))
+db_query_duration = registry.histogram('db_query_duration_seconds', 'Latency of SQL statements.', ('operation',))
+redis_command_duration = registry.histogram('redis_command_duration_seconds', 'Latency of Redis commands.',
+                                            ('command',))
+redis_command_errors = registry.counter('redis_command_errors_total', 'Redis commands that raised.', ('command',))
+
+
+class RequestStats:
+    """
+    The SQL and Redis work done on behalf of one HTTP request.
+    """
+    __slots__ = ('db_queries', 'db_seconds', 'redis_commands', 'redis_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_commands = 0
+        self.redis_seconds = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar('request_stats', default=None)
+
+
+def current_request_stats() -> RequestStats | None:
+    """
+    The current_request_stats function returns the stats of the request being handled, if any.
+    :return: The RequestStats of the request or None outside of a request
+    """
+    return _request_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+    db_query_duration.observe(elapsed, (operation,))
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    The instrument_engine function times every statement of an engine and adds it to the current request's stats.
+    Pass async_engine.sync_engine for an asyncio engine.
+    :param engine: Engine: The engine to instrument
+    :return: None
+    """
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _observe_redis(command: str, started: float, failed: bool) -> None:
+    elapsed = time.perf_counter() - started
+    redis_command_duration.observe(elapsed, (command,))
+    if failed:
+        redis_command_errors.inc((command,))
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.redis_commands += 1
+        stats.redis_seconds += elapsed
+
+
+class InstrumentedPipeline(Pipeline):
+    """
+    A pipeline recorded as a single PIPELINE command when it is executed.
+    """
+
+    async def execute(self, raise_on_error: bool = True):
+        started, failed = time.perf_counter(), True
+        try:
+            result = await super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            _observe_redis('PIPELINE', started, failed)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    A Redis client recording the latency and errors of every command, including script calls and pipelines.
+    """
+
+    async def execute_command(self, *args, **options):
+        started, failed = time.perf_counter(), True
+        try:
+            result = await super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            _observe_redis(str(args[0]).upper(), started, failed)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every HTTP request, and the SQL statements and Redis commands it ran, per route.
+    Routes are labelled with their path template, so ids in the path do not create new series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes = None
+
+    def route_name(self, scope: Scope) -> str:
+        if self._routes is None:
+            self._routes = {route.endpoint: route.path for route in getattr(scope.get("app"), "routes", ())
+                            if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), "other")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = self.route_name(scope)
+            request_duration.observe(elapsed, (scope["method"], route, str(status_code)))
+            request_db_queries.observe(stats.db_queries, (route,))
+            request_db_seconds.observe(stats.db_seconds, (route,))
+            request_redis_commands.observe(stats.redis_commands, (route,))
+            request_redis_seconds.observe(stats.redis_seconds, (route,))
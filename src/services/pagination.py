@@ -0,0 +1,31 @@
+import base64
+import json
+from datetime import date
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(values: list) -> str:
+    """
+    The encode_cursor function packs the keyset of the last returned row into an opaque url-safe string.
+    :param values: list: JSON-serializable values, dates are stored in ISO format
+    :return: The cursor string
+    """
+    payload = json.dumps([value.isoformat() if isinstance(value, date) else value for value in values],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    The decode_cursor function unpacks a cursor created by encode_cursor.
+    :param cursor: str: The cursor received from the client
+    :return: The list of keyset values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
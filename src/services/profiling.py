@@ -0,0 +1,226 @@
+import functools
+import inspect
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN ', 'mysql': 'EXPLAIN '}
+
+
+class QueryRecorder:
+    """
+    The statements run and the time spent in named spans while handling one request.
+    Statements are keyed by their SQL text, which holds placeholders rather than values,
+    so a statement run once per row of a previous result shows up as one key with a high count.
+    """
+
+    def __init__(self):
+        self.queries: dict[str, list] = {}
+        self.spans: dict[str, float] = {}
+        self.active: set[str] = set()
+        self.db_seconds = 0.0
+
+    def record(self, statement: str, seconds: float) -> None:
+        entry = self.queries.get(statement)
+        if entry is None:
+            self.queries[statement] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+        self.db_seconds += seconds
+
+    @property
+    def query_count(self) -> int:
+        return sum(count for count, _ in self.queries.values())
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        The repeated function returns the statements run at least threshold times, the usual sign of an N+1 pattern.
+        :param threshold: int: The number of identical statements that is reported
+        :return: A list of (statement, count) tuples, most frequent first
+        """
+        found = [(statement, count) for statement, (count, _) in self.queries.items() if count >= threshold]
+        return sorted(found, key=lambda item: item[1], reverse=True)
+
+    def server_timing(self, total: float) -> str:
+        """
+        The server_timing function renders the recorded times as a Server-Timing header value.
+        :param total: float: The seconds spent on the request so far
+        :return: The header value
+        """
+        metrics = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.query_count} queries"']
+        metrics += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+_recorder: ContextVar[QueryRecorder | None] = ContextVar('query_recorder', default=None)
+
+
+def current_recorder() -> QueryRecorder | None:
+    """
+    The current_recorder function returns the recorder of the request being profiled, if any.
+    :return: The QueryRecorder or None
+    """
+    return _recorder.get()
+
+
+def profiled(name: str):
+    """
+    The profiled decorator adds the time spent in a function to the span name of the profiled request.
+    Nested calls count once. Outside of a request profiled by ProfilingMiddleware, which is only installed
+    when settings.profiling_enabled is on, the wrapper only reads a context variable.
+    :param name: str: The span name, shown in the Server-Timing header
+    :return: The decorator
+    """
+    def decorator(func):
+        def enter():
+            recorder = _recorder.get()
+            if recorder is None or name in recorder.active:
+                return None, 0.0
+            recorder.active.add(name)
+            return recorder, time.perf_counter()
+
+        def leave(recorder: QueryRecorder | None, started: float):
+            if recorder is not None:
+                recorder.active.discard(name)
+                recorder.spans[name] = recorder.spans.get(name, 0.0) + time.perf_counter() - started
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                recorder, started = enter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    leave(recorder, started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                recorder, started = enter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    leave(recorder, started)
+        return wrapper
+
+    return decorator
+
+
+def explain(conn, statement: str, parameters) -> str | None:
+    """
+    The explain function returns the query plan of a select, or None if the dialect or statement has none.
+    :param conn: Connection: The connection the statement ran on
+    :param statement: str: The SQL text, with placeholders
+    :param parameters: The parameters the statement ran with
+    :return: The plan, one row per line
+    """
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None or statement.lstrip()[:6].upper() not in ('SELECT', 'WITH'):
+        return None
+    conn.info['profiling_explain'] = True
+    try:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    except Exception as err:  # the plan is best effort, the query itself already succeeded
+        logger.debug("EXPLAIN failed: %s", err)
+        return None
+    finally:
+        conn.info['profiling_explain'] = False
+    return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+
+
+class EngineProfiler:
+    """
+    Engine event listeners recording statements into the current request's QueryRecorder
+    and logging statements slower than slow_query_ms with their plan.
+    """
+
+    def __init__(self, slow_query_ms: float, explain_slow: bool = True):
+        """
+        :param slow_query_ms: float: Statements taking longer are logged
+        :param explain_slow: bool: Log the EXPLAIN plan of slow selects
+        """
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.explain_slow = explain_slow
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._profiling_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('profiling_explain'):
+            return
+        elapsed = time.perf_counter() - context._profiling_started
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.record(statement, elapsed)
+        if elapsed >= self.slow_query_seconds:
+            plan = explain(conn, statement, parameters) if self.explain_slow and not executemany else None
+            logger.warning("Slow query (%.1f ms): %s\nParameters: %r%s", elapsed * 1000, statement, parameters,
+                           f"\nPlan:\n{plan}" if plan else "")
+
+    def instrument(self, engine: Engine) -> None:
+        """
+        The instrument function attaches the profiler to an engine. Pass async_engine.sync_engine for an asyncio engine.
+        :param engine: Engine: The engine to profile
+        :return: None
+        """
+        if not event.contains(engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    """
+    Attaches a QueryRecorder to every request, adds a Server-Timing header with the db, auth and serialize times,
+    and logs statements repeated at least repeated_query_threshold times in one request.
+    It is only installed when settings.profiling_enabled is on.
+    """
+
+    def __init__(self, app: ASGIApp, repeated_query_threshold: int = 5):
+        """
+        :param app: ASGIApp: The wrapped application
+        :param repeated_query_threshold: int: The number of identical statements reported as a possible N+1
+        """
+        self.app = app
+        self.repeated_query_threshold = repeated_query_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", recorder.server_timing(time.perf_counter() - started))
+                headers["X-Query-Count"] = str(recorder.query_count)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _recorder.reset(token)
+            for statement, count in recorder.repeated(self.repeated_query_threshold):
+                logger.warning("Possible N+1 in %s %s: %d identical statements: %s",
+                               scope["method"], scope["path"], count, statement)
+
+
+@functools.lru_cache
+def get_engine_profiler() -> EngineProfiler:
+    """
+    The get_engine_profiler function returns the shared engine profiler, created on first use.
+    :return: The EngineProfiler
+    """
+    return EngineProfiler(settings.profiling_slow_query_ms, settings.profiling_explain)
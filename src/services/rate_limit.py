@@ -0,0 +1,223 @@
+import ipaddress
+import logging
+import math
+import time
+from functools import cached_property
+
+import redis.asyncio as redis
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.routing import APIRoute
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.cache import LRUCache, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1000, 'minute': 60_000, 'hour': 3_600_000, 'day': 86_400_000}
+
+# Sliding window counter: the previous window's count is weighted by how much of it still overlaps the window
+# ending now. Returns 0 and counts the request if it is allowed, otherwise the milliseconds to wait.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * (window - elapsed) / window + current + 1 > limit then
+    if current + 1 > limit or previous == 0 then
+        return math.max(1, window - elapsed)
+    end
+    return math.max(1, math.ceil(window - elapsed - (limit - 1 - current) * window / previous))
+end
+redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return 0
+"""
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """
+    The parse_rate function parses a limit such as '10/minute'.
+    :param rate: str: The number of requests and the period, one of second, minute, hour or day
+    :return: A (requests, window in milliseconds) tuple
+    """
+    times, _, period = rate.partition('/')
+    if period not in PERIODS:
+        raise ValueError(f"Invalid rate '{rate}'")
+    return int(times), PERIODS[period]
+
+
+# The limiters created in this process, by name, for the metrics endpoint.
+limiters: dict[str, 'RateLimiter'] = {}
+
+
+class RateLimiter:
+    """
+    A dependency limiting the requests of a client to a route, configured by name in settings.rate_limits.
+
+    Clients with a valid access token are limited per user with the 'user' tier, others per IP address
+    with the 'anonymous' tier. A per-worker token bucket rejects clients that are clearly over the limit
+    without a Redis call; the shared limit is a sliding window checked by one Lua script call.
+    When Redis is unavailable only the local bucket applies.
+    Limiters are created when the routes are imported; the defaults are read from the settings on first use.
+    """
+
+    def __init__(self, name: str, r: redis.Redis | None = None, limits: dict[str, str] | None = None,
+                 local_size: int | None = None):
+        """
+        :param name: str: The key of the route in settings.rate_limits
+        :param r: redis.Redis | None: The Redis client, defaults to the shared client
+        :param limits: dict[str, str] | None: Rates per tier, defaults to settings.rate_limits[name]
+        :param local_size: int | None: The number of clients tracked by the local token buckets,
+            defaults to settings.rate_limit_local_size
+        """
+        self.name = name
+        self._r = r
+        self._limits = limits
+        self._local_size = local_size
+        self.allowed = 0
+        self.rejected = 0
+        self.rejected_local = 0
+        self.errors = 0
+        limiters[name] = self
+
+    @cached_property
+    def r(self) -> redis.Redis:
+        return self._r if self._r is not None else get_redis_client()
+
+    @cached_property
+    def limits(self) -> dict[str, tuple[int, int]]:
+        return {tier: parse_rate(rate) for tier, rate in (self._limits or settings.rate_limits[self.name]).items()}
+
+    @cached_property
+    def _script(self):
+        return self.r.register_script(SLIDING_WINDOW_SCRIPT)
+
+    @cached_property
+    def _buckets(self) -> LRUCache:
+        return LRUCache(self._local_size or settings.rate_limit_local_size)
+
+    @property
+    def description(self) -> str:
+        times, window = self.limits['user']
+        period = next(name for name, ms in PERIODS.items() if ms == window)
+        return f"No more than {times} requests per {period}"
+
+    @staticmethod
+    def client_address(request: Request) -> str:
+        """
+        The client_address function returns the address anonymous requests are counted against.
+        X-Forwarded-For is only read when the peer is one of settings.rate_limit_trusted_proxies: the address
+        is then the rightmost one not added by a trusted proxy, as a client can send any leading values.
+        :param request: Request: The incoming request
+        :return: The client's IP address, or 'unknown' when the server does not report the peer
+        """
+        if request.client is None:
+            return 'unknown'
+        address = request.client.host
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded and settings.rate_limit_trusted_proxies:
+            proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.rate_limit_trusted_proxies]
+
+            def trusted(value: str) -> bool:
+                try:
+                    ip = ipaddress.ip_address(value)
+                except ValueError:
+                    return False
+                return any(ip in proxy for proxy in proxies)
+
+            if trusted(address):
+                for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+                    address = hop
+                    if not trusted(hop):
+                        break
+        return address
+
+    @classmethod
+    def identify(cls, request: Request) -> tuple[str, str]:
+        """
+        The identify function finds the tier and the identity a request is counted against.
+        :param request: Request: The incoming request
+        :return: A (tier, identity) tuple
+        """
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            claims = auth_service.verify_access_token(token)
+            if claims is not None:
+                return 'user', claims["sub"]
+        return 'anonymous', cls.client_address(request)
+
+    def _take_local(self, key: str, times: int, window: int) -> int:
+        now = time.monotonic() * 1000
+        tokens, updated_at = self._buckets.get(key) or (times, now)
+        tokens = min(times, tokens + (now - updated_at) * times / window)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            return math.ceil((1 - tokens) * window / times)
+        self._buckets.set(key, (tokens - 1, now))
+        return 0
+
+    async def hit(self, tier: str, identity: str) -> int:
+        """
+        The hit function counts a request of a client.
+        :param tier: str: The tier of the client
+        :param identity: str: The user's email or the client's IP address
+        :return: 0 if the request is allowed, otherwise the milliseconds until it would be
+        """
+        times, window = self.limits[tier]
+        key = f"rate:{self.name}:{identity}"
+        retry_after = self._take_local(key, times, window)
+        if retry_after:
+            self.rejected_local += 1
+            return retry_after
+        now = int(time.time() * 1000)
+        index, elapsed = divmod(now, window)
+        try:
+            retry_after = await self._script(keys=[f"{key}:{index}", f"{key}:{index - 1}"],
+                                             args=[times, window, elapsed])
+        except RedisError as err:
+            self.errors += 1
+            logger.warning("Rate limiter unavailable, allowing request: %s", err)
+            return 0
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    async def __call__(self, request: Request) -> None:
+        if not settings.rate_limit_enabled:
+            return
+        retry_after = await self.hit(*self.identify(request))
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(math.ceil(retry_after / 1000))})
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the counters of this process.
+        :return: A dict of counters
+        """
+        return {
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "rejected_local": self.rejected_local,
+            "errors": self.errors,
+        }
+
+
+def describe_limits(app: FastAPI) -> None:
+    """
+    The describe_limits function sets the OpenAPI description of every route depending on a RateLimiter
+    to the limit it enforces. The limits come from the settings, so they are described when the application
+    is built rather than when the routes are imported.
+    :param app: FastAPI: The application, with its routers included
+    :return: None
+    """
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            for dependency in route.dependant.dependencies:
+                if isinstance(dependency.call, RateLimiter):
+                    route.description = dependency.call.description
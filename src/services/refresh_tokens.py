@@ -0,0 +1,141 @@
+import logging
+import uuid
+from functools import lru_cache
+
+import redis.asyncio as redis
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Moves a family to a new token id only if the presented id is the current one.
+# A known family with another current id means a rotated token was replayed, so the family is deleted.
+ROTATE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return 0
+end
+if current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], ARGV[4])
+return -1
+"""
+
+
+class RefreshTokenReused(Exception):
+    """
+    Raised when a refresh token that was already rotated is presented again.
+    """
+
+
+class RefreshTokenStore:
+    """
+    Keeps refresh tokens in Redis instead of the users table.
+
+    Every login starts a family, one per device, holding the id (jti) of the only valid token of that family.
+    A refresh rotates the family to a new jti; presenting an older jti of the family again is treated as theft
+    and revokes the family. Families expire ttl seconds after their last rotation.
+    """
+
+    def __init__(self, r: redis.Redis, ttl: int):
+        """
+        :param r: redis.Redis: The Redis client
+        :param ttl: int: The lifetime of a refresh token in seconds
+        """
+        self.r = r
+        self.ttl = ttl
+        self._rotate = r.register_script(ROTATE_SCRIPT)
+        self.issued = 0
+        self.rotated = 0
+        self.reused = 0
+
+    @staticmethod
+    def _family_key(family: str) -> str:
+        return f"refresh_family:{family}"
+
+    @staticmethod
+    def _user_key(email: str) -> str:
+        return f"refresh_families:{email}"
+
+    @staticmethod
+    def _unavailable(err: RedisError) -> HTTPException:
+        logger.error("Refresh token store unavailable: %s", err)
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Token store unavailable")
+
+    async def issue(self, email: str) -> dict:
+        """
+        The issue function starts a new token family for a login.
+        :param email: str: The user's email
+        :return: The jti and fam claims of the refresh token
+        """
+        claims = {"jti": uuid.uuid4().hex, "fam": uuid.uuid4().hex}
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.set(self._family_key(claims["fam"]), claims["jti"], ex=self.ttl)
+                pipe.sadd(self._user_key(email), claims["fam"])
+                pipe.expire(self._user_key(email), self.ttl)
+                await pipe.execute()
+        except RedisError as err:
+            raise self._unavailable(err)
+        self.issued += 1
+        return claims
+
+    async def rotate(self, email: str, claims: dict) -> dict | None:
+        """
+        The rotate function replaces the presented token of a family by a new one.
+        :param email: str: The user's email
+        :param claims: dict: The verified claims of the presented refresh token
+        :return: The jti and fam claims of the new token, or None if the family expired or was revoked
+        :raises RefreshTokenReused: If the presented token was already rotated; the family is revoked
+        """
+        family, jti = claims["fam"], uuid.uuid4().hex
+        try:
+            result = await self._rotate(keys=[self._family_key(family), self._user_key(email)],
+                                        args=[claims["jti"], jti, self.ttl, family])
+            if result == 1:
+                await self.r.expire(self._user_key(email), self.ttl)
+        except RedisError as err:
+            raise self._unavailable(err)
+        if result == -1:
+            self.reused += 1
+            logger.warning("Refresh token reuse detected for %s, family %s revoked", email, family)
+            raise RefreshTokenReused(family)
+        if result == 0:
+            return None
+        self.rotated += 1
+        return {"jti": jti, "fam": family}
+
+    async def revoke_all(self, email: str) -> None:
+        """
+        The revoke_all function revokes the refresh tokens of every device of a user.
+        :param email: str: The user's email
+        :return: None
+        """
+        try:
+            families = await self.r.smembers(self._user_key(email))
+            keys = [self._family_key(family.decode() if isinstance(family, bytes) else family) for family in families]
+            await self.r.delete(self._user_key(email), *keys)
+        except RedisError as err:
+            raise self._unavailable(err)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the counters of this process.
+        :return: A dict of counters
+        """
+        return {"issued": self.issued, "rotated": self.rotated, "reused": self.reused}
+
+
+@lru_cache
+def get_refresh_token_store() -> RefreshTokenStore:
+    """
+    The get_refresh_token_store function returns the shared refresh token store, created on first use.
+    :return: The RefreshTokenStore
+    """
+    return RefreshTokenStore(get_redis_client(), ttl=settings.refresh_token_ttl)
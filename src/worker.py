@@ -0,0 +1,28 @@
+import asyncio
+import logging
+import signal
+
+import src.services.email  # noqa: F401, registers the send_email job
+from src.conf.config import settings
+from src.services.email import get_mail_dispatcher
+from src.services.jobs import Worker, get_job_queue
+
+
+async def main():
+    """
+    The main function runs a job worker until SIGINT or SIGTERM, then lets the running jobs and queued mail finish.
+    Start it next to the API with: python -m src.worker
+    :return: None
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    worker = Worker(get_job_queue(), concurrency=settings.worker_concurrency)
+    await worker.run(stop)
+    await get_mail_dispatcher().stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,11 +1,14 @@
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from main import app
-from src.database.models import Base
+from src.database.models import Base, User
 from src.database.db import get_db
+from src.services.auth import auth_service
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -47,4 +50,17 @@ def client(session):
 
 @pytest.fixture(scope="module")
 def user():
-    return {"username": "deadpool", "email": "deadpool@example.com", "password": "123456789"}
\ No newline at end of file
+    return {"username": "deadpool", "email": "deadpool@example.com", "password": "123456789"}
+
+@pytest.fixture(scope="module")
+def token_username():
+    # Override in a test module to give its token a user of its own.
+    return "wolverine"
+
+
+@pytest.fixture(scope="module")
+def token(session, token_username):
+    user = User(username=token_username, email=f"{token_username}@example.com", password="secret", confirmed=True)
+    session.add(user)
+    session.commit()
+    return asyncio.run(auth_service.create_access_token(data={"sub": user.email}))
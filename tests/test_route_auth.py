@@ -1,11 +1,12 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock
 
 from src.database.models import User
+from src.services.refresh_tokens import RefreshTokenReused
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    mock_enqueue = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.get_job_queue", lambda: AsyncMock(enqueue=mock_enqueue))
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -14,6 +15,8 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    mock_enqueue.assert_awaited_once()
+    assert mock_enqueue.await_args.args == ("send_email",)
 
 
 def test_repeat_create_user(client, user):
@@ -66,4 +69,25 @@ def test_login_wrong_email(client, user):
     )
     assert response.status_code == 401, response.text
     data = response.json()
-    assert data["detail"] == "Invalid email"
\ No newline at end of file
+    assert data["detail"] == "Invalid email"
+
+def test_refresh_token_redis_store(client, user, monkeypatch):
+    store = AsyncMock()
+    store.issue.return_value = {"jti": "1", "fam": "device"}
+    store.rotate.side_effect = [{"jti": "2", "fam": "device"}, RefreshTokenReused("device")]
+    monkeypatch.setattr("src.routes.auth.settings.refresh_token_store", "redis")
+    monkeypatch.setattr("src.routes.auth.get_refresh_token_store", lambda: store)
+    monkeypatch.setattr("src.services.auth.get_refresh_token_store", lambda: store)
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    first = response.json()["refresh_token"]
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 200, response.text
+    assert store.rotate.await_args.args[1]["jti"] == "1"
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {first}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+    store.revoke_all.assert_awaited_once_with(user.get('email'))
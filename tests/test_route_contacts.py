@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fakeredis import aioredis
+
+from src.database.models import Contact
+from src.services.cache import ContactsCache
+
+
+def test_import_csv(client, session, token):
+    body = (
+        "name,surname,email,phone_number,birthday,description\n"
+        "Logan,Howlett,logan@example.com,555000111,1882-01-01,\"Claws,\nhealing\"\n"
+        "Jean,Grey,jean@example.com,555000222,not-a-date,Telepath\n"
+        "Scott,Summers,scott@example.com,555000333,1963-09-01,Optic blast\n"
+    )
+    response = client.post("/api/contacts/import", content=body.encode(),
+                           headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["inserted"] == 2
+    assert data["failed"] == 1
+    assert data["errors"][0]["row"] == 2
+    assert "birthday" in data["errors"][0]["detail"]
+    contact = session.query(Contact).filter(Contact.email == "logan@example.com").first()
+    assert contact.description == "Claws,\nhealing"
+
+
+def test_import_ndjson(client, token):
+    body = (
+        '{"name": "Ororo", "surname": "Munroe", "email": "ororo@example.com", "phone_number": "555000444",'
+        ' "birthday": "1975-05-01", "description": "Weather"}\n'
+        '{"name": "Logan", "surname": "Howlett", "email": "logan@example.com", "phone_number": "555000111",'
+        ' "birthday": "1882-01-01", "description": "Duplicate"}\n'
+        'not json\n'
+    )
+    response = client.post("/api/contacts/import?format=ndjson", content=body.encode(),
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["inserted"] == 1
+    assert data["failed"] == 2
+    assert [error["row"] for error in data["errors"]] == [3, 2]
+
+
+def test_import_unknown_format(client, token):
+    response = client.post("/api/contacts/import", content=b"{}",
+                           headers={"Authorization": f"Bearer {token}", "Content-Type": "application/xml"})
+    assert response.status_code == 415, response.text
+
+
+def test_export_ndjson(client, token):
+    response = client.get("/api/contacts/export", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["email"] for row in rows] == ["logan@example.com", "scott@example.com", "ororo@example.com"]
+    assert rows[0]["birthday"] == "1882-01-01"
+
+
+def test_export_csv_gzip(client, token):
+    response = client.get("/api/contacts/export?format=csv&gzip=true", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-encoding"] == "gzip"
+    # httpx transparently decompresses the body
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 3
+    assert rows[0]["description"] == "Claws,\nhealing"
+
+
+def test_batch(client, session, token):
+    logan_id = session.query(Contact.id).filter(Contact.email == "logan@example.com").scalar()
+    scott_id = session.query(Contact.id).filter(Contact.email == "scott@example.com").scalar()
+    data = {"name": "Kurt", "surname": "Wagner", "email": "kurt@example.com", "phone_number": "555000555",
+            "birthday": "1960-02-29", "description": "Teleporter"}
+    operations = [
+        {"op": "create", "data": data},
+        {"op": "update", "id": logan_id, "data": dict(data, name="James", email="james@example.com")},
+        {"op": "delete", "id": scott_id},
+        {"op": "delete", "id": scott_id},
+        {"op": "delete", "id": 100000},
+    ]
+    response = client.post("/api/contacts/batch", json={"operations": operations},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "updated", "deleted", "duplicate", "not_found"]
+    assert session.get(Contact, results[0]["id"]).birthday_ordinal == 229
+    assert session.get(Contact, logan_id).name == "James"
+    assert session.get(Contact, scott_id) is None
+
+
+def test_batch_conflict(client, session, token):
+    data = {"name": "Kurt", "surname": "Wagner", "email": "kurt@example.com", "phone_number": "555000555",
+            "birthday": "1960-02-29", "description": "Teleporter"}
+    ororo_id = session.query(Contact.id).filter(Contact.email == "ororo@example.com").scalar()
+    operations = [{"op": "delete", "id": ororo_id}, {"op": "create", "data": data}]
+    response = client.post("/api/contacts/batch", json={"operations": operations},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+    assert session.get(Contact, ororo_id) is not None
+
+
+def test_batch_validation(client, token):
+    response = client.post("/api/contacts/batch", json={"operations": [{"op": "update", "id": 1}]},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+
+
+def test_conditional_get(client, session, token, monkeypatch):
+    cache = ContactsCache(aioredis.FakeRedis(), ttl=60)
+    monkeypatch.setattr("src.routes.contacts.get_contacts_cache", lambda: cache)
+    monkeypatch.setattr("src.repository.contacts.get_contacts_cache", lambda: cache)
+    headers = {"Authorization": f"Bearer {token}"}
+    # A single event loop for every request, the fake Redis connection is bound to it.
+    with client:
+        response = client.get("/api/contacts/", headers=headers)
+        assert response.status_code == 200, response.text
+        etag = response.headers["ETag"]
+        body = response.json()
+
+        response = client.get("/api/contacts/", headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 304, response.text
+
+        with patch("src.routes.contacts.repository_contacts.get_contacts", AsyncMock(side_effect=AssertionError)):
+            response = client.get("/api/contacts/", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == body
+
+        contact_id = session.query(Contact.id).filter(Contact.email == "ororo@example.com").scalar()
+        response = client.post("/api/contacts/batch", json={"operations": [{"op": "delete", "id": contact_id}]},
+                               headers=headers)
+        assert response.status_code == 200, response.text
+
+        response = client.get("/api/contacts/", headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 200, response.text
+        assert response.headers["ETag"] != etag
+        assert len(response.json()) == len(body) - 1
+
+
+@pytest.mark.parametrize("path", ["/api/contacts/?limit=2", "/api/contacts/?sort=surname", "/api/contacts/find/ex",
+                                  "/api/contacts/birthday/365"])
+def test_fast_json_matches_schema(client, token, monkeypatch, path):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    monkeypatch.setattr("src.routes.contacts.settings.contacts_fast_json", True)
+    fast = client.get(path, headers=headers)
+    assert fast.status_code == 200, fast.text
+    assert fast.json() == response.json()
+    assert fast.headers.get("X-Next-Cursor") == response.headers.get("X-Next-Cursor")
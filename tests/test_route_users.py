@@ -0,0 +1,47 @@
+import pytest
+
+from main import app
+from src.database.models import User
+from src.services.avatars import LocalStorage, get_avatar_storage
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 1024
+
+
+@pytest.fixture(scope="module")
+def token_username():
+    return "storm"
+
+
+@pytest.fixture()
+def storage(tmp_path):
+    storage = LocalStorage(tmp_path, "/avatars")
+    app.dependency_overrides[get_avatar_storage] = lambda: storage
+    yield storage
+    del app.dependency_overrides[get_avatar_storage]
+
+
+def test_update_avatar(client, session, token, storage):
+    response = client.patch("/api/users/avatar", files={"file": ("storm.png", PNG, "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["avatar"].startswith("/avatars/storm.png?v=")
+    assert (storage.root / "storm.png").read_bytes() == PNG
+    assert session.query(User).filter(User.email == "storm@example.com").first().avatar == response.json()["avatar"]
+
+
+def test_update_avatar_too_large(client, token, storage, monkeypatch):
+    monkeypatch.setattr("src.routes.users.settings.avatar_max_size", 100)
+    response = client.patch("/api/users/avatar", files={"file": ("storm.png", PNG, "image/png")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 413, response.text
+    assert not (storage.root / "storm.png").exists()
+
+
+def test_update_avatar_not_an_image(client, token, storage):
+    response = client.patch("/api/users/avatar", files={"file": ("storm.txt", b"hello", "text/plain")},
+                            headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 415, response.text
+
+
+def test_local_storage_filename():
+    assert LocalStorage.filename("../../etc/passwd", "image/png") == "______etc_passwd.png"
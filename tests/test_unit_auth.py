@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fakeredis import aioredis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.auth import Auth, Principal
+from src.services.cache import TokenCache
+from src.services.refresh_tokens import RefreshTokenStore
+
+
+class TestPrincipal(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.r = aioredis.FakeRedis()
+        self.auth.token_cache = TokenCache(100)
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com', confirmed=True)
+        self.db = AsyncMock()
+        patcher = patch.object(settings, 'auth_claims_principal', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def token(self):
+        return await self.auth.create_access_token(data=await self.auth.access_token_claims(self.user))
+
+    async def test_principal_from_claims(self):
+        token = await self.token()
+        with patch.object(self.auth, 'get_current_user', AsyncMock(side_effect=AssertionError)):
+            principal = await self.auth.get_current_principal(token, self.db)
+        self.assertEqual(principal, Principal(id=1, email='deadpool@example.com', username='deadpool',
+                                              confirmed=True))
+        self.db.execute.assert_not_called()
+
+    async def test_revoked_token(self):
+        token = await self.token()
+        await self.auth.get_current_principal(token, self.db)
+        await self.auth.revoke_tokens(self.user)
+        with self.assertRaises(HTTPException) as err:
+            await self.auth.get_current_principal(token, self.db)
+        self.assertEqual(err.exception.status_code, 401)
+        self.assertEqual((await self.auth.get_current_principal(await self.token(), self.db)).id, 1)
+
+    async def test_plain_token_loads_user(self):
+        token = await self.auth.create_access_token(data={"sub": self.user.email})
+        with patch.object(self.auth, 'get_current_user', AsyncMock(return_value=self.user)) as get_current_user:
+            principal = await self.auth.get_current_principal(token, self.db)
+        get_current_user.assert_awaited_once()
+        self.assertEqual(principal.id, 1)
+
+    async def test_redis_unavailable_loads_user(self):
+        token = await self.token()
+        self.auth.r = AsyncMock()
+        self.auth.r.get.side_effect = ConnectionError('refused')
+        with patch.object(self.auth, 'get_current_user', AsyncMock(return_value=self.user)) as get_current_user:
+            principal = await self.auth.get_current_principal(token, self.db)
+        get_current_user.assert_awaited_once()
+        self.assertEqual(principal.username, 'deadpool')
+
+
+class TestRevocation(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.r = aioredis.FakeRedis()
+        self.auth.token_cache = TokenCache(100)
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com', confirmed=True)
+        self.db = AsyncMock()
+        patcher = patch.object(settings, 'auth_claims_principal', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user_cache = AsyncMock(get=AsyncMock(return_value=self.user))
+        patcher = patch('src.services.auth.get_user_cache', return_value=user_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_revoked_token_without_claims_principal(self):
+        claims = await self.auth.access_token_claims(self.user)
+        self.assertEqual(claims, {'sub': 'deadpool@example.com', 'ver': 0})
+        token = await self.auth.create_access_token(data=claims)
+        self.assertIs(await self.auth.get_current_user(token, self.db), self.user)
+        await self.auth.revoke_tokens(self.user)
+        with self.assertRaises(HTTPException) as err:
+            await self.auth.get_current_user(token, self.db)
+        self.assertEqual(err.exception.status_code, 401)
+
+    async def test_revokes_refresh_token_families(self):
+        store = RefreshTokenStore(aioredis.FakeRedis(), ttl=60)
+        claims = await store.issue(self.user.email)
+        with patch.object(settings, 'refresh_token_store', 'redis'), \
+                patch('src.services.auth.get_refresh_token_store', return_value=store):
+            await self.auth.revoke_tokens(self.user)
+        self.assertIsNone(await store.rotate(self.user.email, claims))
+
+    async def test_redis_unavailable_accepts_token(self):
+        token = await self.auth.create_access_token(data={'sub': self.user.email, 'ver': 0})
+        self.auth.r = AsyncMock()
+        self.auth.r.get.side_effect = ConnectionError('refused')
+        self.assertIs(await self.auth.get_current_user(token, self.db), self.user)
+
+
+if __name__ == '__main__':
+    unittest.main()
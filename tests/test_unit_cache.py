@@ -0,0 +1,134 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from fakeredis import aioredis
+
+from src.database.models import User
+from src.services.cache import ContactsCache, LRUCache, TokenCache, UserCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_expired_entry(self):
+        cache = LRUCache(maxsize=2, ttl=10)
+        with patch('src.services.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('src.services.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_on_evict(self):
+        evicted = []
+        cache = LRUCache(maxsize=1, ttl=10, on_evict=lambda key, value: evicted.append((key, value)))
+        with patch('src.services.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+            cache.set('b', 2)
+        with patch('src.services.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('b'))
+        self.assertEqual(evicted, [('a', 1), ('b', 2)])
+        cache.set('c', 3)
+        self.assertEqual(cache.pop('c'), 3)
+        self.assertEqual(len(evicted), 2)
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = TokenCache(maxsize=10)
+        self.assertIsNone(cache.get('token'))
+        cache.set('token', {'sub': 'deadpool@example.com', 'exp': time.time() + 60})
+        self.assertEqual(cache.get('token')['sub'], 'deadpool@example.com')
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+    def test_expires_at_exp(self):
+        cache = TokenCache(maxsize=10)
+        cache.set('token', {'sub': 'deadpool@example.com', 'exp': time.time() - 1})
+        self.assertIsNone(cache.get('token'))
+        cache.set('no-exp', {'sub': 'deadpool@example.com'})
+        self.assertIsNone(cache.get('no-exp'))
+
+    def test_revoke(self):
+        cache = TokenCache(maxsize=10)
+        exp = time.time() + 60
+        cache.set('a', {'sub': 'deadpool@example.com', 'exp': exp})
+        cache.set('b', {'sub': 'deadpool@example.com', 'exp': exp})
+        cache.set('c', {'sub': 'wolverine@example.com', 'exp': exp})
+        cache.revoke('c')
+        self.assertIsNone(cache.get('c'))
+        cache.revoke_subject('deadpool@example.com')
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache._subjects, {})
+
+    def test_evicted_tokens_leave_the_index(self):
+        cache = TokenCache(maxsize=1)
+        exp = time.time() + 60
+        cache.set('a', {'sub': 'deadpool@example.com', 'exp': exp})
+        cache.set('b', {'sub': 'wolverine@example.com', 'exp': exp})
+        self.assertEqual(cache._subjects, {'wolverine@example.com': {TokenCache.key('b')}})
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = aioredis.FakeRedis()
+        self.cache = UserCache(self.r, ttl=60, local_size=10, local_ttl=5)
+        self.user = User(id=1, username='deadpool', email='deadpool@example.com', password='hash',
+                         refresh_token='token', confirmed=True)
+
+    async def test_read_through_redis(self):
+        await self.cache.set(self.user)
+        self.cache.local.clear()
+        result = await self.cache.get('deadpool@example.com')
+        self.assertEqual(result.id, 1)
+        self.assertTrue(result.confirmed)
+        self.assertIsNone(result.password)
+        self.assertIsNone(result.refresh_token)
+        self.assertIsNotNone(self.cache.local.get('deadpool@example.com'))
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        await self.cache.invalidate('deadpool@example.com')
+        self.assertIsNone(await self.cache.get('deadpool@example.com'))
+        self.assertIsNone(await self.r.get('user:deadpool@example.com'))
+
+    async def test_miss(self):
+        self.assertIsNone(await self.cache.get('nobody@example.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestContactsCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = aioredis.FakeRedis()
+        self.cache = ContactsCache(self.r, ttl=60)
+
+    async def test_version_survives_flush(self):
+        version = await self.cache.version(1)
+        self.assertEqual(await self.cache.version(1), version)
+        await self.cache.bump(1)
+        self.assertEqual(await self.cache.version(1), version + 1)
+        await self.r.flushall()
+        self.assertNotIn(await self.cache.version(1), (version, version + 1))
+
+    async def test_responses_are_per_version(self):
+        version = await self.cache.version(1)
+        await self.cache.set(1, version, 'list', {'X-Next-Cursor': 'abc'}, b'[]')
+        self.assertEqual(await self.cache.get(1, version, 'list'), ({'X-Next-Cursor': 'abc'}, b'[]'))
+        await self.cache.bump(1)
+        self.assertIsNone(await self.cache.get(1, await self.cache.version(1), 'list'))
+        self.assertNotEqual(self.cache.etag(1, version, 'list'), self.cache.etag(1, version + 1, 'list'))
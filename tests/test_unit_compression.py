@@ -0,0 +1,77 @@
+import gzip
+import unittest
+
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.services.compression import CompressionMiddleware, choose_encoding
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+BODY = b'{"name":"Logan"}' * 100
+
+
+@app.get("/large")
+def large():
+    return Response(BODY, media_type="application/json", headers={"ETag": '"abc"'})
+
+
+@app.get("/small")
+def small():
+    return Response(b'{}', media_type="application/json")
+
+
+@app.get("/stream")
+def stream():
+    return StreamingResponse(iter([BODY, BODY]), media_type="application/json")
+
+
+@app.get("/encoded")
+def encoded():
+    return Response(gzip.compress(BODY), headers={"Content-Encoding": "gzip"})
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def get(self, path, encoding="gzip"):
+        with self.client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+            return response, b''.join(response.iter_raw())
+
+    def test_compresses_large_responses(self):
+        response, raw = self.get("/large")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(response.headers["ETag"], 'W/"abc"')
+        self.assertEqual(int(response.headers["Content-Length"]), len(raw))
+        self.assertEqual(gzip.decompress(raw), BODY)
+
+    def test_skips_small_and_unaccepted(self):
+        response, raw = self.get("/small")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(raw, b'{}')
+        response, raw = self.get("/large", encoding="identity")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(raw, BODY)
+
+    def test_streaming(self):
+        response, raw = self.get("/stream")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(raw), BODY * 2)
+
+    def test_keeps_existing_encoding(self):
+        response, raw = self.get("/encoded")
+        self.assertEqual(gzip.decompress(raw), BODY)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate, br", brotli_available=True), "br")
+        self.assertEqual(choose_encoding("gzip, deflate, br", brotli_available=False), "gzip")
+        self.assertEqual(choose_encoding("br;q=0, gzip;q=0.5", brotli_available=True), "gzip")
+        self.assertIsNone(choose_encoding("gzip;q=0, deflate"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import email
+import socket
+import unittest
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig, MessageSchema, MessageType
+
+from src.services.email import MailDispatcher, conf
+
+
+class RecordingHandler:
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            self.failures -= 1
+            return '451 Try again later'
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestMailDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    def start_server(self, handler):
+        port = free_port()
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        return ConnectionConfig(MAIL_USERNAME='user', MAIL_PASSWORD='password', MAIL_FROM='app@example.com',
+                                MAIL_PORT=port, MAIL_SERVER='127.0.0.1', MAIL_STARTTLS=False, MAIL_SSL_TLS=False,
+                                USE_CREDENTIALS=False, VALIDATE_CERTS=False,
+                                TEMPLATE_FOLDER=conf.TEMPLATE_FOLDER)
+
+    @staticmethod
+    def message(i):
+        return MessageSchema(subject="Confirm your email", recipients=[f"user{i}@example.com"],
+                             template_body={"host": "http://test/", "username": f"user{i}", "token": "token"},
+                             subtype=MessageType.html)
+
+    async def test_reuses_connections(self):
+        handler = RecordingHandler()
+        dispatcher = MailDispatcher(self.start_server(handler), connections=2, batch_size=5)
+        for i in range(20):
+            await dispatcher.submit(self.message(i), template_name="email_template.html")
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 20)
+        body = email.message_from_bytes(handler.messages[0].content).get_payload()[0].get_payload(decode=True)
+        self.assertIn(b'Hi user0,', body)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['sent'], 20)
+        self.assertEqual(stats['queued'], 0)
+        self.assertLessEqual(stats['connections_opened'], 2)
+        self.assertLessEqual(len(handler.sessions), 2)
+
+    async def test_retries_temporary_failures(self):
+        handler = RecordingHandler(failures=2)
+        dispatcher = MailDispatcher(self.start_server(handler), connections=1, retry_delay=0.01)
+        await dispatcher.submit(self.message(1), template_name="email_template.html")
+        await dispatcher.submit(self.message(2), template_name="email_template.html")
+        for _ in range(100):
+            if dispatcher.stats()['sent'] == 2:
+                break
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 2)
+        self.assertEqual(dispatcher.stats()['retried'], 2)
+        self.assertEqual(dispatcher.stats()['failed'], 0)
+
+    async def test_send_waits_for_delivery(self):
+        handler = RecordingHandler()
+        dispatcher = MailDispatcher(self.start_server(handler), connections=1)
+        await dispatcher.send(self.message(1), template_name="email_template.html")
+        self.assertEqual(len(handler.messages), 1)
+        await dispatcher.stop()
+
+    async def test_send_raises_after_retries(self):
+        handler = RecordingHandler(failures=10)
+        dispatcher = MailDispatcher(self.start_server(handler), connections=1, max_retries=1, retry_delay=0.01)
+        with self.assertRaises(Exception):
+            await dispatcher.send(self.message(1), template_name="email_template.html")
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+        await dispatcher.stop()
+
+    async def test_send_without_retries(self):
+        handler = RecordingHandler(failures=1)
+        dispatcher = MailDispatcher(self.start_server(handler), connections=1, max_retries=3, retry_delay=0.01)
+        with self.assertRaises(Exception):
+            await dispatcher.send(self.message(1), template_name="email_template.html", max_retries=0)
+        self.assertEqual(dispatcher.stats()['retried'], 0)
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+        await dispatcher.stop()
+
+    async def test_stop_waits_for_retries(self):
+        handler = RecordingHandler(failures=1)
+        dispatcher = MailDispatcher(self.start_server(handler), connections=1, retry_delay=0.1)
+        await dispatcher.submit(self.message(1), template_name="email_template.html")
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual(dispatcher.stats()['retried'], 1)
+        self.assertEqual(dispatcher.stats()['sent'], 1)
+
+    async def test_stop_fails_pending_sends(self):
+        handler = RecordingHandler(failures=1)
+        dispatcher = MailDispatcher(self.start_server(handler), connections=1, retry_delay=10)
+        send = asyncio.create_task(dispatcher.send(self.message(1), template_name="email_template.html"))
+        while not dispatcher.stats()['retried']:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop(timeout=0.05)
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(send, 1)
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+    async def test_backpressure(self):
+        dispatcher = MailDispatcher(conf, connections=1, queue_size=1)
+        dispatcher.submit_timeout = 0.01
+        dispatcher.queue = asyncio.Queue(maxsize=1)
+        dispatcher._workers = [asyncio.create_task(asyncio.sleep(10))]
+        await dispatcher.submit(self.message(1))
+        with self.assertRaises(asyncio.TimeoutError):
+            await dispatcher.submit(self.message(2))
+        dispatcher._workers[0].cancel()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.hashing import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=4, workers=0, max_pending=2)
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash('123456789')
+        self.assertTrue(hashed.startswith('$2b$04$'))
+        self.assertTrue(await self.hasher.verify('123456789', hashed))
+        self.assertFalse(await self.hasher.verify('password', hashed))
+        stats = self.hasher.stats()
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['pending'], 0)
+        self.assertGreater(stats['run_seconds'], 0)
+
+    async def test_queue_depth_limit(self):
+        self.hasher.pending = 2
+        with self.assertRaises(HTTPException) as ctx:
+            await self.hasher.hash('123456789')
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(self.hasher.stats()['rejected'], 1)
+
+    async def test_process_pool(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=4)
+        try:
+            hashes = await asyncio.gather(hasher.hash('a'), hasher.hash('b'))
+            self.assertTrue(await hasher.verify('b', hashes[1]))
+        finally:
+            hasher.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fakeredis import aioredis
+from redis.exceptions import ConnectionError
+
+from src.services.jobs import JobQueue, Worker
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.r = aioredis.FakeRedis()
+        self.queue = JobQueue(self.r, stream='test-jobs', group='test-workers', max_attempts=2, retry_delay=10,
+                              visibility_timeout=30)
+        self.handler = AsyncMock()
+        self.queue.register('greet', self.handler)
+        await self.queue.ensure_group()
+        self.worker = Worker(self.queue, concurrency=4, consumer='worker-1', block=10)
+
+    async def drain(self):
+        await self.worker.run_once()
+        for task in list(self.worker._running):
+            await task
+
+    async def test_enqueue_and_run(self):
+        job_id = await self.queue.enqueue('greet', name='deadpool')
+        self.assertIsNotNone(job_id)
+        await self.drain()
+        self.handler.assert_awaited_once_with(name='deadpool')
+        pending = await self.r.xpending(self.queue.stream, self.queue.group)
+        self.assertEqual(pending['pending'], 0)
+        self.assertEqual(self.queue.stats()['completed'], 1)
+
+    async def test_unknown_job(self):
+        with self.assertRaises(KeyError):
+            await self.queue.enqueue('unknown')
+
+    async def test_retry_then_dead_letter(self):
+        self.handler.side_effect = RuntimeError('smtp down')
+        await self.queue.enqueue('greet', name='deadpool')
+        await self.drain()
+        self.assertEqual(await self.r.zcard(self.queue.delayed), 1)
+        self.assertEqual(await self.queue.promote_delayed(), 0)
+        with patch('src.services.jobs.time.time', return_value=10 ** 10):
+            await self.drain()
+            await self.drain()
+        self.assertEqual(self.handler.await_count, 2)
+        self.assertEqual(await self.r.zcard(self.queue.delayed), 0)
+        dead = await self.r.xrange(self.queue.dead)
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(dead[0][1][b'attempts'], b'2')
+        self.assertEqual(self.queue.stats()['dead_lettered'], 1)
+
+    async def test_claims_jobs_of_a_dead_worker(self):
+        await self.queue.enqueue('greet', name='deadpool')
+        await self.queue.read('worker-0', 1, 10)
+        self.queue.visibility_timeout = 0
+        await self.drain()
+        self.handler.assert_awaited_once_with(name='deadpool')
+
+    async def test_runs_in_process_without_redis(self):
+        self.queue.r = AsyncMock()
+        self.queue.r.xadd.side_effect = ConnectionError('refused')
+        self.assertIsNone(await self.queue.enqueue('greet', name='deadpool'))
+        for task in list(self.queue._fallback_tasks):
+            await task
+        self.handler.assert_awaited_once_with(name='deadpool')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from fakeredis import aioredis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from src.conf.config import settings
+from src.database.replicas import get_replica_set
+from src.routes import metrics as metrics_route
+from src.services.email import get_mail_dispatcher
+from src.services.jobs import get_job_queue
+from src.services.metrics import (InstrumentedRedis, MetricsMiddleware, Registry, RequestStats, _request_stats,
+                                  instrument_engine, redis_command_duration, registry,
+                                  request_duration)
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry('test')
+
+    def test_counter_sums_thread_shards(self):
+        counter = self.registry.counter('events_total', 'Events.', ('kind',))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(('a',))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(('b',), 2)
+        self.assertEqual(counter.collect(), {('a',): 4000, ('b',): 2})
+        self.assertIn('test_events_total{kind="a"} 4000', self.registry.render())
+
+    def test_histogram_is_cumulative(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, ('/a',))
+        lines = self.registry.render().splitlines()
+        self.assertIn('# TYPE test_latency_seconds histogram', lines)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('test_latency_seconds_sum{route="/a"} 5.55', lines)
+        self.assertIn('test_latency_seconds_count{route="/a"} 3', lines)
+
+    def test_register_stats(self):
+        self.registry.register_stats('pool', lambda: {'sync': {'checkouts': 3, 'size': 5, 'buckets': {}}},
+                                     counters=('checkouts',), label='engine')
+        lines = self.registry.render().splitlines()
+        self.assertIn('# TYPE test_pool_checkouts_total counter', lines)
+        self.assertIn('test_pool_checkouts_total{engine="sync"} 3', lines)
+        self.assertIn('test_pool_size{engine="sync"} 5', lines)
+        self.assertFalse(any(line.startswith('test_pool_buckets') for line in lines))
+
+
+class TestInstrumentation(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.stats = RequestStats()
+        self.token = _request_stats.set(self.stats)
+        self.addCleanup(_request_stats.reset, self.token)
+
+    async def test_engine_statements_count_towards_request(self):
+        engine = create_engine('sqlite://')
+        self.addCleanup(engine.dispose)
+        instrument_engine(engine)
+        instrument_engine(engine)
+        with engine.connect() as conn:
+            conn.execute(text('select 1'))
+            conn.execute(text('select 2'))
+        self.assertEqual(self.stats.db_queries, 2)
+        self.assertGreater(self.stats.db_seconds, 0)
+
+    async def test_redis_commands_count_towards_request(self):
+        class FakeInstrumentedRedis(InstrumentedRedis, aioredis.FakeRedis):
+            pass
+
+        r = FakeInstrumentedRedis()
+        await r.set('key', 1)
+        await r.get('key')
+        async with r.pipeline() as pipe:
+            await pipe.incr('key').get('key').execute()
+        self.assertEqual(self.stats.redis_commands, 3)
+        self.assertIn(('PIPELINE',), redis_command_duration.collect())
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+
+    def test_labels_routes_by_template(self):
+        app = FastAPI()
+
+        @app.get('/items/{item_id}')
+        async def read_item(item_id: int):
+            return {'id': item_id}
+
+        app.add_middleware(MetricsMiddleware)
+        client = TestClient(app)
+        unmatched = ('GET', 'other', '404')
+        before = sum(request_duration.collect().get(unmatched, [0])[:-1])
+        client.get('/items/1')
+        client.get('/items/2')
+        client.get('/missing')
+        counts = request_duration.collect()
+        self.assertEqual(sum(counts[('GET', '/items/{item_id}', '200')][:-1]), 2)
+        self.assertEqual(sum(counts[unmatched][:-1]) - before, 1)
+        self.assertIn('app_http_request_duration_seconds_bucket{method="GET",route="/items/{item_id}",status="200",'
+                      'le="+Inf"} 2', registry.render())
+
+
+class TestMetricsRoute(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(settings, 'metrics_token', 'scrape-token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app = FastAPI()
+        app.include_router(metrics_route.router)
+        self.client = TestClient(app)
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/metrics/pool', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_scrape_creates_no_components(self):
+        for factory in (get_mail_dispatcher, get_job_queue, get_replica_set):
+            factory.cache_clear()
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('app_mail_', response.text)
+        for factory in (get_mail_dispatcher, get_job_queue, get_replica_set):
+            self.assertEqual(factory.cache_info().currsize, 0)
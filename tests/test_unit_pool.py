@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, exc, text
+
+from src.conf.config import settings
+from src.database.db import engine_options
+from src.database.pool import InstrumentedQueuePool
+
+
+class TestInstrumentedQueuePool(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///file:pool?mode=memory&cache=shared&uri=true',
+                                    poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.1)
+        self.addCleanup(self.engine.dispose)
+
+    def test_checkouts_and_overflow(self):
+        with self.engine.connect() as first, self.engine.connect() as second:
+            first.execute(text('select 1'))
+            second.execute(text('select 1'))
+            stats = self.engine.pool.stats()
+            self.assertEqual(stats['checked_out'], 2)
+            self.assertEqual(stats['overflow'], 1)
+        stats = self.engine.pool.stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['overflow_events'], 1)
+        self.assertEqual(sum(stats['wait_buckets'].values()), 2)
+
+    def test_timeout(self):
+        with self.engine.connect(), self.engine.connect():
+            with self.assertRaises(exc.TimeoutError):
+                self.engine.connect()
+        self.assertEqual(self.engine.pool.stats()['timeouts'], 1)
+
+
+class TestEngineOptions(unittest.TestCase):
+
+    def test_memory_sqlite_keeps_default_pool(self):
+        self.assertEqual(engine_options('sqlite://'), {})
+
+    @patch.object(settings, 'db_statement_timeout', 5000)
+    def test_statement_timeout(self):
+        options = engine_options('postgresql://u:p@localhost/db')
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+        options = engine_options('postgresql+asyncpg://u:p@localhost/db', is_async=True)
+        self.assertEqual(options['connect_args'], {'server_settings': {'statement_timeout': '5000'}})
+        self.assertNotIn('connect_args', engine_options('sqlite:///./test.db'))
+
+
+if __name__ == '__main__':
+    unittest.main()
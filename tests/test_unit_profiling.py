@@ -0,0 +1,81 @@
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from src.services.profiling import EngineProfiler, ProfilingMiddleware, QueryRecorder, _recorder, profiled
+
+
+class TestQueryRecorder(unittest.TestCase):
+
+    def test_repeated_and_server_timing(self):
+        recorder = QueryRecorder()
+        for _ in range(6):
+            recorder.record('SELECT * FROM users WHERE id = ?', 0.001)
+        recorder.record('SELECT * FROM contacts', 0.002)
+        recorder.spans['auth'] = 0.0005
+        self.assertEqual(recorder.repeated(5), [('SELECT * FROM users WHERE id = ?', 6)])
+        self.assertEqual(recorder.query_count, 7)
+        self.assertEqual(recorder.server_timing(0.01), 'db;dur=8.0;desc="7 queries", auth;dur=0.5, total;dur=10.0')
+
+
+class TestProfiled(unittest.IsolatedAsyncioTestCase):
+
+    def test_unprofiled_request_is_not_recorded(self):
+        @profiled('serialize')
+        def serialize():
+            return 'body'
+
+        self.assertIsNone(_recorder.get())
+        self.assertEqual(serialize(), 'body')
+
+    async def test_nested_calls_count_once(self):
+        @profiled('auth')
+        async def outer():
+            await inner()
+            return 'user'
+
+        @profiled('auth')
+        async def inner():
+            pass
+
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        self.addCleanup(_recorder.reset, token)
+        self.assertEqual(await outer(), 'user')
+        self.assertEqual(list(recorder.spans), ['auth'])
+        self.assertFalse(recorder.active)
+
+
+class TestEngineProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.addCleanup(self.engine.dispose)
+
+    def test_slow_query_is_logged_with_plan(self):
+        EngineProfiler(slow_query_ms=0).instrument(self.engine)
+        with self.assertLogs('src.services.profiling', 'WARNING') as logs, self.engine.connect() as conn:
+            conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY)'))
+            conn.execute(text('SELECT * FROM items WHERE id = :id'), {'id': 1})
+        self.assertIn('Plan:', logs.output[-1])
+        self.assertNotIn('Plan:', logs.output[0])
+
+    def test_n_plus_one_is_reported(self):
+        EngineProfiler(slow_query_ms=1000).instrument(self.engine)
+        app = FastAPI()
+
+        @app.get('/items')
+        def read_items():
+            with self.engine.connect() as conn:
+                for i in range(6):
+                    conn.execute(text('SELECT :id'), {'id': i})
+            return []
+
+        client = TestClient(ProfilingMiddleware(app, repeated_query_threshold=5))
+        with self.assertLogs('src.services.profiling', 'WARNING') as logs:
+            response = client.get('/items')
+        self.assertEqual(response.headers['X-Query-Count'], '6')
+        self.assertTrue(response.headers['Server-Timing'].startswith('db;dur='))
+        self.assertIn('Possible N+1 in GET /items: 6 identical statements', logs.output[0])
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fakeredis import aioredis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.rate_limit import RateLimiter, parse_rate
+
+
+class TestParseRate(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_rate('10/minute'), (10, 60_000))
+        self.assertEqual(parse_rate('1/second'), (1, 1000))
+        with self.assertRaises(ValueError):
+            parse_rate('10/fortnight')
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = aioredis.FakeRedis()
+        self.limiter = RateLimiter('test', r=self.r, limits={'anonymous': '2/minute', 'user': '3/minute'})
+
+    @staticmethod
+    def request(headers=None):
+        request = MagicMock()
+        request.headers = headers or {}
+        request.client.host = '10.0.0.1'
+        return request
+
+    async def test_shared_window(self):
+        other_worker = RateLimiter('test', r=self.r, limits={'anonymous': '2/minute', 'user': '3/minute'})
+        self.assertEqual(await self.limiter.hit('anonymous', '10.0.0.1'), 0)
+        self.assertEqual(await other_worker.hit('anonymous', '10.0.0.1'), 0)
+        self.assertGreater(await self.limiter.hit('anonymous', '10.0.0.1'), 0)
+        self.assertEqual(await self.limiter.hit('anonymous', '10.0.0.2'), 0)
+        self.assertEqual(self.limiter.stats()['rejected'], 1)
+
+    async def test_previous_window_counts(self):
+        with patch('src.services.rate_limit.time.time', return_value=59.0):
+            await self.limiter.hit('anonymous', '10.0.0.1')
+            await self.limiter.hit('anonymous', '10.0.0.1')
+        self.limiter._buckets.clear()
+        with patch('src.services.rate_limit.time.time', return_value=61.0):
+            self.assertGreater(await self.limiter.hit('anonymous', '10.0.0.1'), 0)
+        self.limiter._buckets.clear()
+        with patch('src.services.rate_limit.time.time', return_value=100.0):
+            self.assertEqual(await self.limiter.hit('anonymous', '10.0.0.1'), 0)
+
+    async def test_local_bucket_skips_redis(self):
+        self.limiter._script = AsyncMock(return_value=0)
+        await self.limiter.hit('anonymous', '10.0.0.1')
+        await self.limiter.hit('anonymous', '10.0.0.1')
+        self.assertGreater(await self.limiter.hit('anonymous', '10.0.0.1'), 0)
+        self.assertEqual(self.limiter._script.await_count, 2)
+        self.assertEqual(self.limiter.stats()['rejected_local'], 1)
+
+    async def test_fails_open(self):
+        self.limiter._script = AsyncMock(side_effect=ConnectionError('refused'))
+        self.assertEqual(await self.limiter.hit('anonymous', '10.0.0.1'), 0)
+        self.assertEqual(self.limiter.stats()['errors'], 1)
+
+    def test_forwarded_for_needs_trusted_proxy(self):
+        headers = {"X-Forwarded-For": "1.2.3.4, 192.168.0.7"}
+        self.assertEqual(RateLimiter.identify(self.request(headers)), ('anonymous', '10.0.0.1'))
+        with patch.object(settings, 'rate_limit_trusted_proxies', ['10.0.0.0/8', '192.168.0.7']):
+            self.assertEqual(RateLimiter.identify(self.request(headers)), ('anonymous', '1.2.3.4'))
+            request = self.request(headers)
+            request.client.host = '172.16.0.1'
+            self.assertEqual(RateLimiter.identify(request), ('anonymous', '172.16.0.1'))
+
+    def test_no_client(self):
+        request = self.request()
+        request.client = None
+        self.assertEqual(RateLimiter.identify(request), ('anonymous', 'unknown'))
+
+    async def test_user_tier(self):
+        token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+        self.assertEqual(RateLimiter.identify(self.request({"Authorization": f"Bearer {token}"})),
+                         ('user', 'deadpool@example.com'))
+        self.assertEqual(RateLimiter.identify(self.request({"Authorization": "Bearer invalid"})),
+                         ('anonymous', '10.0.0.1'))
+        for _ in range(3):
+            await self.limiter(self.request({"Authorization": f"Bearer {token}"}))
+        with self.assertRaises(HTTPException) as err:
+            await self.limiter(self.request({"Authorization": f"Bearer {token}"}))
+        self.assertEqual(err.exception.status_code, 429)
+        self.assertIn('Retry-After', err.exception.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
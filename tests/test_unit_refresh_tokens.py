@@ -0,0 +1,43 @@
+import unittest
+
+from fakeredis import aioredis
+
+from src.services.refresh_tokens import RefreshTokenReused, RefreshTokenStore
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = aioredis.FakeRedis()
+        self.store = RefreshTokenStore(self.r, ttl=60)
+        self.email = 'deadpool@example.com'
+
+    async def test_rotate(self):
+        claims = await self.store.issue(self.email)
+        rotated = await self.store.rotate(self.email, claims)
+        self.assertEqual(rotated['fam'], claims['fam'])
+        self.assertNotEqual(rotated['jti'], claims['jti'])
+        self.assertIsNotNone(await self.store.rotate(self.email, rotated))
+        self.assertLessEqual(await self.r.ttl(f"refresh_family:{claims['fam']}"), 60)
+
+    async def test_reuse_revokes_family(self):
+        claims = await self.store.issue(self.email)
+        other_device = await self.store.issue(self.email)
+        rotated = await self.store.rotate(self.email, claims)
+        with self.assertRaises(RefreshTokenReused):
+            await self.store.rotate(self.email, claims)
+        self.assertIsNone(await self.store.rotate(self.email, rotated))
+        self.assertIsNotNone(await self.store.rotate(self.email, other_device))
+        self.assertEqual(self.store.stats()['reused'], 1)
+
+    async def test_revoke_all(self):
+        first = await self.store.issue(self.email)
+        second = await self.store.issue(self.email)
+        await self.store.revoke_all(self.email)
+        self.assertIsNone(await self.store.rotate(self.email, first))
+        self.assertIsNone(await self.store.rotate(self.email, second))
+        self.assertFalse(await self.r.exists(f"refresh_families:{self.email}"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from sqlalchemy.orm import Session
 
@@ -21,21 +21,25 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.session = MagicMock(spec=Session)
         self.user = User(id=1)
+        # Writes bump the shared contacts cache and pin reads to the primary, both in Redis.
+        patcher = patch('src.repository.contacts._written', AsyncMock())
+        self.written = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.session.execute().scalars().all.return_value = contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contact(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.execute().scalars().first.return_value = contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.execute().scalars().first.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
@@ -43,23 +47,26 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
          body = ContactModel(name="Test",
                                   surname="Surname",
                                   email="test@email.com",
-                                  phone="111222333",
-                                  birthday='1990-01-01')
+                                  phone_number="111222333",
+                                  birthday='1990-01-01',
+                                  description='Test description')
  
          result = await create_contact(body=body, user=self.user, db=self.session)
          self.assertEqual(result.name, body.name)
          self.assertEqual(result.surname, body.surname)
          self.assertEqual(result.email, body.email)
          self.assertTrue(hasattr(result, "id"))
+         self.written.assert_awaited_once_with(self.user)
 
     async def test_update_contact(self):
         contact = Contact()
         body = ContactModel(name="Test",
                                  surname="Surname",
                                  email="test@email.com",
-                                 phone="111222333",
-                                 birthday='1990-01-01')
-        self.session.query().filter().first.return_value = contact
+                                 phone_number="111222333",
+                                 birthday='1990-01-01',
+                                 description='Test description')
+        self.session.execute().scalars().first.return_value = contact
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
@@ -68,23 +75,24 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         body = ContactModel(name="Test",
                                  surname="Surname",
                                  email="test@email.com",
-                                 phone="111222333",
-                                 birthday='1990-01-01')
-        self.session.query().filter().first.return_value = None
+                                 phone_number="111222333",
+                                 birthday='1990-01-01',
+                                 description='Test description')
+        self.session.execute().scalars().first.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_remove_contact(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.execute().scalars().first.return_value = contact
         result = await remove_contact(contact_id=1,
                                       user=self.user,
                                       db=self.session)
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.execute().scalars().first.return_value = None
 
         result = await remove_contact(contact_id=1,
                                       user=self.user,
@@ -93,13 +101,13 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_contacts_by_info(self):
         contacts = [Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        self.session.execute().scalars().all.return_value = contacts
         result = await get_contacts_by_info(info="test@email.com", db=self.session, user=self.user)
         self.assertEqual(result, contacts)
 
     async def test_get_birthday_per_week(self):
         contacts = []
-        self.session.query().filter().all.return_value = contacts
+        self.session.execute().scalars().all.return_value = contacts
         result = await get_birthday_per_week(days=5, db=self.session, user=self.user)
         self.assertEqual(result, contacts)
 
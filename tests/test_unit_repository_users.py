@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from sqlalchemy.orm import Session
 
@@ -14,10 +14,15 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
         self.session = MagicMock(spec=Session)
+        # Writes drop the user from the shared user cache, in Redis.
+        self.user_cache = AsyncMock()
+        patcher = patch('src.repository.users.get_user_cache', return_value=self.user_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.execute().scalars().first.return_value = user
 
         result = await get_user_by_email(email='testuser@example.com',
                                          db=self.session)
@@ -25,7 +30,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.execute().scalars().first.return_value = None
 
         result = await get_user_by_email(email='testuser@example.com',
                                          db=self.session)
@@ -42,23 +47,26 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(hasattr(result, "id"))
 
     async def test_update_token(self):
-        result = await update_token(user=User(), token='123', db=self.session)
+        result = await update_token(user=User(email='testuser@example.com'), token='123', db=self.session)
         self.assertIsNone(result)
+        self.user_cache.invalidate.assert_awaited_once_with('testuser@example.com')
 
     async def test_confirmed_email(self):
         result = await confirmed_email(email='testuser@example.com',
                                             db=self.session)
 
         self.assertIsNone(result)
+        self.user_cache.invalidate.assert_awaited_once_with('testuser@example.com')
 
     async def test_update_avatar(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.execute().scalars().first.return_value = user
         result = await update_avatar(email='testuser@example.com',
                                      url='some_url',
                                      db=self.session)
 
         self.assertEqual(result, user)
+        self.user_cache.invalidate.assert_awaited_once_with('testuser@example.com')
 
 
 if __name__ == '__main__':